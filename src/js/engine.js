@@ -35,6 +35,8 @@ function Engine(htmlDOM){
   this.menuFilesKey = "menuFiles";
   // map containing menu objects of all the game's menus.
   this.menuKey = "menus";
+  // list of prebuilt menus in the compiled menu file.
+  this.compiledMenuKey = "compiledMenus";
   // contains the names of all the game's custom fonts.
   this.fontsKey = "fonts";
   // contains input command objects.
@@ -54,10 +56,20 @@ function Engine(htmlDOM){
   this.imgLocation = "img";
   this.menuLocation = this.dataLocation + "/" + "menus";
   this.animLocation = this.dataLocation + "/" + "animations";
+  // Optional file containing every menu as a prebuilt layout tree.
+  // Built by tools/compile_menus.py.
+  this.compiledMenuFile = "menus.min.json";
+  // Optional file containing every animation with its templates applied.
+  // Built by tools/compile_animations.py.
+  this.compiledAnimFile = "animations.min.json";
   this.fontLocation = "fonts";
   this.audioLocation = this.dataLocation +  "/" + "audio";
   this.songsLocation = this.audioLocation + "/" + "bgm";
   this.soundsLocation = this.audioLocation + "/" + "sfx";
+  // Optional file containing every data file. Built by tools/build_bundle.py.
+  this.bundleFile = "assets.bundle";
+  // Must match BUNDLE_FORMAT in tools/build_bundle.py.
+  this.bundleFormat = 1;
 
   this.frameData = {
     "timeStamp": null,
@@ -140,11 +152,15 @@ Engine.prototype.loadStandaloneAssets = function(){
     "audio.json"
   ]
 
-  let promises = [];
-  for(const filename of allAssets){
-    promises.push(this.assetLoader.getAsset(this.dataLocation + "/" + filename));
-  };
-  return Promise.all(promises);
+  // If the bundle is available every request below is answered from memory.
+  let bundleURL = this.dataLocation + "/" + this.bundleFile;
+  return this.assetLoader.loadBundle(bundleURL).then(() => {
+    let promises = [];
+    for(const filename of allAssets){
+      promises.push(this.assetLoader.getAsset(this.dataLocation + "/" + filename));
+    };
+    return Promise.all(promises);
+  });
 };
 
 Engine.prototype.loadAllFromList = function(filesList, fileLocation){
@@ -155,12 +171,19 @@ Engine.prototype.loadAllFromList = function(filesList, fileLocation){
 
 Engine.prototype.loadAllMenus = function(){
   let menuFiles = this.getLoadedAsset(this.menuFilesKey);
-  return this.loadAllFromList(menuFiles, this.menuLocation);
+  return this.loadCompiledOrList(this.compiledMenuFile, menuFiles, this.menuLocation);
+};
+
+// Load a compiled file and fall back to the files it was compiled from
+// if it can't be fetched.
+Engine.prototype.loadCompiledOrList = function(compiledFile, filesList, fileLocation){
+  return this.assetLoader.getAsset(fileLocation + "/" + compiledFile)
+  .catch(() => this.loadAllFromList(filesList, fileLocation));
 };
 
 Engine.prototype.loadAllAnimations = function(){
   let animFiles = this.getLoadedAsset(this.animFilesKey);
-  return this.loadAllFromList(animFiles, this.animLocation);
+  return this.loadCompiledOrList(this.compiledAnimFile, animFiles, this.animLocation);
 };
 
 
@@ -261,8 +284,23 @@ Engine.prototype.getXMLChildren = function(tag){
   return children;
 };
 
-// Creates a map of attributes belonging to a single xml tag.
+// Returns the tag name of an xml tag or of a prebuilt node of a compiled menu.
+// Prebuilt nodes are [tagName, attributes, children] arrays with the trailing
+// empty parts left out. See tools/compile_menus.py
+Engine.prototype.getTagName = function(tag){
+  return Array.isArray(tag) ? tag[0] : tag.tagName;
+};
+
+// Returns the children of an xml tag or prebuilt node.
+Engine.prototype.getTagChildren = function(tag){
+  return Array.isArray(tag) ? (tag[2] || []) : tag.children;
+};
+
+// Creates a map of attributes belonging to a single xml tag or prebuilt node.
 Engine.prototype.getXMLAttributes = function(tag){
+  if(Array.isArray(tag)){
+    return Engine.prototype.mapifyObject(tag[1] || {});
+  };
   let attributes = Object.values(tag.attributes);
   let map = new Map();
   for(const a of attributes){
@@ -466,10 +504,77 @@ Engine.prototype.getSpriteScaledPosition = function(x, y){
 */
 function AssetLoader(parent){
   this.parent = parent;
+  // Map of urls to the file contents (Uint8Array) from the asset bundle.
+  this.bundle = new Map();
+};
+
+// Fetch the asset bundle. Resolves to true if the bundle was loaded.
+// A missing or invalid bundle is not an error; assets are then fetched individually.
+AssetLoader.prototype.loadBundle = function(url){
+  return new Promise((resolve, reject) => {
+    let req = new XMLHttpRequest();
+    req.responseType = "arraybuffer";
+
+    req.onload = () => {
+      if(req.status !== 200){
+        resolve(false);
+        return;
+      };
+      this.bundle = this._parseBundle(req.response);
+      resolve(this.bundle.size > 0);
+    };
+
+    req.onerror = () => resolve(false);
+
+    req.open("GET", url);
+    req.send();
+  });
+};
+
+// Split the bundle into its files. See tools/build_bundle.py for the layout.
+AssetLoader.prototype._parseBundle = function(buffer){
+  let files = new Map();
+  let bytes = new Uint8Array(buffer);
+  let headerEnd = bytes.indexOf(10); // The header is the first line.
+  let header;
+  try {header = JSON.parse(new TextDecoder().decode(bytes.subarray(0, headerEnd)))}
+  catch(e){
+    console.error(`Error reading asset bundle header. error: ${e}`);
+    return files;
+  };
+
+  if(header.format !== this.parent.bundleFormat){
+    console.error(`Asset bundle format ${header.format} is not supported.`);
+    return files;
+  };
+
+  let payload = bytes.subarray(headerEnd + 1);
+  for(const [url, [offset, length]] of Object.entries(header.files)){
+    files.set(url, payload.subarray(offset, offset + length));
+  };
+  return files;
+};
+
+// Load an asset out of the bundle instead of requesting it.
+AssetLoader.prototype._getBundledAsset = function(url){
+  let text = new TextDecoder().decode(this.bundle.get(url));
+  if(url.endsWith('.json')){
+    this.loadJsonData(JSON.parse(text));
+  }
+  else if(url.endsWith('.xml')){
+    this.loadXMLData(new DOMParser().parseFromString(text, "application/xml"));
+  };
 };
 
 // If load is set to false then the request itself is returned.
 AssetLoader.prototype.getAsset = function(url){
+  if(this.bundle.has(url)){
+    return new Promise((resolve, reject) => {
+      this._getBundledAsset(url);
+      resolve();
+    });
+  };
+
   return new Promise((resolve, reject) => {
     let loadMethod;
     let loadParams = {
@@ -488,6 +593,10 @@ AssetLoader.prototype.getAsset = function(url){
     };
 
     req.onload = (req) => {
+      if(req.target.status >= 400){
+        reject(new Error(`${url} returned ${req.target.status}`));
+        return;
+      };
       loadMethod(req);
       resolve();
     };
@@ -503,7 +612,6 @@ AssetLoader.prototype.getAsset = function(url){
 };
 
 AssetLoader.prototype.loadJson = function(req){
-  let engine = this.parent;
   let data = req.target.response;
 
   // Error handling.
@@ -512,6 +620,12 @@ AssetLoader.prototype.loadJson = function(req){
     catch(e){console.error(`Error loading .json file! file: ${req.target.responseURL}. error: ${e}`)}
   };
 
+  this.loadJsonData(data);
+};
+
+// data is the parsed contents of a .json file.
+AssetLoader.prototype.loadJsonData = function(data){
+  let engine = this.parent;
   let jsonKeys = Object.keys(data);
 
   // Check for certain .json files to see if they
@@ -520,6 +634,9 @@ AssetLoader.prototype.loadJson = function(req){
     case engine.animKey:
       this.loadAnimation(data);
       break;
+    case engine.compiledMenuKey:
+      this.loadCompiledMenus(data);
+      break;
     default:
       jsonKeys.forEach((key) => {
         // If the value is an array just set it as an array.
@@ -536,7 +653,11 @@ AssetLoader.prototype.loadJson = function(req){
 };
 
 AssetLoader.prototype.loadXML = function(req){
-  let data = req.target.responseXML;
+  this.loadXMLData(req.target.responseXML);
+};
+
+// data is XMLDocument type
+AssetLoader.prototype.loadXMLData = function(data){
   let verifyXML = this.parent.verifyXML;
   let getXMLType = this.parent.getXMLType.bind(this.parent);
   let loadFunc;
@@ -556,11 +677,23 @@ AssetLoader.prototype.loadXML = function(req){
 // Creates and loads menu from data.
 // data is XMLDocument type
 AssetLoader.prototype.loadMenu = function(data){
+  let menu = this.parent.guiManager.createMenuFromData(data);
+  this._addMenu(menu);
+};
+
+// Creates and loads every menu in a compiled menu file.
+AssetLoader.prototype.loadCompiledMenus = function(data){
+  let engine = this.parent;
+  for(const menuData of data[engine.compiledMenuKey]){
+    this._addMenu(engine.guiManager.createMenuFromCompiled(menuData));
+  };
+};
+
+AssetLoader.prototype._addMenu = function(menu){
   let engine = this.parent;
   let menuKey = engine.menuKey;
 
   // If first time loading menu, create the initial map.
-  let menu = engine.guiManager.createMenuFromData(data);
   if(engine.assets.has(menuKey) === false){
     engine.assets.set(menuKey, new Map());
   };
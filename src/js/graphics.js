@@ -312,44 +312,57 @@ Renderer.prototype.drawEffect = function(scene, gameEntity, effectAnim){
   this.drawSprite(this.animationManager.getSprite(effectAnim), relativePos[0], relativePos[1]);
 };
 
-// Draws all tiles in view of the camera.
+// Draws all tiles in view of the camera, then each of the tileMap's
+// extra layers on top in order.
 Renderer.prototype.drawTiles = function(scene){
   let tileMap = scene.tileMap;
   let tilesArray = tileMap.tiles;
-  let spriteSheet = scene.spriteSheet;
-  let camera = scene.camera;
-  let textureManager = this.textureManager;
 
-  let coords;
-  let pos_X;
-  let pos_Y;
-  let spriteIndexArray;
-  let frame;
-  let tileSprite;
-  let newPosArray;
+  let posArray;
   for (let index = 0; index < tilesArray.length; index++){
     if(tileMap.tileIsEmpty(index) === true){
       continue;
     };
+    posArray = this._getTilePosInView(scene, index);
+    if(posArray !== null){
+      this._drawTileSprite(scene.spriteSheet, tileMap.getSpriteIndex(index), posArray);
+    };
+  };
 
-    coords = tileMap.convertPos(index); // Convert -> 2d;
-    pos_X = coords[0] * spriteSheet.spriteSize * this.parent.spriteScale;
-    pos_Y = coords[1] * spriteSheet.spriteSize * this.parent.spriteScale;
-    newPosArray = camera.getRelative(pos_X, pos_Y);
-    pos_X = newPosArray[0];
-    pos_Y = newPosArray[1];
-    let tileRect = new Rect([pos_X, pos_Y], spriteSheet.spriteSize * this.parent.spriteScale);
-
-    if(camera.rectInView(tileRect) === true){
-      spriteIndexArray = tileMap.getSpriteIndex(index);
-      tileSprite = textureManager.copySprite(spriteSheet.sprite);
-      frame = textureManager.getRectFromSheet(spriteSheet, spriteIndexArray[0], spriteIndexArray[1]);
-      this.textureManager.setTextureFrame(tileSprite.texture, frame);
-      this.drawSprite(tileSprite, pos_X, pos_Y);
+  let spriteIndexArray;
+  for (const layer of tileMap.layers){
+    for (let index = 0; index < layer.tiles.length; index++){
+      spriteIndexArray = layer.sprites[layer.tiles[index]];
+      if(spriteIndexArray === null){
+        continue;
+      };
+      posArray = this._getTilePosInView(scene, index);
+      if(posArray !== null){
+        this._drawTileSprite(scene.spriteSheet, spriteIndexArray, posArray);
+      };
     };
   };
 };
 
+// Return the camera relative position of a tile or null if it isn't in view.
+Renderer.prototype._getTilePosInView = function(scene, index){
+  let spriteSheet = scene.spriteSheet;
+  let coords = scene.tileMap.convertPos(index); // Convert -> 2d;
+  let pos_X = coords[0] * spriteSheet.spriteSize * this.parent.spriteScale;
+  let pos_Y = coords[1] * spriteSheet.spriteSize * this.parent.spriteScale;
+  let newPosArray = scene.camera.getRelative(pos_X, pos_Y);
+  let tileRect = new Rect(newPosArray, spriteSheet.spriteSize * this.parent.spriteScale);
+  return (scene.camera.rectInView(tileRect) === true) ? newPosArray : null;
+};
+
+Renderer.prototype._drawTileSprite = function(spriteSheet, spriteIndexArray, posArray){
+  let textureManager = this.textureManager;
+  let tileSprite = textureManager.copySprite(spriteSheet.sprite);
+  let frame = textureManager.getRectFromSheet(spriteSheet, spriteIndexArray[0], spriteIndexArray[1]);
+  textureManager.setTextureFrame(tileSprite.texture, frame);
+  this.drawSprite(tileSprite, posArray[0], posArray[1]);
+};
+
 // =====================
 // Menu related methods.
 // =====================
@@ -746,6 +759,9 @@ Renderer.prototype.createImageGraphic = function(imageWidget, src, type, spriteS
       if(frameArray != null){
         frameArray = Engine.prototype.convertStringToArray(frameArray);
         frameArray = frameArray.map(n => Number(n));
+        // frameArray is relative to the sheet, not the atlas it may be packed in.
+        frameArray[0] += spriteSheet.offsetX;
+        frameArray[1] += spriteSheet.offsetY;
         textureManager.setTextureFrame(spriteSheet.texture, frameArray)
       };
       graphic = spriteSheet.sprite;
@@ -1017,6 +1033,10 @@ TextureManager.prototype.getSheetFromId = function(id){
   let image = engine.getImage(id);
   let imageURL = engine.imgLocation + "/" + image.name;
   let texture = this.getTexture(imageURL);
+  // Sheets packed into an atlas only cover part of the texture.
+  if(image.offsetX !== undefined){
+    this.setTextureFrame(texture, [image.offsetX, image.offsetY, image.width, image.height]);
+  };
   let sprite = this.getSprite(texture);
   return new SpriteSheet(imageURL, texture, sprite, image);
 };
@@ -1032,8 +1052,8 @@ TextureManager.prototype.getRectFromSheet = function(spriteSheet, index_X, index
       size = spriteSheet.spriteSize;
       width = size;
       height = size;
-      posX = index_X * size;
-      posY = index_Y * size;
+      posX = spriteSheet.offsetX + index_X * size;
+      posY = spriteSheet.offsetY + index_Y * size;
       break;
     case "variableSize":
       posX = this.spriteProperties[`${index_X}, ${index_Y}`]["x"];
@@ -1058,13 +1078,13 @@ TextureManager.prototype.getSpriteFromSheet = function(spriteSheet, index_X, ind
 // When all the loading is done. Fire off the callback.
 TextureManager.prototype._loadTextureArray = function(imageArray, imageMap, callback, i=0){
   let engine = this.parent.parent;
-  let id;
-  let url;
 
+  // Several sheets can share one texture when they are packed into an atlas.
+  let urls = new Set();
   for(const imageID of imageArray){
-    url = engine.imgLocation + "/" + imageMap.get(imageID).name;
-    this.loader.add(url);
+    urls.add(engine.imgLocation + "/" + imageMap.get(imageID).name);
   };
+  urls.forEach(url => this.loader.add(url));
 
   this.loader.load();
   this.loader.onComplete.add(callback);
@@ -1082,6 +1102,9 @@ function SpriteSheet(imageURL, texture, sprite, imageObj){
   this.texture = texture;
   this.width = imageObj.width;
   this.height = imageObj.height;
+  // Position of the sheet within its texture. Non-zero when packed into an atlas (see tools/pack_atlas.py).
+  this.offsetX = (imageObj.offsetX === undefined) ? 0 : imageObj.offsetX;
+  this.offsetY = (imageObj.offsetY === undefined) ? 0 : imageObj.offsetY;
 
   this.type = (imageObj.type === undefined) ? "fixedSize" : imageObj.type;
   switch (this.type) {
@@ -13,6 +13,8 @@ function GUIManager(parent){
   // Borrow some methods from the Engine.
   this.getXMLChildren = parent.getXMLChildren;
   this.getXMLAttributes = parent.getXMLAttributes;
+  this.getTagName = parent.getTagName;
+  this.getTagChildren = parent.getTagChildren;
 };
 
 // Return True if the mouse is hovering over a gui object.
@@ -247,8 +249,8 @@ GUIManager.prototype._createAllGUIObjects = function(menuTag){
   let renderer = this.parent.renderer;
   let guiObjectArray = []
 
-  for(const child of menuTag.children){
-    let guiObjectName = child.tagName;
+  for(const child of this.getTagChildren(menuTag)){
+    let guiObjectName = this.getTagName(child);
     let createFunc;
     let guiObject;
 
@@ -312,8 +314,6 @@ GUIManager.prototype.setIdObjects = function(widget, idMap=null){
 // Parse menu data and return menu object based on it.
 // data is a XMLDocument object.
 GUIManager.prototype.createMenuFromData = function(data){
-  let createAllGUIObjectsFunc = this._createAllGUIObjects.bind(this);
-
   let fileTag = data.children[0];
   let fileChildren = this.getXMLChildren(fileTag);
 
@@ -326,7 +326,19 @@ GUIManager.prototype.createMenuFromData = function(data){
   let menuLayoutSettings = this.getXMLAttributes(layoutTag);
 
   let menuTag = fileChildren.get("menu");
-  let menuGUIObjects = createAllGUIObjectsFunc(menuTag);
+  return this._createMenu(menuName, menuLayoutType, menuLayoutSettings, menuTag);
+};
+
+// Create a menu object from one entry of a compiled menu file.
+// See tools/compile_menus.py for the format.
+GUIManager.prototype.createMenuFromCompiled = function(data){
+  let menuLayoutSettings = Engine.prototype.mapifyObject(data.layoutSettings || {});
+  return this._createMenu(data.name, data.layout, menuLayoutSettings, data.menu);
+};
+
+// menuTag is either a <menu> element or its prebuilt node.
+GUIManager.prototype._createMenu = function(menuName, menuLayoutType, menuLayoutSettings, menuTag){
+  let menuGUIObjects = this._createAllGUIObjects(menuTag);
 
   let menu = new Menu(menuName, menuLayoutType, menuLayoutSettings, menuGUIObjects);
   this.setWidgetFrames(menu);
@@ -11,7 +11,13 @@ function Scene(engine, spriteSheet, sceneData){
   this.engine = engine;
   this.name = sceneData.name;
   this.spriteSheet = spriteSheet; // Shared spriteSheet of all the tiles in the scene.
-  this.tileMap = new TileMap(sceneData.width, sceneData.height, sceneData.tileData);
+  this.tileMap = new TileMap(sceneData.width, sceneData.height, sceneData.tileData, sceneData.collisionRects);
+  if(sceneData.navigation !== undefined){
+    this.tileMap.loadNavigation(sceneData.navigation);
+  };
+  if(sceneData.layers !== undefined){
+    this.tileMap.loadLayers(sceneData.layers);
+  };
   // A map of all entities in the scene. keys are entity ids. values are entity objects.
   this.entities = new Map();
   this._genericID = 0; // For creating ids for generic entities.
@@ -209,12 +215,108 @@ Scene.prototype.getEntityTopLeft = function(entity){
    "000-FL", "000-FL", "000-FL",
    "000-FL", "000-FL", "000-FL",
    "000-FL", "000-FL", "000-FL"]
+ * collisionRects is an optional array of [x, y, width, height] rects (in TILES)
+ * covering every collidable tile. They are baked by the level editor on save.
 */
-function TileMap(width, height, tiledata){
+function TileMap(width, height, tiledata, collisionRects){
   this.width = width, // tileMap width in TILES
   this.height = height, // tileMap height in TILES.
   this.tiles = tiledata;
   this.tileSize = 32; // Size of an individual tile in pixels.
+  this.collisionRects = (collisionRects !== undefined) ? collisionRects : null;
+  // Extra sprite-only layers drawn above the tiles. See loadLayers().
+  this.layers = [];
+
+  // Navigation data baked by the level editor. See tools/level_editor/Code/navigation.py
+  // Format: bytes per region id and distance. Format 2 is for levels with
+  // too many regions or too long paths for 16 bits.
+  this.navFormats = {1: 2, 2: 4};
+  this.regions = null; // Uint16Array (or Uint32Array) of connected region ids. 0 is unwalkable.
+  this.navFields = new Map(); // target name: {distance: Uint16Array (or Uint32Array), flow: Uint8Array}
+  this.unreachable = 0xFFFF; // The largest distance of the format.
+  // Index 0 means there is no step to take.
+  this.flowDirections = [null, [-1, 0], [1, 0], [0, -1], [0, 1]];
+};
+
+// Decode a base64 packed little endian array.
+TileMap.prototype._unpackArray = function(data, bytesPerElement){
+  let bytes = Uint8Array.from(atob(data), c => c.charCodeAt(0));
+  if(bytesPerElement === 1){return bytes};
+  let view = new DataView(bytes.buffer);
+  if(bytesPerElement === 4){
+    let array = new Uint32Array(bytes.length / 4);
+    for(let i = 0; i < array.length; i++){
+      array[i] = view.getUint32(i * 4, true);
+    };
+    return array;
+  };
+  let array = new Uint16Array(bytes.length / 2);
+  for(let i = 0; i < array.length; i++){
+    array[i] = view.getUint16(i * 2, true);
+  };
+  return array;
+};
+
+TileMap.prototype.loadNavigation = function(navData){
+  let bytes = this.navFormats[navData.format];
+  if(bytes === undefined){
+    console.error(`Navigation data format ${navData.format} is not supported.`);
+    return;
+  };
+  this.unreachable = (bytes === 4) ? 0xFFFFFFFF : 0xFFFF;
+  this.regions = this._unpackArray(navData.regions, bytes);
+  for(const [name, field] of Object.entries(navData.fields)){
+    this.navFields.set(name, {
+      distance: this._unpackArray(field.distance, bytes),
+      flow: this._unpackArray(field.flow, 1)
+    });
+  };
+};
+
+// layers is a level's "layers" array. See tools/level_editor/Code/layers.py
+TileMap.prototype.loadLayers = function(layers){
+  for(const layer of layers){
+    this.layers.push({
+      name: layer.name,
+      // [index_X, index_Y] of each sprite in the layer's dictionary. null is empty.
+      sprites: layer.dictionary.map(s => (s === "") ? null : s.split("-").map(Number)),
+      tiles: this._unpackArray(layer.tiles, 2)
+    });
+  };
+};
+
+// Return true if a path exists between two tiles.
+TileMap.prototype.tilesAreConnected = function(tileIndex1, tileIndex2){
+  if(this.regions === null){return undefined};
+  return this.regions[tileIndex1] !== 0 && this.regions[tileIndex1] === this.regions[tileIndex2];
+};
+
+// Return the distance (in tiles) from tileIndex to the nearest tile of a nav target.
+// Returns null if the target can't be reached.
+TileMap.prototype.getNavDistance = function(target, tileIndex){
+  let distance = this.navFields.get(target).distance[tileIndex];
+  return (distance === this.unreachable) ? null : distance;
+};
+
+// Return the [x, y] step (in tiles) to take from tileIndex towards a nav target.
+// Returns null at the target itself or if it can't be reached.
+TileMap.prototype.getNavDirection = function(target, tileIndex){
+  return this.flowDirections[this.navFields.get(target).flow[tileIndex]];
+};
+
+// Return the collision rects that overlap an area given in pixels.
+// Returns null if the tileMap has no collision rects.
+TileMap.prototype.getCollisionRectsInArea = function(x, y, width, height){
+  if(this.collisionRects === null){return null};
+  let tileSize = this.tileSize;
+  let result = [];
+  for(const rect of this.collisionRects){
+    if(rect[0] * tileSize <= x + width && x <= (rect[0] + rect[2]) * tileSize &&
+      rect[1] * tileSize <= y + height && y <= (rect[1] + rect[3]) * tileSize){
+      result.push(rect);
+    };
+  };
+  return result;
 };
 
 TileMap.prototype.tileIsEmpty = function(tileIndex){
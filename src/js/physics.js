@@ -230,11 +230,31 @@ PhysicsManager.prototype.rayMarch = function(rayVector, scene, evaluator){
 // Return the coordinates of the point where rayVector hits something in the scene
 // and the surface vector the point touches.
 PhysicsManager.prototype.raycastCollision = function(rayVector, scene){
+  if(this._rayMissesCollisionRects(rayVector, scene) === true){return null};
   let evaluator = this._checkForCollision.bind(this, rayVector, scene);
   result = this.rayMarch(rayVector, scene, evaluator);
   return result;
 };
 
+// Broad phase for raycastCollision. Return true if the ray stays inside the map
+// and its bounding box touches none of the tileMap's collision rects.
+PhysicsManager.prototype._rayMissesCollisionRects = function(rayVector, scene){
+  let tileMap = scene.tileMap;
+  let mapWidth = tileMap.width * tileMap.tileSize;
+  let mapHeight = tileMap.height * tileMap.tileSize;
+  for(const p of [rayVector.p1, rayVector.p2]){
+    // Out of bounds rays are left to rayMarch so it can report them.
+    if(p[0] < 0 || p[1] < 0 || p[0] >= mapWidth || p[1] >= mapHeight){return false};
+  };
+
+  let x = Math.min(rayVector.p1[0], rayVector.p2[0]);
+  let y = Math.min(rayVector.p1[1], rayVector.p2[1]);
+  let width = Math.abs(rayVector.p2[0] - rayVector.p1[0]);
+  let height = Math.abs(rayVector.p2[1] - rayVector.p1[1]);
+  let rects = tileMap.getCollisionRectsInArea(x, y, width, height);
+  return rects !== null && rects.length === 0;
+};
+
 PhysicsManager.prototype.stupidAlgorithm = function(rayVector, scene){
   for(let i = 0; i < scene.tileMap.tiles.length; i++){
     collision = this._checkForCollision(rayVector, scene, i);
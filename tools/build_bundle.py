@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+# ==============================================================
+# Use this script to pack the game's data files into a single
+# bundle so the engine can fetch them with one request.
+#
+# Rebuild the bundle after editing anything in src/data. The dev
+# server refuses to serve a stale bundle so the engine falls back
+# to fetching the files individually.
+#
+# Bundle layout: a single line of json (the header) followed by
+# the raw contents of every file. The header's "files" entry maps
+# each url to [offset, length] relative to the end of the header.
+# ==============================================================
+import os, sys, json, hashlib, gzip
+
+import game_assets
+
+BUNDLE_FORMAT = 1 # Corresponds to this.bundleFormat in engine.js
+BUNDLE_URL = game_assets.DATA_LOCATION + '/assets.bundle' # Corresponds to this.bundleFile in engine.js
+
+def bundle_path(root: str = game_assets.src_dir) -> str:
+    return os.path.join(root, BUNDLE_URL)
+
+def build_bundle(root: str = game_assets.src_dir) -> bytes:
+    """Return the contents of a bundle for all of the game's data files.
+    """
+    files = {}
+    chunks = []
+    offset = 0
+    for url in game_assets.data_assets(root):
+        with open(os.path.join(root, url), 'rb') as f:
+            data = f.read()
+        files[url] = [offset, len(data)]
+        chunks.append(data)
+        offset += len(data)
+
+    payload = b''.join(chunks)
+    header = {
+        'format': BUNDLE_FORMAT,
+        'version': hashlib.sha1(payload).hexdigest()[:12],
+        'files': files
+    }
+    header = json.dumps(header, separators=(',', ':')).encode('utf-8')
+    return header + b'\n' + payload
+
+def read_header(path: str) -> dict:
+    with open(path, 'rb') as f:
+        return json.loads(f.readline())
+
+def bundle_is_stale(path: str, root: str = game_assets.src_dir) -> bool:
+    """Return True if any bundled file changed after the bundle was written
+    or the file list no longer matches.
+    """
+    try:
+        header = read_header(path)
+    except (OSError, ValueError):
+        return True
+    if header.get('format') != BUNDLE_FORMAT:
+        return True
+
+    bundle_mtime = os.path.getmtime(path)
+    try:
+        urls = game_assets.data_assets(root)
+        if urls != list(header['files'].keys()):
+            return True
+        return any(os.path.getmtime(os.path.join(root, url)) > bundle_mtime for url in urls)
+    except (OSError, ValueError):
+        return True
+
+def print_report(bundle: bytes, root: str = game_assets.src_dir):
+    urls = game_assets.data_assets(root)
+    raw_bytes = sum(game_assets.get_size(url, root) for url in urls)
+    gzip_bytes = 0
+    for url in urls:
+        with open(os.path.join(root, url), 'rb') as f:
+            gzip_bytes += len(gzip.compress(f.read()))
+    print(f'{"":<12} {"requests":>10} {"bytes":>10} {"gzip bytes":>12}')
+    print(f'{"before":<12} {len(urls):>10} {raw_bytes:>10} {gzip_bytes:>12}')
+    print(f'{"after":<12} {1:>10} {len(bundle):>10} {len(gzip.compress(bundle)):>12}')
+
+def main():
+    root = game_assets.src_dir
+    bundle = build_bundle(root)
+    path = bundle_path(root)
+    with open(path, 'wb') as f:
+        f.write(bundle)
+    print(f'Wrote {path} (version {read_header(path)["version"]})\n')
+    if '--quiet' not in sys.argv:
+        print_report(bundle, root)
+
+if __name__ == '__main__':
+    main()
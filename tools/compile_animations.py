@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+
+# ==============================================================
+# Use this script to compile every animation file listed in
+# animations.json into a single minified file.
+#
+# Templates and spritesheet references are resolved ahead of time
+# so the engine does no template lookups at startup. Frame indexes
+# are checked against the sheet sizes in image.json and any other
+# reference (followUp, return, effects, sounds) is checked as well.
+#
+# The engine loads the compiled file when it exists and falls back
+# to the individual files otherwise. Recompile after editing any
+# animation file; the dev server will not serve a stale one.
+# ==============================================================
+import os, sys, json
+
+import game_assets
+
+# Corresponds to this.animKey and this.animTemplateKey in engine.js
+ANIM_KEY = 'animations'
+TEMPLATE_KEY = 'TEMPLATES'
+# Settings that must be defined once templates are applied. See Animation() in graphics.js.
+REQUIRED_SETTINGS = ('frames', 'loops', 'type')
+# Settings that name other animations.
+ANIMATION_REFERENCES = ('followUp', 'return')
+
+
+class AnimationError(Exception):
+    pass
+
+
+def load_animation_files(root: str) -> tuple:
+    """Return (templates, animations) merged across every animation file
+    in the same order the engine loads them.
+    """
+    templates = {}
+    animations = {}
+    for url in game_assets.animation_source_assets(root):
+        with open(os.path.join(root, url), 'r') as f:
+            data = json.load(f)[ANIM_KEY]
+        templates.update(data.pop(TEMPLATE_KEY, {}))
+        animations.update(data)
+    return templates, animations
+
+def resolve(name: str, data: dict, templates: dict, chain=()) -> dict:
+    """Return data with its template chain applied. Settings closer to the
+    animation override those of its templates.
+    """
+    template = data.get('template')
+    if template is None:
+        settings = {}
+    elif template in chain:
+        raise AnimationError(f'{name}: template cycle {" -> ".join(chain + (template,))}')
+    elif template not in templates:
+        raise AnimationError(f'{name}: template {template} does not exist')
+    else:
+        settings = resolve(name, templates[template], templates, chain + (template,))
+
+    settings.update(data)
+    settings.pop('template', None)
+    return settings
+
+def validate(name: str, settings: dict, animations: dict, images: dict, sounds: set) -> list:
+    """Return a list of problems with a resolved animation.
+    """
+    errors = []
+    for setting in REQUIRED_SETTINGS:
+        if setting not in settings:
+            errors.append(f'{name}: missing required setting "{setting}"')
+
+    sheet = settings.get('spriteSheet')
+    image = images.get(sheet)
+    if sheet is None:
+        errors.append(f'{name}: no spriteSheet in the animation or its templates')
+    elif image is None:
+        errors.append(f'{name}: spriteSheet {sheet} is not in image.json')
+    elif image.get('type', 'fixedSize') == 'fixedSize':
+        cols = image['width'] // image['spriteSize']
+        rows = image['height'] // image['spriteSize']
+        for frame in settings.get('frames') or []:
+            if frame is None:
+                continue
+            x, y = frame
+            if not (0 <= x < cols and 0 <= y < rows):
+                errors.append(f'{name}: frame {frame} is outside {sheet} ({cols}x{rows} sprites)')
+
+    frames = settings.get('frames') or []
+    timings = settings.get('timings')
+    if isinstance(timings, list) and len(timings) != len(frames):
+        errors.append(f'{name}: {len(timings)} timings for {len(frames)} frames')
+
+    for setting in ANIMATION_REFERENCES:
+        other = settings.get(setting)
+        if other is not None and other not in animations:
+            errors.append(f'{name}: {setting} animation {other} does not exist')
+    for effect in settings.get('effects') or []:
+        if effect not in animations:
+            errors.append(f'{name}: effect animation {effect} does not exist')
+    for frame_sounds in (settings.get('sounds') or {}).values():
+        for sound in frame_sounds:
+            if sound not in sounds:
+                errors.append(f'{name}: sound {sound} is not in audio.json')
+    return errors
+
+def compile_animations(root: str = game_assets.src_dir) -> tuple:
+    """Return (compiled file dict, list of errors).
+    """
+    with open(os.path.join(root, game_assets.DATA_LOCATION, 'image.json'), 'r') as f:
+        images = json.load(f)['images']
+    with open(os.path.join(root, game_assets.DATA_LOCATION, 'audio.json'), 'r') as f:
+        sounds = set(json.load(f)['audioFiles']['sfx'].keys())
+
+    templates, animations = load_animation_files(root)
+    compiled = {}
+    errors = []
+    for name, data in animations.items():
+        try:
+            settings = resolve(name, data, templates)
+        except AnimationError as e:
+            errors.append(str(e))
+            continue
+        errors += validate(name, settings, animations, images, sounds)
+        compiled[name] = settings
+    return {ANIM_KEY: compiled}, errors
+
+def main():
+    root = game_assets.src_dir
+    compiled, errors = compile_animations(root)
+    for e in errors:
+        print(e)
+    if errors:
+        sys.exit(f'\n{len(errors)} problem(s) found. Nothing was written.')
+
+    path = os.path.join(root, game_assets.compiled_animations_url())
+    with open(path, 'w') as f:
+        json.dump(compiled, f, separators=(',', ':'))
+
+    sources = game_assets.animation_source_assets(root)
+    before = sum(game_assets.get_size(url, root) for url in sources)
+    print(f'Compiled {len(compiled[ANIM_KEY])} animations from {len(sources)} files '
+        f'({before} bytes) into {path} ({os.path.getsize(path)} bytes).')
+
+if __name__ == '__main__':
+    main()
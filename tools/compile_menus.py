@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+
+# ==============================================================
+# Use this script to compile every menu listed in menus.json into
+# a single minified json file of prebuilt layout trees.
+#
+# Each menu is validated first: the <file> must start with a
+# <header> declaring the menu's type, name and layout, only known
+# gui tags may be used and every guiCustomStyle.json / image.json
+# reference must exist and suit the tag using it. References stay
+# names in the compiled trees, the renderer draws styles by name
+# from the guiCustomStyle.json it loads anyway.
+#
+# The engine loads the compiled file when it exists and falls back
+# to the xml files otherwise. Recompile after editing any menu;
+# the dev server will not serve a stale one.
+#
+# Pass --benchmark to compare the time spent parsing each menu's
+# xml against loading its compiled json.
+# ==============================================================
+import os, sys, json, timeit
+import xml.etree.ElementTree as ET
+
+import game_assets
+
+# Corresponds to this.compiledMenuKey in engine.js
+COMPILED_MENU_KEY = 'compiledMenus'
+# Tags handled by GUIManager._createAllGUIObjects() in gui.js.
+GUI_TAGS = ('label', 'button', 'list', 'frame', 'img', 'arrowSelect')
+NUMERIC_ATTRIBUTES = ('x', 'y', 'width', 'height', 'spaceBetween', 'scale', 'currentIndex',
+    'horizontalPadding', 'verticalPadding')
+# Prefix used by _createArrowSelect() in gui.js and the suffixes the renderer appends to it.
+ARROW_BUTTON_SRC = 'arrowButton'
+ARROW_BUTTON_SUFFIXES = [side + state for side in ('Left', 'Right')
+    for state in ('', 'Hover', 'Pressed', 'Disabled')]
+
+BENCHMARK_RUNS = 2000
+
+
+class MenuError(Exception):
+    pass
+
+
+def parse_number(text: str):
+    """Return text as an int or float, or unchanged if it isn't a number
+    (validate_element() reports those).
+    """
+    try:
+        number = float(text)
+    except ValueError:
+        return text
+    return int(number) if number.is_integer() else number
+
+def build_node(element: ET.Element) -> list:
+    """Return the prebuilt layout tree for element: [tag, attributes,
+    children], the parts of an xml element the gui uses (see
+    Engine.getTagName() in engine.js). Trailing empty parts are left out
+    and numeric attributes are stored as numbers.
+    """
+    attributes = {name: parse_number(value) if name in NUMERIC_ATTRIBUTES else value
+        for name, value in element.attrib.items()}
+    node = [element.tag, attributes, [build_node(child) for child in element]]
+    while len(node) > 1 and not node[-1]:
+        node.pop()
+    return node
+
+def read_header(root: ET.Element) -> dict:
+    """Return the text of every header field. Raise MenuError if the file
+    does not start with a valid header.
+    """
+    if root.tag != 'file':
+        raise MenuError(f'root tag is <{root.tag}>, expected <file>')
+    if len(root) == 0 or root[0].tag != 'header':
+        raise MenuError('<file> must start with a <header>')
+
+    header = {}
+    for field in root[0]:
+        if field.tag in header:
+            raise MenuError(f'<header> has more than one <{field.tag}>')
+        header[field.tag] = (field.text or '').strip()
+
+    for field in ('type', 'name', 'layout'):
+        if not header.get(field):
+            raise MenuError(f'<header> is missing <{field}>')
+    if header['type'] != 'menu':
+        raise MenuError(f'header type is {header["type"]}, expected menu')
+    return header
+
+def validate_element(element: ET.Element, gui_style: dict, images: dict, ids: set) -> list:
+    """Return a list of problems with element and its children.
+    """
+    errors = []
+    attrib = element.attrib
+    if element.tag not in GUI_TAGS:
+        return [f'<{element.tag}> is not a gui object']
+
+    for attribute in NUMERIC_ATTRIBUTES:
+        if attribute in attrib:
+            try:
+                float(attrib[attribute])
+            except ValueError:
+                errors.append(f'<{element.tag}> {attribute}="{attrib[attribute]}" is not a number')
+
+    widget_id = attrib.get('id')
+    if widget_id is not None:
+        if widget_id in ids:
+            errors.append(f'id "{widget_id}" is used more than once')
+        ids.add(widget_id)
+
+    if element.tag == 'img':
+        src = attrib.get('src')
+        image_type = attrib.get('type', 'fullImage')
+        if src is None:
+            errors.append('<img> is missing a src')
+        elif image_type == 'gui':
+            if src not in gui_style:
+                errors.append(f'<img> src "{src}" is not in guiCustomStyle.json')
+            elif gui_style[src].get('model') != 'image':
+                errors.append(f'<img> src "{src}" does not use the image model')
+        elif src not in images:
+            errors.append(f'<img> src "{src}" is not in image.json')
+    elif element.tag == 'frame':
+        style = attrib.get('frameStyle', 'window')
+        if style not in gui_style:
+            errors.append(f'<frame> frameStyle "{style}" is not in guiCustomStyle.json')
+        elif gui_style[style].get('model') != 'rect':
+            errors.append(f'<frame> frameStyle "{style}" does not use the rect model')
+    elif element.tag == 'arrowSelect':
+        for suffix in ARROW_BUTTON_SUFFIXES:
+            if ARROW_BUTTON_SRC + suffix not in gui_style:
+                errors.append(f'<arrowSelect> needs {ARROW_BUTTON_SRC + suffix} in guiCustomStyle.json')
+
+    if element.tag != 'list' and len(element):
+        errors.append(f'<{element.tag}> can not have children')
+    for child in element:
+        errors += validate_element(child, gui_style, images, ids)
+    return errors
+
+def compile_menu(root: ET.Element, gui_style: dict, images: dict) -> tuple:
+    """Return (compiled menu, list of errors) for a parsed menu file.
+    """
+    header = read_header(root)
+    menu = root.find('menu')
+    if menu is None:
+        raise MenuError('<file> has no <menu>')
+
+    errors = []
+    ids = set()
+    for child in menu:
+        errors += validate_element(child, gui_style, images, ids)
+
+    layout = root[0].find('layout')
+    compiled = {
+        'name': header['name'],
+        'layout': header['layout'],
+        'menu': build_node(menu)
+    }
+    if layout.attrib:
+        compiled['layoutSettings'] = dict(layout.attrib)
+    return compiled, errors
+
+def load_references(root: str) -> tuple:
+    with open(os.path.join(root, game_assets.DATA_LOCATION, 'guiCustomStyle.json'), 'r') as f:
+        gui_style = json.load(f)['guiCustomStyle']
+    with open(os.path.join(root, game_assets.DATA_LOCATION, 'image.json'), 'r') as f:
+        images = json.load(f)['images']
+    return gui_style, images
+
+def compile_menus(root: str = game_assets.src_dir) -> tuple:
+    """Return (compiled file dict, list of errors).
+    """
+    gui_style, images = load_references(root)
+    menus = []
+    errors = []
+    names = set()
+    for url in game_assets.menu_source_assets(root):
+        try:
+            compiled, menu_errors = compile_menu(ET.parse(os.path.join(root, url)).getroot(), gui_style, images)
+        except (ET.ParseError, MenuError) as e:
+            errors.append(f'{url}: {e}')
+            continue
+        if compiled['name'] in names:
+            menu_errors.append(f'menu name {compiled["name"]} is already used')
+        names.add(compiled['name'])
+        errors += [f'{url}: {e}' for e in menu_errors]
+        menus.append(compiled)
+    return {COMPILED_MENU_KEY: menus}, errors
+
+def benchmark(root: str, compiled: dict):
+    """Time loading each menu from xml (parse, read the header and walk the
+    tree) against loading the compiled json. This runs in Python so the
+    numbers are a proxy for the browser's DOMParser, not a measurement of it.
+    """
+    menus = {menu['name']: menu for menu in compiled[COMPILED_MENU_KEY]}
+    print(f'{"menu":<16} {"xml (us)":>10} {"json (us)":>10} {"saved":>8}')
+    for url in game_assets.menu_source_assets(root):
+        with open(os.path.join(root, url), 'r') as f:
+            xml_text = f.read()
+        name = read_header(ET.fromstring(xml_text))['name']
+        json_text = json.dumps(menus[name], separators=(',', ':'))
+
+        def load_xml():
+            root = ET.fromstring(xml_text)
+            read_header(root)
+            return build_node(root.find('menu'))
+
+        xml_time = timeit.timeit(load_xml, number=BENCHMARK_RUNS) / BENCHMARK_RUNS * 1e6
+        json_time = timeit.timeit(lambda: json.loads(json_text), number=BENCHMARK_RUNS) / BENCHMARK_RUNS * 1e6
+        saved = (1 - json_time / xml_time) * 100 if xml_time else 0
+        print(f'{name:<16} {xml_time:>10.1f} {json_time:>10.1f} {saved:>7.1f}%')
+
+def main():
+    root = game_assets.src_dir
+    compiled, errors = compile_menus(root)
+    for e in errors:
+        print(e)
+    if errors:
+        sys.exit(f'\n{len(errors)} problem(s) found. Nothing was written.')
+
+    path = os.path.join(root, game_assets.compiled_menus_url())
+    with open(path, 'w') as f:
+        json.dump(compiled, f, separators=(',', ':'))
+
+    sources = game_assets.menu_source_assets(root)
+    before = sum(game_assets.get_size(url, root) for url in sources)
+    print(f'Compiled {len(compiled[COMPILED_MENU_KEY])} menus ({before} bytes) '
+        f'into {path} ({os.path.getsize(path)} bytes).')
+
+    if '--benchmark' in sys.argv:
+        print()
+        benchmark(root, compiled)
+
+if __name__ == '__main__':
+    main()
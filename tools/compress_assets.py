@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+# ==============================================================
+# Use this script to write gzip compressed copies of the game's
+# text assets. run_local_server.py will serve the .gz copy of a
+# file to any browser that accepts gzip.
+#
+# Pass --clean to remove the compressed copies instead.
+# ==============================================================
+import os, sys, gzip
+
+import game_assets
+
+COMPRESSIBLE_EXTENSIONS = ('.html', '.css', '.js', '.map', '.json', '.xml', '.fnt', '.txt', '.svg', '.bundle')
+COMPRESSION_LEVEL = 9
+
+def is_compressible(path: str) -> bool:
+    return path.endswith(COMPRESSIBLE_EXTENSIONS)
+
+def gzip_path(path: str) -> str:
+    return path + '.gz'
+
+def compress_bytes(data: bytes) -> bytes:
+    # mtime is fixed so rebuilding unchanged assets gives identical output.
+    return gzip.compress(data, COMPRESSION_LEVEL, mtime=0)
+
+def compress_file(path: str) -> int:
+    """Write the gzip copy of path if it is missing or stale.
+    Return the size of the compressed copy.
+    """
+    out_path = gzip_path(path)
+    if os.path.isfile(out_path) and os.path.getmtime(out_path) >= os.path.getmtime(path):
+        return os.path.getsize(out_path)
+
+    with open(path, 'rb') as f:
+        data = compress_bytes(f.read())
+    with open(out_path, 'wb') as f:
+        f.write(data)
+    return len(data)
+
+def walk_compressible(root: str):
+    for dirpath, dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            if is_compressible(filename):
+                yield os.path.join(dirpath, filename)
+
+def print_report(root: str):
+    """Print the bytes sent for a full game load with and without compression.
+    """
+    total_raw = 0
+    total_sent = 0
+    for url in game_assets.startup_assets(root):
+        path = os.path.join(root, url)
+        raw = os.path.getsize(path)
+        sent = raw
+        if is_compressible(path) and os.path.isfile(gzip_path(path)):
+            sent = os.path.getsize(gzip_path(path))
+        total_raw += raw
+        total_sent += sent
+        print(f'{url:<48} {raw:>10} -> {sent:>10}')
+
+    saved = total_raw - total_sent
+    percent = (saved / total_raw * 100) if total_raw else 0
+    print(f'\nFull game load: {total_raw} bytes -> {total_sent} bytes '
+        f'({saved} bytes saved, {percent:.1f}%)')
+
+def main():
+    root = game_assets.src_dir
+    if '--clean' in sys.argv:
+        for path in walk_compressible(root):
+            if os.path.isfile(gzip_path(path)):
+                os.remove(gzip_path(path))
+        print('Removed compressed assets.')
+        return
+
+    count = 0
+    for path in walk_compressible(root):
+        compress_file(path)
+        count += 1
+    print(f'Compressed {count} assets.\n')
+    print_report(root)
+
+if __name__ == '__main__':
+    main()
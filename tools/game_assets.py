@@ -0,0 +1,152 @@
+# ==============================================================
+# game_assets.py lists the files the game fetches while it boots.
+#
+# The order mirrors the loading states in engine.js so the tools
+# in this folder can reason about a "full game load" without
+# running a browser.
+# ==============================================================
+import os, re, json
+import xml.etree.ElementTree as ET
+
+src_dir = os.path.abspath(os.path.join(os.path.dirname( __file__ ), '..', 'src'))
+
+# Corresponds to Engine.loadStandaloneAssets() in engine.js.
+STANDALONE_ASSETS = [
+    'image.json',
+    'animations.json',
+    'menus.json',
+    'fonts.json',
+    'inputs.json',
+    'guiCustomStyle.json',
+    'levels.json',
+    'audio.json'
+]
+
+# Corresponds to the AssetLoader variables in engine.js.
+DATA_LOCATION = 'data'
+IMG_LOCATION = 'img'
+MENU_LOCATION = DATA_LOCATION + '/menus'
+ANIM_LOCATION = DATA_LOCATION + '/animations'
+FONT_LOCATION = 'fonts'
+SONGS_LOCATION = DATA_LOCATION + '/audio/bgm'
+SOUNDS_LOCATION = DATA_LOCATION + '/audio/sfx'
+
+# Written by compile_animations.py. Corresponds to this.compiledAnimFile in engine.js.
+COMPILED_ANIM_FILE = 'animations.min.json'
+# Written by compile_menus.py. Corresponds to this.compiledMenuFile in engine.js.
+COMPILED_MENU_FILE = 'menus.min.json'
+
+def _read_json(root: str, url: str) -> dict:
+    with open(os.path.join(root, url), 'r') as f:
+        return json.load(f)
+
+def page_assets(root: str = src_dir) -> list:
+    """Return the urls referenced directly by index.html, in document order.
+    """
+    with open(os.path.join(root, 'index.html'), 'r') as f:
+        html = f.read()
+    return re.findall(r'(?:src|href)="([^"]+)"', html)
+
+def is_stale(url: str, sources: list, root: str = src_dir) -> bool:
+    """Return True if the generated file at url is missing or older than
+    any of its sources.
+    """
+    path = os.path.join(root, url)
+    if not os.path.isfile(path):
+        return True
+    mtime = os.path.getmtime(path)
+    return any(os.path.getmtime(os.path.join(root, s)) > mtime for s in sources)
+
+def animation_source_assets(root: str = src_dir) -> list:
+    """Return the urls of the animation files listed in animations.json.
+    """
+    return [ANIM_LOCATION + '/' + f for f in _read_json(root, DATA_LOCATION + '/animations.json')['animationFiles']]
+
+def compiled_animations_url() -> str:
+    return ANIM_LOCATION + '/' + COMPILED_ANIM_FILE
+
+def compiled_animations_sources(root: str = src_dir) -> list:
+    """Return every file the compiled animations are built from.
+    """
+    return ([DATA_LOCATION + '/' + f for f in ('animations.json', 'image.json', 'audio.json')]
+        + animation_source_assets(root))
+
+def compiled_animations_stale(root: str = src_dir) -> bool:
+    return is_stale(compiled_animations_url(), compiled_animations_sources(root), root)
+
+def animation_assets(root: str = src_dir) -> list:
+    """Return the animation urls the engine loads. This is the compiled
+    file when it is up to date and the individual files otherwise.
+    """
+    if not compiled_animations_stale(root):
+        return [compiled_animations_url()]
+    return animation_source_assets(root)
+
+def menu_source_assets(root: str = src_dir) -> list:
+    """Return the urls of the menu files listed in menus.json.
+    """
+    return [MENU_LOCATION + '/' + f for f in _read_json(root, DATA_LOCATION + '/menus.json')['menuFiles']]
+
+def compiled_menus_url() -> str:
+    return MENU_LOCATION + '/' + COMPILED_MENU_FILE
+
+def compiled_menus_sources(root: str = src_dir) -> list:
+    """Return every file the compiled menus are built from.
+    """
+    return ([DATA_LOCATION + '/' + f for f in ('menus.json', 'guiCustomStyle.json', 'image.json')]
+        + menu_source_assets(root))
+
+def compiled_menus_stale(root: str = src_dir) -> bool:
+    return is_stale(compiled_menus_url(), compiled_menus_sources(root), root)
+
+def menu_assets(root: str = src_dir) -> list:
+    """Return the menu urls the engine loads. This is the compiled file
+    when it is up to date and the individual files otherwise.
+    """
+    if not compiled_menus_stale(root):
+        return [compiled_menus_url()]
+    return menu_source_assets(root)
+
+def data_assets(root: str = src_dir) -> list:
+    """Return the urls of every data file the engine loads, in load order.
+    """
+    urls = [DATA_LOCATION + '/' + f for f in STANDALONE_ASSETS]
+    urls += menu_assets(root)
+    urls += animation_assets(root)
+    return urls
+
+def font_assets(root: str = src_dir) -> list:
+    """Return the urls of every bitmap font and the pages it references.
+    """
+    urls = []
+    for font in _read_json(root, DATA_LOCATION + '/fonts.json')['fonts']:
+        url = FONT_LOCATION + '/' + font
+        urls.append(url)
+        for page in ET.parse(os.path.join(root, url)).getroot().iter('page'):
+            urls.append(FONT_LOCATION + '/' + page.get('file'))
+    return urls
+
+def image_assets(root: str = src_dir) -> list:
+    """Return the url of every texture listed in image.json without duplicates.
+    """
+    urls = []
+    for image in _read_json(root, DATA_LOCATION + '/image.json')['images'].values():
+        url = IMG_LOCATION + '/' + image['name']
+        if url not in urls:
+            urls.append(url)
+    return urls
+
+def audio_assets(root: str = src_dir) -> list:
+    audio = _read_json(root, DATA_LOCATION + '/audio.json')['audioFiles']
+    urls = [SONGS_LOCATION + '/' + f for f in audio['bgm'].values()]
+    urls += [SOUNDS_LOCATION + '/' + f for f in audio['sfx'].values()]
+    return urls
+
+def startup_assets(root: str = src_dir) -> list:
+    """Return every url fetched during a full game load.
+    """
+    return (page_assets(root) + data_assets(root) + image_assets(root)
+        + font_assets(root) + audio_assets(root))
+
+def get_size(url: str, root: str = src_dir) -> int:
+    return os.path.getsize(os.path.join(root, url))
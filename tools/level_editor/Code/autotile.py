@@ -0,0 +1,174 @@
+# ==================================================================
+# autotile.py picks edge and corner sprites automatically from the
+# tile types (FL, WA, ...) around each tile.
+#
+# Rules are loaded per spritesheet from cfg.autotile_dir. For each
+# type code a rule maps a neighbourhood bitmask to a sprite:
+#
+#   {"borderMatches": true,
+#    "rules": {"FL": {"neighbours": 4, "matches": ["FL"],
+#                     "sprites": {"6": [2, 0], ...}, "default": [3, 1]}}}
+#
+# A neighbour sets its bit when its type is in "matches" (the rule's
+# own type by default). Bits are N=1, E=2, S=4, W=8 and with
+# "neighbours": 8 also NE=16, SE=32, SW=64, NW=128. A corner bit is
+# only set when both edges next to it are, so 8 neighbour rules need
+# at most 47 masks. Masks without a sprite use "default".
+#
+# Each rule is expanded into a lookup table indexed by mask when the
+# file is loaded.
+# ==================================================================
+from typing import Iterable, List, Optional
+import json, os
+
+import numpy as np
+
+from . import cfg
+
+# (dx, dy, bit)
+EDGE_BITS = ((0, -1, 1), (1, 0, 2), (0, 1, 4), (-1, 0, 8))
+# (dx, dy, bit, edge bits the corner needs)
+CORNER_BITS = ((1, -1, 16, 1 | 2), (1, 1, 32, 2 | 4), (-1, 1, 64, 4 | 8), (-1, -1, 128, 8 | 1))
+
+_loaded_rules = {} # path: (mtime, AutotileRules)
+
+
+def _get_type(tile: str) -> str:
+    return tile.rsplit('-', 1)[-1]
+
+def _get_sprite(pos: list) -> str:
+    return '{}-{}'.format(*pos)
+
+
+class AutotileRules:
+    """The lookup tables of one spritesheet's autotile rules.
+    """
+    def __init__(self, data: dict):
+        self.borderMatches = data.get('borderMatches', True)
+        self.tables = {} # type code: sprite ("x-y") for every mask
+        self.matches = {} # type code: type codes that count as the same
+        self.useCorners = False
+        for type_code, rule in data['rules'].items():
+            corners = rule.get('neighbours', 4) == 8
+            table = [_get_sprite(rule['default'])] * (256 if corners else 16)
+            for mask, pos in rule.get('sprites', {}).items():
+                table[int(mask)] = _get_sprite(pos)
+            self.tables[type_code] = table
+            self.matches[type_code] = frozenset(rule.get('matches', [type_code]))
+            self.useCorners |= corners
+
+    def getMask(self, types: List[str], width: int, height: int, index: int) -> int:
+        """Return the bitmask of the tile at index. types is the type code
+        of every tile in the level.
+        """
+        type_code = types[index]
+        matches = self.matches[type_code]
+        corners = len(self.tables[type_code]) == 256
+        x, y = index % width, index // width
+
+        def same(dx, dy) -> bool:
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < width and 0 <= ny < height:
+                return types[ny * width + nx] in matches
+            return self.borderMatches
+
+        mask = 0
+        for dx, dy, bit in EDGE_BITS:
+            if same(dx, dy):
+                mask |= bit
+        if corners:
+            for dx, dy, bit, edges in CORNER_BITS:
+                if mask & edges == edges and same(dx, dy):
+                    mask |= bit
+        return mask
+
+    def autotileCells(self, tiles: list, width: int, height: int, indexes: Iterable[int], oldTiles: dict = None) -> List[int]:
+        """Re-pick the sprites of the tiles at indexes and their neighbours
+        after those tiles changed. Return the indexes of the tiles whose
+        sprite changed. Their tiles from before are added to oldTiles if
+        it's given, unless they're in it already.
+        """
+        offsets = [(0, 0)] + [(dx, dy) for dx, dy, *_ in EDGE_BITS + (CORNER_BITS if self.useCorners else ())]
+        affected = set()
+        for index in indexes:
+            x, y = index % width, index // width
+            for dx, dy in offsets:
+                if 0 <= x + dx < width and 0 <= y + dy < height:
+                    affected.add((y + dy) * width + x + dx)
+
+        # Only the tiles around affected ones need their type looked up.
+        types = _LazyTypes(tiles)
+        changed = []
+        for index in sorted(affected):
+            table = self.tables.get(types[index])
+            if table is None:
+                continue
+            sprite = table[self.getMask(types, width, height, index)]
+            tile = f'{sprite}-{types[index]}'
+            if tiles[index] != tile:
+                if oldTiles is not None:
+                    oldTiles.setdefault(index, tiles[index])
+                tiles[index] = tile
+                changed.append(index)
+        return changed
+
+    def autotileLevel(self, tiles: list, width: int, height: int) -> List[int]:
+        """Re-pick the sprite of every tile with a rule. Return the indexes of
+        the tiles whose sprite changed.
+        """
+        types = np.array([_get_type(tile) for tile in tiles]).reshape(height, width)
+        current = np.array([tile.rsplit('-', 1)[0] for tile in tiles]).reshape(height, width)
+        changed = []
+        for type_code, table in self.tables.items():
+            cells = types == type_code
+            if not cells.any():
+                continue
+            same = np.pad(np.isin(types, list(self.matches[type_code])), 1, constant_values=self.borderMatches)
+
+            def shifted(dx, dy):
+                return same[1 + dy:1 + dy + height, 1 + dx:1 + dx + width]
+
+            mask = np.zeros((height, width), dtype=np.int32)
+            for dx, dy, bit in EDGE_BITS:
+                mask |= shifted(dx, dy) * bit
+            if len(table) == 256:
+                for dx, dy, bit, edges in CORNER_BITS:
+                    mask |= (shifted(dx, dy) & (mask & edges == edges)) * bit
+
+            sprites = np.array(table)[mask]
+            for index in np.flatnonzero(cells & (sprites != current)).tolist():
+                tiles[index] = f'{sprites.flat[index]}-{type_code}'
+                changed.append(index)
+        return sorted(changed)
+
+
+class _LazyTypes:
+    """Type codes of a tile list, worked out as they are looked up.
+    """
+    def __init__(self, tiles: list):
+        self.tiles = tiles
+        self.types = {}
+
+    def __getitem__(self, index: int) -> str:
+        type_code = self.types.get(index)
+        if type_code is None:
+            type_code = self.types[index] = _get_type(self.tiles[index])
+        return type_code
+
+
+def get_rules_file(spriteSheet: str) -> str:
+    return cfg.get_assetURL(cfg.autotile_dir, spriteSheet, '.json')
+
+def load_rules(spriteSheet: str) -> Optional[AutotileRules]:
+    """Return the autotile rules of a spritesheet or None if it has none.
+    Rules are reloaded when their file changes.
+    """
+    path = get_rules_file(spriteSheet)
+    if not os.path.isfile(path):
+        return None
+    mtime = os.path.getmtime(path)
+    loaded = _loaded_rules.get(path)
+    if loaded is None or loaded[0] != mtime:
+        with open(path, 'r') as f:
+            loaded = _loaded_rules[path] = (mtime, AutotileRules(json.load(f)))
+    return loaded[1]
@@ -0,0 +1,228 @@
+# ==================================================================
+# binary.py reads and writes the binary level container (*.lvl), an
+# alternative to level .json files for very large maps.
+#
+# Tiles are stored as a raw little endian array of indexes into a
+# per-level tile dictionary (the distinct tile ids of the level), so
+# opening a file only parses the headers and memory maps the arrays.
+# Pages are read from disk the first time a tile on them is touched.
+#
+# Layout (all integers little endian):
+#   file header   magic, version, level count, extras length
+#   extras        json of every top-level key except the levels
+#   per level:
+#     level header  name length, sprite sheet length, width, height,
+#                   index size (1, 2 or 4 bytes), dictionary size,
+#                   tile array offset, extras length
+#     name, sprite sheet (utf-8)
+#     dictionary    (length, utf-8 tile id) per entry
+#     extras        json of the level's other keys and their order
+#   tile arrays   width * height indexes each, 8 byte aligned
+#
+# Conversion to and from json is lossless. See convert_levels.py.
+# ==================================================================
+from typing import List, Union
+import json, mmap, os, struct
+
+import numpy as np
+
+from . import cfg
+from .entities import ENTITIES_KEY, get_entity_list
+from .layers import LAYERS_KEY, pack_layers
+
+MAGIC = b'DTLV'
+VERSION = 1
+BINARY_EXTENSION = '.lvl'
+_FILE_HEADER = struct.Struct('<4sHHI')
+_LEVEL_HEADER = struct.Struct('<HHIIBxxxIQI')
+_ENTRY_LENGTH = struct.Struct('<H')
+_ALIGNMENT = 8
+# Keys stored in the level header rather than the extras.
+_HEADER_KEYS = ('name', 'spriteSheet', 'width', 'height', 'tileData')
+
+
+class LevelFormatError(Exception):
+    pass
+
+
+def is_binary_level(filename: str) -> bool:
+    return filename.lower().endswith(BINARY_EXTENSION)
+
+def _index_dtype(dictionary_size: int) -> np.dtype:
+    for dtype in ('<u1', '<u2', '<u4'):
+        if dictionary_size <= np.iinfo(dtype).max + 1:
+            return np.dtype(dtype)
+    raise LevelFormatError(f'{dictionary_size} distinct tiles is too many')
+
+
+class MappedTileData:
+    """A level's tileData backed by an index array (usually a memory mapped
+    one) and a tile dictionary. Behaves like the list of tile id strings
+    LevelData expects; scripts can use getIndexes() / getDictionary() for
+    numpy access instead.
+
+    Edits never reach the file they were mapped from (the mapping is copy
+    on write) until the level is saved.
+    """
+    def __init__(self, indexes: np.ndarray, dictionary: List[str]):
+        self.indexes = indexes
+        self.dictionary = dictionary
+        self.lookup = {tile: i for i, tile in enumerate(dictionary)}
+
+    @classmethod
+    def fromList(cls, tiles: list):
+        dictionary, indexes = np.unique(np.array(tiles, dtype=str), return_inverse=True)
+        return cls(indexes.astype(_index_dtype(len(dictionary))), dictionary.tolist())
+
+    def getIndexes(self) -> np.ndarray:
+        """Return the 1d array of indexes into getDictionary().
+        """
+        return self.indexes
+
+    def getDictionary(self) -> List[str]:
+        return self.dictionary
+
+    def getIndex(self, tile: str) -> int:
+        """Return the dictionary index of tile, adding it if it's new.
+        """
+        index = self.lookup.get(tile)
+        if index is None:
+            index = len(self.dictionary)
+            if index > np.iinfo(self.indexes.dtype).max:
+                self.indexes = self.indexes.astype(_index_dtype(index + 1))
+            self.dictionary.append(tile)
+            self.lookup[tile] = index
+        return index
+
+    def copy(self):
+        return MappedTileData(self.indexes.copy(), self.dictionary.copy())
+
+    def __len__(self) -> int:
+        return len(self.indexes)
+
+    def __getitem__(self, key: Union[int, slice]):
+        if isinstance(key, slice):
+            return [self.dictionary[i] for i in self.indexes[key].tolist()]
+        return self.dictionary[self.indexes[key]]
+
+    def __setitem__(self, key: int, tile: str):
+        self.indexes[key] = self.getIndex(tile)
+
+    def __iter__(self):
+        dictionary = self.dictionary
+        return (dictionary[i] for i in self.indexes.tolist())
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, MappedTileData):
+            # Dictionaries only grow so one is a prefix of the other unless
+            # the tiles were built separately.
+            shared = min(len(self.dictionary), len(other.dictionary))
+            if self.dictionary[:shared] == other.dictionary[:shared]:
+                return np.array_equal(self.indexes, other.indexes)
+        return len(self) == len(other) and list(self) == list(other)
+
+    def __ne__(self, other) -> bool:
+        return not self == other
+
+
+# =====================
+# READING
+# =====================
+def _read(buffer, offset: int, fmt: struct.Struct) -> tuple:
+    return fmt.unpack_from(buffer, offset), offset + fmt.size
+
+def _read_string(buffer, offset: int, length: int) -> tuple:
+    return bytes(buffer[offset:offset + length]).decode('utf-8'), offset + length
+
+def load_level_binary(filename: str) -> dict:
+    """Return the level file dict of a binary level container. tileData of
+    every level is a MappedTileData over the file's memory.
+    """
+    with open(filename, 'rb') as f:
+        # ACCESS_COPY: edits stay in memory and the file can be replaced on save.
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    (magic, version, level_count, extras_length), offset = _read(buffer, 0, _FILE_HEADER)
+    if magic != MAGIC:
+        raise LevelFormatError(f'{filename} is not a binary level file')
+    if version != VERSION:
+        raise LevelFormatError(f'{filename} has unsupported version {version}')
+    extras, offset = _read_string(buffer, offset, extras_length)
+    file = json.loads(extras)
+    levels = {}
+    for _ in range(level_count):
+        header, offset = _read(buffer, offset, _LEVEL_HEADER)
+        name_length, sheet_length, width, height, index_size, dictionary_size, tile_offset, extras_length = header
+        name, offset = _read_string(buffer, offset, name_length)
+        sheet, offset = _read_string(buffer, offset, sheet_length)
+        dictionary = []
+        for _ in range(dictionary_size):
+            (length,), offset = _read(buffer, offset, _ENTRY_LENGTH)
+            tile, offset = _read_string(buffer, offset, length)
+            dictionary.append(tile)
+        extras, offset = _read_string(buffer, offset, extras_length)
+        extras = json.loads(extras)
+
+        indexes = np.frombuffer(buffer, dtype=f'<u{index_size}', count=width * height, offset=tile_offset)
+        values = {'name': name, 'spriteSheet': sheet, 'width': width, 'height': height,
+            'tileData': MappedTileData(indexes, dictionary), **extras['values']}
+        levels[name] = {key: values[key] for key in extras['keys']}
+
+    # The levels go back where they were among the top-level keys.
+    return {key: (levels if key == cfg.LEVEL_KEY else value) for key, value in file.items()}
+
+
+# =====================
+# WRITING
+# =====================
+def _to_mapped(tiles) -> MappedTileData:
+    return tiles if isinstance(tiles, MappedTileData) else MappedTileData.fromList(tiles)
+
+def _encode_strings(*strings) -> list:
+    return [s.encode('utf-8') for s in strings]
+
+def write_level_binary(filename: str, file: dict):
+    """Write file as a binary level container. The file is replaced
+    atomically so maps open from it stay valid.
+    """
+    levels = file[cfg.LEVEL_KEY]
+    file_extras = json.dumps({key: (None if key == cfg.LEVEL_KEY else value) for key, value in file.items()},
+        ensure_ascii=False).encode('utf-8')
+
+    encoded = []
+    for level_name, level in levels.items():
+        tiles = _to_mapped(level['tileData'])
+        if level_name != level['name']:
+            raise LevelFormatError(f'level {level_name} is named {level["name"]}')
+        if len(tiles) != level['width'] * level['height']:
+            raise LevelFormatError(f'{level_name} has {len(tiles)} tiles, expected {level["width"] * level["height"]}')
+        name, sheet = _encode_strings(level['name'], level['spriteSheet'])
+        dictionary = _encode_strings(*tiles.getDictionary())
+        values = {k: v for k, v in level.items() if k not in _HEADER_KEYS}
+        if LAYERS_KEY in values:
+            values[LAYERS_KEY] = pack_layers(values[LAYERS_KEY])
+        if ENTITIES_KEY in values:
+            values[ENTITIES_KEY] = get_entity_list(values[ENTITIES_KEY])
+        extras = json.dumps({'keys': list(level.keys()), 'values': values}, ensure_ascii=False).encode('utf-8')
+        body = name + sheet + b''.join(_ENTRY_LENGTH.pack(len(entry)) + entry for entry in dictionary) + extras
+        indexes = tiles.getIndexes().astype(_index_dtype(len(dictionary)).newbyteorder('<'), copy=False)
+        encoded.append((level, len(name), len(sheet), len(dictionary), len(extras), body, indexes))
+
+    # Tile arrays go after every header.
+    offset = _FILE_HEADER.size + len(file_extras) + sum(_LEVEL_HEADER.size + len(e[5]) for e in encoded)
+    offsets = []
+    for *_, indexes in encoded:
+        offset += -offset % _ALIGNMENT
+        offsets.append(offset)
+        offset += indexes.nbytes
+
+    temp = filename + '.tmp'
+    with open(temp, 'wb') as f:
+        f.write(_FILE_HEADER.pack(MAGIC, VERSION, len(encoded), len(file_extras)) + file_extras)
+        for (level, name_length, sheet_length, dictionary_size, extras_length, body, indexes), tile_offset in zip(encoded, offsets):
+            f.write(_LEVEL_HEADER.pack(name_length, sheet_length, level['width'], level['height'],
+                indexes.itemsize, dictionary_size, tile_offset, extras_length) + body)
+        for indexes, tile_offset in zip((e[6] for e in encoded), offsets):
+            f.write(b'\0' * (tile_offset - f.tell()))
+            f.write(indexes.tobytes())
+    os.replace(temp, filename)
@@ -3,6 +3,7 @@
 # ========================================================
 
 import os
+from functools import lru_cache
 
 __version__ = '1.0.0'
 __name__ = 'js-roguelite Level Editor'
@@ -13,6 +14,9 @@ TILE_ARRAY_SIZE = 3 # This is the number of elements in a tile id.
 
 LEVEL_KEY = "levels" # Corresponds to this.levelKey in engine.js
 
+# Entity names the game can create. Corresponds to Scene.createEntity() in logic.js
+ENTITY_TYPES = ('player', 'anna', 'darius', 'dummyMan', 'tower_watch1', 'tower_watch2')
+
 SETTINGS = {
     'inRepo': True
 }
@@ -23,14 +27,35 @@ assets_dir = os.path.abspath(os.path.join(main_dir, 'Assets'))
 data_dir = os.path.abspath(os.path.join(main_dir, 'Data'))
 icons_dir = os.path.abspath(os.path.join(assets_dir, 'Icons'))
 
-icons = {}
-# Load all icon files.
-for file in os.scandir(icons_dir):
-    if file.path.endswith('.png'):
-        name = file.name[:-4] # Without extension
-        icons[name] = os.path.abspath(os.path.join(icons_dir, file.name))
+# Generated files (i.e. the processed stylesheet) that are safe to delete.
+cache_dir = os.path.abspath(os.path.join(main_dir, '.cache'))
 
 stylesheet_file = os.path.abspath(os.path.join(data_dir, 'stylesheet.qss'))
+# Autotile rules for each spritesheet (<spriteSheet>.json). See autotile.py
+autotile_dir = os.path.abspath(os.path.join(data_dir, 'autotile'))
+
+# Time in ms from launch until the window is interactive. main.py warns if
+# it is exceeded when run with --startup-times.
+STARTUP_BUDGET = 250
+# Bytes of rendered levels kept so switching back to them is instant. See LevelViewCache in widgets.py
+VIEW_CACHE_BUDGET = 256 * 1024 * 1024
+# Bytes of rendered chunks each tile layer keeps for drawing. See LayerItem in widgets.py
+LAYER_CACHE_BUDGET = 96 * 1024 * 1024
+# Edits kept in memory for undo/redo. Older ones are read back from the edit journal (see journal.py).
+HISTORY_CACHE_SIZE = 64
+# Bytes of journal records no longer needed for undo/redo before a save rewrites the journal without them.
+JOURNAL_COMPACT_SIZE = 1024 * 1024
+# Bytes per tile each structure may use before memory_budget.py fails. Undo history
+# and its journal (on disk) are per tile changed, by single tile edits or one edit
+# of every tile, whichever takes more. Palette is per tile menu tile. Scene doesn't
+# include the pixmaps of the layers, they are held to LAYER_CACHE_BUDGET per layer.
+MEMORY_BUDGETS = {
+    'level data': 80,
+    'scene': 24, # Mostly the tile codes of the layers (see LayerItem).
+    'palette': 900,
+    'undo': 24,
+    'journal': 160 # A single tile edit's record is about 125 bytes.
+}
 settings_default = '0'
 
 colors = {
@@ -73,3 +98,10 @@ def get_assetURL(parent_dir, filename, ext=None) -> str:
     if ext and not filename.endswith(ext):
         filename += ext
     return os.path.abspath(os.path.join(parent_dir, filename))
+
+@lru_cache(maxsize=None)
+def get_icon(name: str) -> str:
+    """Return the path of the icon with the given name (no extension).
+    Icons are looked up when first needed rather than scanned at import.
+    """
+    return get_assetURL(icons_dir, name, '.png')
@@ -0,0 +1,83 @@
+# ==================================================================
+# collision.py merges a level's collidable tiles into as few axis
+# aligned rectangles as possible (greedy meshing).
+#
+# The rectangles are saved with each level as "collisionRects" so the
+# game can do broad-phase checks against them instead of every tile.
+# ==================================================================
+from typing import List
+
+from . import cfg
+
+COLLIDABLE_IDS = ('WA',) # Corresponds to TileMap.tileIsCollidable() in logic.js
+COLLISION_KEY = 'collisionRects'
+
+def get_collision_grid(tile_data: List[str], collidable=COLLIDABLE_IDS) -> List[bool]:
+    return [tile.split('-')[-1] in collidable for tile in tile_data]
+
+def merge_rects(grid: List[bool], width: int, height: int, rows=None) -> List[List[int]]:
+    """Return [x, y, width, height] rectangles (in tiles) that exactly cover
+    every True cell of grid without overlapping.
+
+    Each uncovered cell (in row order) starts a rectangle that is grown right
+    as far as possible, then down while the whole span is free. rows
+    optionally limits the search to the rows known to contain True cells.
+    """
+    used = [False] * len(grid)
+    rects = []
+    for y in (range(height) if rows is None else sorted(rows)):
+        row = y * width
+        end = row + width
+        x = row
+        while True:
+            try:
+                x = grid.index(True, x, end) # Skip to the next True cell.
+            except ValueError:
+                break
+            if used[x]:
+                x += 1
+                continue
+
+            rect_width = 1
+            while x + rect_width < end and grid[x + rect_width] and not used[x + rect_width]:
+                rect_width += 1
+
+            rect_height = 1
+            while y + rect_height < height:
+                start = x + rect_height * width
+                if not all(grid[i] and not used[i] for i in range(start, start + rect_width)):
+                    break
+                rect_height += 1
+
+            for dy in range(rect_height):
+                start = x + dy * width
+                used[start:start + rect_width] = [True] * rect_width
+            rects.append([x - row, y, rect_width, rect_height])
+            x += rect_width
+    return rects
+
+def merge_collision_rects(tile_data: List[str], width: int, height: int,
+    collidable=COLLIDABLE_IDS) -> List[List[int]]:
+    """Return the rectangles covering every collidable tile (greedy meshing).
+    """
+    return merge_rects(get_collision_grid(tile_data, collidable), width, height)
+
+def update_collision_rects(file: dict, level_names=None) -> dict:
+    """Recompute the collision rectangles of every level in file (or only
+    those in level_names). Return {level name: (collidable tiles, rectangles)}
+    for reporting.
+    """
+    report = {}
+    for level_name in file[cfg.LEVEL_KEY] if level_names is None else level_names:
+        level = file[cfg.LEVEL_KEY][level_name]
+        rects = merge_collision_rects(level['tileData'], level['width'], level['height'])
+        level[COLLISION_KEY] = rects
+        report[level_name] = (sum(get_collision_grid(level['tileData'])), len(rects))
+    return report
+
+def format_report(report: dict) -> str:
+    lines = []
+    for level_name, (tiles, rects) in report.items():
+        reduction = (1 - rects / tiles) * 100 if tiles else 0
+        lines.append(f'{level_name}: {tiles} collidable tiles -> {rects} rectangles ({reduction:.1f}% fewer)')
+    return '\n'.join(lines)
@@ -5,11 +5,19 @@
 from typing import Tuple, Optional, List
 import math
 from . import cfg
+from .entities import ENTITIES_KEY, EntityLayer
+from .layers import LAYERS_KEY, EMPTY_SPRITE, new_layer, unpack_layer
+from .autotile import load_rules
+from .tileindex import TileIndex, get_tile_key, replace_tile
 
 class LevelData:
     def __init__(self, file: dict):
         self.levelJson = file
         self.currentLevel = list(file[cfg.LEVEL_KEY].keys())[0] # This is the name of the first level in dictionary.
+        # Names of levels changed since the last save. See write_level_json() in file.py.
+        self.dirtyLevels = set()
+        self.revisions = {} # Level name: number of changes made to it.
+        self.tileIndexes = {} # Level name: TileIndex of its tileData, made on first use.
 
     def _getDefaultName(self, levelName: Optional[str]) -> str:
         """Return self.currentLevel if levelName is None otherwise
@@ -96,33 +104,297 @@ class LevelData:
     def setCurrentLevel(self, levelName: str):
         self.currentLevel = levelName
 
+    def markDirty(self, *levelNames):
+        """Flag levels as changed since the last save. Defaults to the
+        current level.
+        """
+        for levelName in levelNames or (self.currentLevel,):
+            self.dirtyLevels.add(levelName)
+            self.revisions[levelName] = self.revisions.get(levelName, 0) + 1
+
+    def getDirtyLevels(self) -> set:
+        return self.dirtyLevels.copy()
+
+    def clearDirty(self):
+        self.dirtyLevels.clear()
+
+    def getRevision(self, levelName=None) -> int:
+        """Return a number that changes whenever a level does.
+        """
+        return self.revisions.get(self._getDefaultName(levelName), 0)
+
     # ==========================
     # LEVEL MANIPULATION METHODS
     # ==========================
     def setWidth(self, new_width: int, levelName=None):
         levelName = self._getDefaultName(levelName)
         self.getLevel(levelName)["width"] = new_width
+        self.markDirty(levelName)
 
     def setHeight(self, new_height: int, levelName=None):
         levelName = self._getDefaultName(levelName)
         self.getLevel(levelName)["height"] = new_height
+        self.markDirty(levelName)
+
+    def setSpriteSheet(self, spriteSheet: str, levelName=None):
+        levelName = self._getDefaultName(levelName)
+        self.getLevel(levelName)["spriteSheet"] = spriteSheet
+        self.markDirty(levelName)
 
     def setTileData(self, tile_data: List[str], levelName=None):
         """Set self.levelJson["tileData"] = tile_data
 
         Precondition: tile_data is properly formatted.
         """
+        levelName = self._getDefaultName(levelName)
         self.getLevel(levelName)["tileData"] = tile_data
+        self.markDirty(levelName)
 
     def setTile(self, tile_index: int, new_id: str, levelName=None):
+        levelName = self._getDefaultName(levelName)
         level = self.getLevel(levelName)
         level["tileData"][tile_index] = new_id
+        self._updateTileIndex((tile_index,), levelName)
+        self.markDirty(levelName)
 
     def eraseTile(self, tile_index: int, levelName=None):
         empty_id = '0-0-{}'.format(cfg.EMPTY_TILE_ID)
         self.setTile(tile_index, empty_id, levelName)
 
-    def fillTiles(self, tile_index: int, new_id: str, levelName=None, fill_indexes=(0, cfg.TILE_ARRAY_SIZE)):
+    def autotile(self, indexes=None, levelName=None, oldTiles: dict = None) -> List[int]:
+        """Re-pick edge and corner sprites using the autotile rules of the
+        level's spritesheet (see autotile.py). If indexes is given only
+        those tiles and their neighbours are updated and the tiles they
+        had before are added to oldTiles (index: tile id) if it's given.
+
+        Return the indexes of the tiles that changed.
+        """
+        levelName = self._getDefaultName(levelName)
+        rules = load_rules(self.getLevel(levelName)["spriteSheet"])
+        if rules is None:
+            return []
+        tiles = self.getTileData(levelName)
+        width, height = self.getMapSize(1, levelName)
+        if indexes is None:
+            changed = rules.autotileLevel(tiles, width, height)
+        else:
+            changed = rules.autotileCells(tiles, width, height, indexes, oldTiles)
+        if changed:
+            self._updateTileIndex(changed, levelName)
+            self.markDirty(levelName)
+        return changed
+
+    # ==================
+    # TILE USAGE METHODS
+    # ==================
+    # Tiles are found by tile id ("4-4-FL"), sprite ("4-4") or type ("FL").
+    # See tileindex.py
+    def getTileIndex(self, levelName=None) -> TileIndex:
+        """Return the TileIndex of a level's tileData, making it if needed.
+        """
+        levelName = self._getDefaultName(levelName)
+        tiles = self.getTileData(levelName)
+        index = self.tileIndexes.get(levelName)
+        if index is None or index.tiles is not tiles:
+            index = self.tileIndexes[levelName] = TileIndex(tiles)
+        return index
+
+    def _updateTileIndex(self, indexes, levelName=None):
+        """Update a level's TileIndex, if it has one, after tiles changed.
+        """
+        levelName = self._getDefaultName(levelName)
+        index = self.tileIndexes.get(levelName)
+        if index is not None and index.tiles is self.getTileData(levelName):
+            index.update(indexes)
+
+    def findTiles(self, value: str, levelName=None) -> List[int]:
+        """Return the indexes of the tiles of a level with a tile id, sprite
+        or type.
+        """
+        return self.getTileIndex(levelName).find(value).tolist()
+
+    def replaceTiles(self, value: str, new_value: str, levelNames=None) -> dict:
+        """Replace a tile id, sprite or type with another of the same kind in
+        levels (every level by default). Only the matching tiles are visited.
+
+        Return {levelName: (indexes, old tiles, new tiles)} of the levels
+        that changed.
+        """
+        key = get_tile_key(value)
+        if get_tile_key(new_value) != key:
+            raise ValueError(f'{value} and {new_value} are not the same kind of tile value')
+        replaced = {}
+        for levelName in levelNames or self.getLevelNames():
+            indexes = self.findTiles(value, levelName)
+            if not indexes or value == new_value:
+                continue
+            tiles = self.getTileData(levelName)
+            old = [tiles[i] for i in indexes]
+            new_ids = {tile: replace_tile(tile, key, new_value) for tile in set(old)}
+            new = [new_ids[tile] for tile in old]
+            for index, tile in zip(indexes, new):
+                tiles[index] = tile
+            self._updateTileIndex(indexes, levelName)
+            self.markDirty(levelName)
+            replaced[levelName] = (indexes, old, new)
+        return replaced
+
+    # =============
+    # LAYER METHODS
+    # =============
+    # Layer methods take layerName=None to mean the base layer (tileData).
+    def getLayers(self, levelName=None) -> List[dict]:
+        """Return the extra layers of a level in drawing order.
+        """
+        layers = self.getLevel(levelName).get(LAYERS_KEY, [])
+        for layer in layers:
+            unpack_layer(layer)
+        return layers
+
+    def getLayerNames(self, levelName=None) -> Tuple[str]:
+        return tuple(layer["name"] for layer in self.getLayers(levelName))
+
+    def getLayer(self, layerName: str, levelName=None) -> dict:
+        for layer in self.getLayers(levelName):
+            if layer["name"] == layerName:
+                return layer
+        raise KeyError(layerName)
+
+    def addLayer(self, layerName: str, levelName=None):
+        """Add an empty layer on top of the others.
+        """
+        levelName = self._getDefaultName(levelName)
+        width, height = self.getMapSize(1, levelName)
+        self.getLevel(levelName).setdefault(LAYERS_KEY, []).append(new_layer(layerName, width * height))
+        self.markDirty(levelName)
+
+    def removeLayer(self, layerName: str, levelName=None):
+        levelName = self._getDefaultName(levelName)
+        level = self.getLevel(levelName)
+        level[LAYERS_KEY].remove(self.getLayer(layerName, levelName))
+        if not level[LAYERS_KEY]:
+            del level[LAYERS_KEY]
+        self.markDirty(levelName)
+
+    def getLayerTiles(self, layerName=None, levelName=None) -> list:
+        if layerName is None:
+            return self.getTileData(levelName)
+        return self.getLayer(layerName, levelName)["tiles"]
+
+    def setLayerTiles(self, layerName, tiles: list, levelName=None):
+        if layerName is None:
+            self.setTileData(tiles, levelName)
+            return
+        levelName = self._getDefaultName(levelName)
+        self.getLayer(layerName, levelName)["tiles"] = tiles
+        self.markDirty(levelName)
+
+    def setLayerTilesAt(self, layerName, indexes: List[int], tiles: List[str], levelName=None):
+        """Set the tiles at indexes of a layer.
+        """
+        levelName = self._getDefaultName(levelName)
+        layerTiles = self.getLayerTiles(layerName, levelName)
+        for index, tile in zip(indexes, tiles):
+            layerTiles[index] = tile
+        if layerName is None:
+            self._updateTileIndex(indexes, levelName)
+        self.markDirty(levelName)
+
+    def setLayerTile(self, layerName, tile_index: int, sprite: str, levelName=None):
+        """Set a tile of an extra layer to a sprite ("x-y" or EMPTY_SPRITE).
+        """
+        levelName = self._getDefaultName(levelName)
+        self.getLayer(layerName, levelName)["tiles"][tile_index] = sprite
+        self.markDirty(levelName)
+
+    def fillLayer(self, layerName, tile_index: int, sprite: str, levelName=None, region=None):
+        """Flood fill the area of matching sprites around tile_index.
+
+        region is an optional list of the indexes the fill covers when
+        they're already known (see regions.py).
+        """
+        levelName = self._getDefaultName(levelName)
+        tiles = self.getLayer(layerName, levelName)["tiles"]
+        array_width, array_height = self.getMapSize(1, levelName)
+        source = tiles[tile_index]
+        if source == sprite:
+            return
+        if region is not None:
+            for tile_index in region:
+                tiles[tile_index] = sprite
+            self.markDirty(levelName)
+            return
+        stack = [tile_index]
+        while stack:
+            tile_index = stack.pop()
+            if tiles[tile_index] != source:
+                continue
+            tiles[tile_index] = sprite
+            x, y = self.get2DFrom1D(tile_index, array_width)
+            for nx, ny in ((x + 1, y), (x - 1, y), (x, y + 1), (x, y - 1)):
+                if 0 <= nx < array_width and 0 <= ny < array_height:
+                    stack.append(self.get1DFrom2D(nx, ny, array_width))
+        self.markDirty(levelName)
+
+    # ==============
+    # ENTITY METHODS
+    # ==============
+    def getEntities(self, levelName=None) -> EntityLayer:
+        """Return the entities of a level. The level's entity list is
+        swapped for an EntityLayer on first use.
+        """
+        level = self.getLevel(levelName)
+        entities = level.get(ENTITIES_KEY, [])
+        if not isinstance(entities, EntityLayer):
+            entities = EntityLayer(entities)
+            # Levels without entities are saved without the key.
+            if ENTITIES_KEY in level:
+                level[ENTITIES_KEY] = entities
+        return entities
+
+    def setEntities(self, entities: List[dict], levelName=None):
+        levelName = self._getDefaultName(levelName)
+        level = self.getLevel(levelName)
+        if entities:
+            level[ENTITIES_KEY] = EntityLayer(entities)
+        else:
+            level.pop(ENTITIES_KEY, None)
+        self.markDirty(levelName)
+
+    def addEntity(self, entity: dict, levelName=None) -> int:
+        """Add an entity and return its key in getEntities().
+        """
+        levelName = self._getDefaultName(levelName)
+        entities = self.getLevel(levelName).setdefault(ENTITIES_KEY, self.getEntities(levelName))
+        key = entities.add(entity)
+        self.markDirty(levelName)
+        return key
+
+    def removeEntities(self, keys: List[int], levelName=None):
+        levelName = self._getDefaultName(levelName)
+        entities = self.getEntities(levelName)
+        for key in keys:
+            entities.remove(key)
+        if not entities:
+            self.getLevel(levelName).pop(ENTITIES_KEY, None)
+        self.markDirty(levelName)
+
+    def setEntity(self, key: int, entity: dict, levelName=None):
+        """Replace an entity, keeping its place in the save order.
+        """
+        levelName = self._getDefaultName(levelName)
+        self.getEntities(levelName).set(key, entity)
+        self.markDirty(levelName)
+
+    def moveEntities(self, keys: List[int], dx: float, dy: float, levelName=None):
+        levelName = self._getDefaultName(levelName)
+        entities = self.getEntities(levelName)
+        for key in keys:
+            entity = entities.get(key)
+            entities.move(key, entity["x"] + dx, entity["y"] + dy)
+        self.markDirty(levelName)
+
+    def fillTiles(self, tile_index: int, new_id: str, levelName=None, fill_indexes=(0, cfg.TILE_ARRAY_SIZE), region=None):
         """Recursively fill the tiles of the array.
 
         levelName is an optional parameter to specify the level being filled. (default is active level).
@@ -132,7 +404,13 @@ class LevelData:
 
         If fill_indexes is not specified then the function just checks that the
         full ids are equal.
+
+        region is an optional list of the indexes the fill covers when they're
+        already known (see regions.py). They're replaced without searching.
         """
+        if region is not None:
+            self._fillRegion(tile_index, new_id, levelName, fill_indexes, region)
+            return
         array_width, array_height = self.getMapSize(1)
         fill_start, fill_end = fill_indexes
         source_id = None
@@ -173,10 +451,42 @@ class LevelData:
                     if can_fill(source_id, tile_id):
                         stack.append(tile_index)
 
+    def _fillRegion(self, tile_index: int, new_id: str, levelName, fill_indexes, region):
+        """Replace the tiles of a known fill region like fillTiles() would.
+        """
+        levelName = self._getDefaultName(levelName)
+        tiles = self.getTileData(levelName)
+        fill_start, fill_end = fill_indexes
+        new_id = new_id.split('-')
+        if tiles[tile_index].split('-')[2] == cfg.EMPTY_TILE_ID:
+            fill_start, fill_end = (0, cfg.TILE_ARRAY_SIZE)
+
+        replaced = {} # Old id: new id, a region has few different ids.
+        for tile_index in region:
+            tile_id = tiles[tile_index]
+            if tile_id not in replaced:
+                parts = tile_id.split('-')
+                parts[fill_start:fill_end] = new_id[fill_start:fill_end]
+                replaced[tile_id] = '-'.join(parts)
+            tiles[tile_index] = replaced[tile_id]
+        self._updateTileIndex(region, levelName)
+        self.markDirty(levelName)
+
     def resizeTileArray(self, anchorPoint: str, newWidth: int, newHeight: int):
+        """Resize tileData and every extra layer of the current level.
+        """
+        for layer in self.getLayers():
+            layer["tiles"] = self._resizeTiles(anchorPoint, layer["tiles"], newWidth, newHeight, EMPTY_SPRITE)
+        newTiles = self._resizeTiles(anchorPoint, self.getTileData(), newWidth, newHeight)
+        self.setHeight(newHeight)
+        self.setWidth(newWidth)
+
+        #Replace tiles
+        self.setTileData(newTiles)
+
+    def _resizeTiles(self, anchorPoint: str, tiles: list, newWidth: int, newHeight: int, empty=None) -> list:
         #These are variables needed to resize the level
         anchorPointSplit = anchorPoint.split()
-        tiles = self.getTileData()
         width = self.getWidth()
         height = self.getHeight()
         changeHeight = newHeight - height
@@ -189,12 +499,11 @@ class LevelData:
             if changeHeight < 0:
                 addTop, addBottom = addBottom, addTop
             topHeight = height + addTop
-            newTiles = self.resizeArray("Top", addTop, width, topHeight, tiles)
+            newTiles = self.resizeArray("Top", addTop, width, topHeight, tiles, empty)
             bottomHeight = height + addBottom
-            newTiles = self.resizeArray("Bottom", addBottom, width, bottomHeight, newTiles)
+            newTiles = self.resizeArray("Bottom", addBottom, width, bottomHeight, newTiles, empty)
         else:
-            newTiles = self.resizeArray(anchorPointSplit[0], changeHeight, width, newHeight, tiles)
-        self.setHeight(newHeight)
+            newTiles = self.resizeArray(anchorPointSplit[0], changeHeight, width, newHeight, tiles, empty)
 
         #Resize the width, resizing from the centre is done by resizing left then right
         if anchorPointSplit[1].capitalize() == "Centre":
@@ -203,17 +512,16 @@ class LevelData:
             if changeWidth < 0:
                 addRight, addLeft = addLeft, addRight
             leftWidth = width + addLeft
-            newTiles = self.resizeArray("Left", addLeft, newHeight, leftWidth, newTiles)
+            newTiles = self.resizeArray("Left", addLeft, newHeight, leftWidth, newTiles, empty)
             rightWidth = width + addRight + addLeft
-            newTiles = self.resizeArray("Right", addRight, newHeight, rightWidth, newTiles)
+            newTiles = self.resizeArray("Right", addRight, newHeight, rightWidth, newTiles, empty)
         else:
-            newTiles = self.resizeArray(anchorPointSplit[1], changeWidth, newHeight, newWidth, tiles)
-        self.setWidth(newWidth)
-
-        #Replace tiles
-        self.setTileData(newTiles)
+            newTiles = self.resizeArray(anchorPointSplit[1], changeWidth, newHeight, newWidth, newTiles, empty)
+        return newTiles
 
-    def resizeArray(self, anchorPoint: str, changeDim: int, dimension: int, newDim: int, tiles: list):
+    def resizeArray(self, anchorPoint: str, changeDim: int, dimension: int, newDim: int, tiles: list, empty=None):
+        if empty is None:
+            empty = '0-0-{}'.format(cfg.EMPTY_TILE_ID)
         #Create new array of new size
         newSize = dimension * newDim
         changeDifference = dimension * changeDim
@@ -222,9 +530,9 @@ class LevelData:
         #Check which side of level we are added tiles to
         if anchorPoint.capitalize() == "Top":
             newTiles[:len(tiles)] = tiles
-            newTiles[len(tiles):] = ['0-0-{}'.format(cfg.EMPTY_TILE_ID)] * changeDifference
+            newTiles[len(tiles):] = [empty] * changeDifference
         elif anchorPoint.capitalize() == "Bottom":
-            newTiles[:changeDifference] = ['0-0-{}'.format(cfg.EMPTY_TILE_ID)] * changeDifference
+            newTiles[:changeDifference] = [empty] * changeDifference
             if changeDifference < 0:
                 newTiles[changeDifference:] = tiles[abs(changeDifference):]
             else:
@@ -232,7 +540,7 @@ class LevelData:
         elif anchorPoint.capitalize() == "Right":
             for i in range(newSize):
                 if i % newDim < changeDim:
-                    newTiles[i] = '0-0-{}'.format(cfg.EMPTY_TILE_ID)
+                    newTiles[i] = empty
                 elif changeDim > 0:
                     newTiles[i] = tiles[i - abs(changeDim) * ((i // newDim) + 1)]
                 else:
@@ -240,7 +548,7 @@ class LevelData:
         else:
             for i in range(newSize):
                 if i % newDim >= newDim - changeDim:
-                    newTiles[i] = '0-0-{}'.format(cfg.EMPTY_TILE_ID)
+                    newTiles[i] = empty
                 elif changeDim > 0:
                     newTiles[i] = tiles[i - abs(changeDim) * (i // newDim)]
                 else:
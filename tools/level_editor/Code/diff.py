@@ -0,0 +1,229 @@
+# ==================================================================
+# diff.py compares level files level by level as tile grids instead
+# of as text.
+#
+# Rows are compared as whole slices first so only rows that actually
+# changed are looked at cell by cell. Changed cells are reported as
+# rectangles (see collision.merge_rects).
+# ==================================================================
+from typing import List, Optional
+import json
+
+from . import cfg
+from .collision import merge_rects, COLLISION_KEY
+from .entities import ENTITIES_KEY
+from .navigation import NAV_KEY, TARGETS_KEY
+
+TILE_KEY = 'tileData'
+# Baked from tileData on save so they are never diffed or merged.
+BAKED_KEYS = (COLLISION_KEY, NAV_KEY)
+# What the baked keys are computed from. See collision.py and navigation.py
+BAKE_SOURCE_KEYS = ('width', 'height', TILE_KEY, TARGETS_KEY, ENTITIES_KEY)
+# Keys with their own comparison.
+GRID_KEYS = ('width', 'height', TILE_KEY)
+
+
+def changed_cells(a: List[str], b: List[str], width: int, height: int) -> tuple:
+    """Return (grid, rows) where grid flags every cell that differs between
+    a and b and rows is the set of rows containing a change.
+    """
+    grid = [False] * (width * height)
+    rows = set()
+    if a == b:
+        return grid, rows
+    for y in range(height):
+        start = y * width
+        row_a = a[start:start + width]
+        row_b = b[start:start + width]
+        if row_a == row_b:
+            continue
+        rows.add(y)
+        for x in range(width):
+            if row_a[x] != row_b[x]:
+                grid[start + x] = True
+    return grid, rows
+
+def changed_rects(a: List[str], b: List[str], width: int, height: int) -> List[List[int]]:
+    grid, rows = changed_cells(a, b, width, height)
+    return merge_rects(grid, width, height, rows)
+
+def _other_keys(level: dict) -> set:
+    return set(level.keys()) - set(BAKED_KEYS) - set(GRID_KEYS)
+
+def diff_level(a: dict, b: dict) -> dict:
+    """Return the differences between two versions of a level. Empty if
+    they are the same.
+    """
+    result = {}
+    if (a['width'], a['height']) != (b['width'], b['height']):
+        result['size'] = ((a['width'], a['height']), (b['width'], b['height']))
+    else:
+        rects = changed_rects(a[TILE_KEY], b[TILE_KEY], a['width'], a['height'])
+        if rects:
+            result['tiles'] = rects
+    changed = sorted(k for k in _other_keys(a) | _other_keys(b) if a.get(k) != b.get(k))
+    if changed:
+        result['keys'] = {k: (a.get(k), b.get(k)) for k in changed}
+    return result
+
+def diff_files(a: dict, b: dict) -> dict:
+    """Return {'added': [...], 'removed': [...], 'changed': {level name: diff}}.
+    """
+    levels_a = a[cfg.LEVEL_KEY]
+    levels_b = b[cfg.LEVEL_KEY]
+    changed = {}
+    for name in levels_a.keys() & levels_b.keys():
+        result = diff_level(levels_a[name], levels_b[name])
+        if result:
+            changed[name] = result
+    return {
+        'added': [n for n in levels_b if n not in levels_a],
+        'removed': [n for n in levels_a if n not in levels_b],
+        'changed': changed
+    }
+
+def format_diff(diff: dict) -> str:
+    lines = [f'+ {name}' for name in diff['added']]
+    lines += [f'- {name}' for name in diff['removed']]
+    for name, result in diff['changed'].items():
+        lines.append(f'~ {name}')
+        if 'size' in result:
+            (w1, h1), (w2, h2) = result['size']
+            lines.append(f'    size {w1}x{h1} -> {w2}x{h2}')
+        for x, y, w, h in result.get('tiles', []):
+            lines.append(f'    tiles ({x}, {y}) {w}x{h}')
+        for key, (old, new) in result.get('keys', {}).items():
+            lines.append(f'    {key}: {_short(old)} -> {_short(new)}')
+    return '\n'.join(lines) if lines else 'No differences.'
+
+def _short(value, limit: int = 60) -> str:
+    text = json.dumps(value)
+    return text if len(text) <= limit else text[:limit - 3] + '...'
+
+
+# =====================
+# THREE-WAY MERGE
+# =====================
+def _merge_value(base, ours, theirs) -> tuple:
+    """Return (merged value, True if both sides changed it differently).
+    Conflicts keep our value.
+    """
+    if ours == theirs or theirs == base:
+        return ours, False
+    if ours == base:
+        return theirs, False
+    return ours, True
+
+def merge_tiles(base: List[str], ours: List[str], theirs: List[str], width: int, height: int) -> tuple:
+    """Cell-level three-way merge. Return (tiles, conflict rects).
+    Conflicting cells keep our tile.
+    """
+    if ours == theirs or theirs == base:
+        return list(ours), []
+    if ours == base:
+        return list(theirs), []
+
+    merged = []
+    conflicts = [False] * (width * height)
+    conflict_rows = set()
+    for y in range(height):
+        start = y * width
+        row_base = base[start:start + width]
+        row_ours = ours[start:start + width]
+        row_theirs = theirs[start:start + width]
+        row, conflict = _merge_value(row_base, row_ours, row_theirs)
+        if not conflict:
+            merged += row
+            continue
+
+        for x in range(width):
+            tile, conflict = _merge_value(row_base[x], row_ours[x], row_theirs[x])
+            merged.append(tile)
+            if conflict:
+                conflicts[start + x] = True
+                conflict_rows.add(y)
+    return merged, merge_rects(conflicts, width, height, conflict_rows)
+
+def merge_level(base: Optional[dict], ours: dict, theirs: dict) -> tuple:
+    """Return (merged level, list of conflict descriptions).
+    """
+    if base is None:
+        base = {}
+    conflicts = []
+    merged = {}
+    for key in list(ours.keys()) + [k for k in theirs if k not in ours]:
+        if key in BAKED_KEYS or key in GRID_KEYS:
+            continue
+        value, conflict = _merge_value(base.get(key), ours.get(key), theirs.get(key))
+        if conflict:
+            conflicts.append(f'{key} changed on both sides')
+        if value is not None:
+            merged[key] = value
+
+    sizes = [(l.get('width'), l.get('height')) for l in (base, ours, theirs)]
+    size, conflict = _merge_value(*sizes)
+    tiles = ours[TILE_KEY]
+    if conflict:
+        conflicts.append(f'resized on both sides ({sizes[1][0]}x{sizes[1][1]} vs {sizes[2][0]}x{sizes[2][1]})')
+    elif sizes[0] == sizes[1] == sizes[2]:
+        tiles, rects = merge_tiles(base[TILE_KEY], ours[TILE_KEY], theirs[TILE_KEY], *size)
+        conflicts += [f'tiles ({x}, {y}) {w}x{h} changed on both sides' for x, y, w, h in rects]
+    elif sizes[1] == sizes[2]:
+        # Both sides made the same size change (or added the level), so
+        # there is no common base for the cells. Any difference conflicts.
+        rects = changed_rects(ours[TILE_KEY], theirs[TILE_KEY], *size)
+        conflicts += [f'tiles ({x}, {y}) {w}x{h} differ' for x, y, w, h in rects]
+    else:
+        # Only one side resized so cells can't be matched up. Take that side
+        # unless the other one edited tiles too, then keep ours.
+        resized, other = (ours, theirs) if sizes[1] != sizes[0] else (theirs, ours)
+        if other[TILE_KEY] != base[TILE_KEY]:
+            conflicts.append('resized on one side and edited on the other')
+            size = sizes[1]
+        else:
+            tiles = resized[TILE_KEY]
+
+    merged['width'], merged['height'] = size
+    merged[TILE_KEY] = list(tiles)
+    # Keep the usual key order (tileData after the level settings).
+    ordered = {k: merged[k] for k in ours if k in merged}
+    ordered.update(merged)
+    # A side whose tiles, targets and entities were taken as they are
+    # still has the right baked data. See get_unbaked_levels()
+    for side in (ours, theirs):
+        if all(ordered.get(key) == side.get(key) for key in BAKE_SOURCE_KEYS):
+            ordered.update((key, side[key]) for key in BAKED_KEYS if key in side)
+            break
+    return ordered, conflicts
+
+def merge_files(base: dict, ours: dict, theirs: dict) -> tuple:
+    """Three-way merge of level files. Return (merged file, {level name: conflicts}).
+    """
+    levels_base = base[cfg.LEVEL_KEY]
+    levels_ours = ours[cfg.LEVEL_KEY]
+    levels_theirs = theirs[cfg.LEVEL_KEY]
+    merged = {}
+    conflicts = {}
+    for name in list(levels_ours.keys()) + [n for n in levels_theirs if n not in levels_ours]:
+        b = levels_base.get(name)
+        o = levels_ours.get(name)
+        t = levels_theirs.get(name)
+        if o is None or t is None:
+            # Deleted on one side. Keep the deletion unless the other side edited it.
+            kept = o if o is not None else t
+            if b is None:
+                merged[name] = kept
+            elif diff_level(b, kept):
+                merged[name] = kept
+                conflicts[name] = ['deleted on one side and edited on the other']
+            continue
+        merged[name], level_conflicts = merge_level(b, o, t)
+        if level_conflicts:
+            conflicts[name] = level_conflicts
+    return {**ours, cfg.LEVEL_KEY: merged}, conflicts
+
+def get_unbaked_levels(file: dict) -> List[str]:
+    """Return the names of the levels of a merged file that need their
+    collision and navigation data baked again.
+    """
+    return [name for name, level in file[cfg.LEVEL_KEY].items() if not all(key in level for key in BAKED_KEYS)]
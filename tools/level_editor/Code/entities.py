@@ -0,0 +1,155 @@
+# ==================================================================
+# entities.py handles a level's object layer: free-positioned
+# entities such as spawn points, NPCs and triggers.
+#
+# In a level file "entities" is a list of objects with a "name" (the
+# entity type, see Scene.createEntity() in logic.js), the "x" and "y"
+# of the entity's centre in pixels and any other properties, e.g.
+#   {"name": "anna", "x": 464, "y": 464, "direction": "down", "id": "anna"}
+# Every key other than name and id overrides one of the entity's
+# attributes when the game loads the level.
+#
+# In the editor the list is replaced by an EntityLayer, which keeps
+# the entities in a grid of buckets so looking up the ones under the
+# mouse or inside a rectangle only touches the buckets around it.
+# ==================================================================
+from typing import Iterable, List, Optional, Tuple
+import math
+
+from . import cfg
+
+ENTITIES_KEY = 'entities'
+BUCKET_SIZE = cfg.TILESIZE * 4 # Width and height of a bucket in pixels.
+
+
+def get_entity_bounds(entity: dict) -> Tuple[float, float, float, float]:
+    """Return the (x, y, width, height) an entity covers in the editor.
+    Entities without a width and height are drawn a tile wide.
+    """
+    width = entity.get('width', cfg.TILESIZE)
+    height = entity.get('height', cfg.TILESIZE)
+    return entity['x'] - width / 2, entity['y'] - height / 2, width, height
+
+
+class EntityLayer:
+    """The entities of a level with a spatial index over them.
+
+    Entities are referred to by keys handed out as they're added. Keys
+    only grow so iterating in key order (used for drawing and saving)
+    keeps the order of the level file followed by newer entities, no
+    matter how entities were moved around the buckets.
+    """
+    def __init__(self, entities: Iterable[dict] = ()):
+        self.entities = {} # key: entity
+        self.buckets = {} # (column, row): set of keys
+        self.entityBuckets = {} # key: buckets the entity is in
+        self.nextKey = 0
+        for entity in entities:
+            self.add(entity)
+
+    def __len__(self) -> int:
+        return len(self.entities)
+
+    def __iter__(self):
+        return iter(self.entities.values())
+
+    def _getBucketRange(self, x: float, y: float, width: float, height: float) -> Tuple[int, int, int, int]:
+        """Return the first and last column and row of the buckets a
+        rectangle is in.
+        """
+        left, top = math.floor(x / BUCKET_SIZE), math.floor(y / BUCKET_SIZE)
+        # Edges touching the next bucket don't put a rectangle in it.
+        right = max(left, math.ceil((x + width) / BUCKET_SIZE) - 1)
+        bottom = max(top, math.ceil((y + height) / BUCKET_SIZE) - 1)
+        return left, top, right, bottom
+
+    def _getBuckets(self, x: float, y: float, width: float, height: float) -> List[tuple]:
+        left, top, right, bottom = self._getBucketRange(x, y, width, height)
+        return [(column, row) for row in range(top, bottom + 1) for column in range(left, right + 1)]
+
+    def _insert(self, key: int):
+        buckets = self._getBuckets(*get_entity_bounds(self.entities[key]))
+        for bucket in buckets:
+            self.buckets.setdefault(bucket, set()).add(key)
+        self.entityBuckets[key] = buckets
+
+    def _discard(self, key: int):
+        for bucket in self.entityBuckets.pop(key):
+            keys = self.buckets[bucket]
+            keys.discard(key)
+            if not keys:
+                del self.buckets[bucket]
+
+    def add(self, entity: dict) -> int:
+        """Add an entity and return its key.
+        """
+        key = self.nextKey
+        self.nextKey += 1
+        self.entities[key] = entity
+        self._insert(key)
+        return key
+
+    def remove(self, key: int) -> dict:
+        self._discard(key)
+        return self.entities.pop(key)
+
+    def get(self, key: int) -> dict:
+        return self.entities[key]
+
+    def getKeys(self) -> List[int]:
+        return list(self.entities)
+
+    def set(self, key: int, entity: dict):
+        """Replace the entity at key.
+        """
+        self._discard(key)
+        self.entities[key] = entity
+        self._insert(key)
+
+    def move(self, key: int, x: float, y: float):
+        entity = dict(self.entities[key], x=x, y=y)
+        self.set(key, entity)
+
+    def query(self, x: float, y: float, width: float, height: float) -> List[int]:
+        """Return the keys of the entities overlapping a rectangle in key
+        order.
+        """
+        found = set()
+        left, top, right, bottom = self._getBucketRange(x, y, width, height)
+        if (right - left + 1) * (bottom - top + 1) > len(self.buckets):
+            # A rectangle over more buckets than are in use, e.g. the whole
+            # level, only looks at the ones in use.
+            for (column, row), keys in self.buckets.items():
+                if left <= column <= right and top <= row <= bottom:
+                    found.update(keys)
+        else:
+            for bucket in self._getBuckets(x, y, width, height):
+                found.update(self.buckets.get(bucket, ()))
+
+        keys = []
+        for key in found:
+            ex, ey, ew, eh = get_entity_bounds(self.entities[key])
+            if ex < x + width and x < ex + ew and ey < y + height and y < ey + eh:
+                keys.append(key)
+        keys.sort()
+        return keys
+
+    def hitTest(self, x: float, y: float) -> Optional[int]:
+        """Return the key of the topmost (last drawn) entity at a point or
+        None if there isn't one.
+        """
+        keys = self.query(x, y, 1e-6, 1e-6)
+        return keys[-1] if keys else None
+
+    def toList(self) -> List[dict]:
+        """Return copies of the entities in the order they're saved.
+        """
+        return [dict(entity) for entity in self.entities.values()]
+
+
+def get_entity_list(entities) -> List[dict]:
+    """Return a level's entities (a list or an EntityLayer) as a list.
+    """
+    if isinstance(entities, EntityLayer):
+        return entities.toList()
+    return entities
@@ -4,9 +4,14 @@
 
 from typing import Dict, Union
 import shutil, os
-import json, re
+import json, re, hashlib
 
 from . import cfg
+from . import collision, navigation
+from .collision import COLLISION_KEY
+from .binary import is_binary_level, load_level_binary, write_level_binary
+from .entities import ENTITIES_KEY, get_entity_list
+from .layers import LAYERS_KEY, pack_layers
 
 def file_exists(filename: str) -> bool:
     return os.path.isfile(filename)
@@ -14,17 +19,37 @@ def file_exists(filename: str) -> bool:
 def get_filename_from_path(full_path: str) -> bool:
     return os.path.basename(full_path)
 
-def load_stylesheet(filename: str) -> str:
-    """Load and return a qss file. Converts calls to color variables
-    in cfg.py to their actual values.
-    """
-    f = open(filename, 'r').read()
+def _process_stylesheet(f: str) -> str:
     pattern = re.compile(r'cfg\.colors\[.*\]')
     for match in set(pattern.findall(f)):
         color = match[match.index('[\'') + 2: match.index('\']')]
         f = f.replace(match, cfg.colors[color])
     return f
 
+def load_stylesheet(filename: str) -> str:
+    """Load and return a qss file. Converts calls to color variables
+    in cfg.py to their actual values.
+
+    The processed stylesheet is cached in cfg.cache_dir and reused until
+    the qss file or cfg.colors changes.
+    """
+    key = f'/* {os.path.getmtime(filename)} {hashlib.sha1(repr(sorted(cfg.colors.items())).encode()).hexdigest()} */\n'
+    cache_file = os.path.join(cfg.cache_dir, os.path.basename(filename))
+    if file_exists(cache_file):
+        with open(cache_file, 'r') as f:
+            if f.readline() == key:
+                return f.read()
+
+    with open(filename, 'r') as f:
+        stylesheet = _process_stylesheet(f.read())
+    try:
+        os.makedirs(cfg.cache_dir, exist_ok=True)
+        with open(cache_file, 'w') as f:
+            f.write(key + stylesheet)
+    except OSError as e:
+        print(f'Could not cache stylesheet: {e}')
+    return stylesheet
+
 def load_json(filename: str) -> Union[Dict, None]:
     """Load a json file using python's json library.
     If an error occurs while loading, None is returned.
@@ -38,49 +63,242 @@ def load_json(filename: str) -> Union[Dict, None]:
         return None
 
 def _get_pretty_tile_data(level_name: str, file: dict, indent: int) -> str:
-    """Return a string representation of a level's tileData in a
-    more readable format.
+    """Return a string representation of a level's tileData array in a
+    more readable format (one row of the map per line).
     """
     level_data = file[cfg.LEVEL_KEY][level_name]
     width = level_data["width"]
-    height = level_data["height"]
     tile_data = level_data["tileData"]
     # If formatted properly, tileData should be 3 levels in.
-    S = '"tileData": ['
-    for index in range(width * height):
-        if index % width == 0:
-            S += '\n' + ' ' * (indent * 4)
+    rows = []
+    for index in range(0, len(tile_data), width):
+        rows.append(' ' * (indent * 4) + ', '.join('"' + tile + '"' for tile in tile_data[index:index + width]))
+    return '[\n' + ',\n'.join(rows) + '\n' + ' ' * (indent * 3) + ']'
 
-        S += '"' + tile_data[index] + '"'
+def _get_pretty_list(items: list, indent: int) -> str:
+    """Return a string representation of a list with one compact item per
+    line. Used for collisionRects, entities and layers.
+    """
+    if not items:
+        return '[]'
+    rows = [' ' * (indent * 4) + json.dumps(item, ensure_ascii=False) for item in items]
+    return '[\n' + ',\n'.join(rows) + '\n' + ' ' * (indent * 3) + ']'
 
-        if index != (width * height) - 1: # last index in array
-            S += ', '
 
-    S += '\n' + ' ' * (indent * 3) + ']'
-    return S
+INDENTATION = 2
+# {absolute path: (signature, header, {level name: (start, end)})} for every
+# level file this process loaded or wrote. Used to splice dirty levels into
+# the file without re-encoding the rest of it.
+_level_spans = {}
+_decoder = json.JSONDecoder()
+_WHITESPACE = re.compile(r'\s*')
 
+def _get_signature(filename: str) -> tuple:
+    stat = os.stat(filename)
+    return stat.st_size, stat.st_mtime_ns
 
-def write_level_json(filename: str, file: dict):
-    """Write the contents of file to filename's path.
+def _get_header(file: dict) -> str:
+    """Return everything in file but the levels themselves. Splicing is only
+    possible while this and the level order are unchanged.
+    """
+    return json.dumps({key: (list(value) if key == cfg.LEVEL_KEY else value) for key, value in file.items()})
 
-    Precondition: file dict is properly formatted.
+def _remember_spans(filename: str, file: dict, spans: dict):
+    _level_spans[os.path.abspath(filename)] = (_get_signature(filename), _get_header(file), spans)
+
+def _skip(text: str, pos: int, char=None) -> int:
+    """Skip whitespace (and char if given) starting at pos.
+    """
+    pos = _WHITESPACE.match(text, pos).end()
+    if char is not None:
+        if text[pos] != char:
+            raise ValueError(f'Expecting {char!r}: char {pos}')
+        pos = _WHITESPACE.match(text, pos + 1).end()
+    return pos
+
+def _parse_object(text: str, pos: int, parse_value) -> tuple:
+    """Parse the json object starting at pos. Each value is parsed with
+    parse_value(key, pos) -> (value, end). Return (dict, end).
+    """
+    obj = {}
+    pos = _skip(text, pos, '{')
+    while text[pos] != '}':
+        key, pos = _decoder.raw_decode(text, pos)
+        pos = _skip(text, pos, ':')
+        obj[key], pos = parse_value(key, _skip(text, pos))
+        pos = _skip(text, pos)
+        if text[pos] != '}':
+            pos = _skip(text, pos, ',')
+    return obj, pos + 1
+
+def load_level_json(filename: str) -> Union[Dict, None]:
+    """Same as load_json() but also remembers where each level is in the
+    file so later saves only have to rewrite the levels that changed.
+    """
+    spans = {}
+    def parse_level(name: str, pos: int) -> tuple:
+        level, end = _decoder.raw_decode(text, pos)
+        spans[name] = (pos, end)
+        return level, end
+
+    def parse_value(key: str, pos: int) -> tuple:
+        if key == cfg.LEVEL_KEY:
+            return _parse_object(text, pos, parse_level)
+        return _decoder.raw_decode(text, pos)
+
+    try:
+        with open(filename, 'r', encoding='utf-8', newline='') as f:
+            text = f.read()
+        file, _ = _parse_object(text, _skip(text, 0), parse_value)
+    except Exception as e:
+        print(f'Error while opening {filename}\nError message: {e}')
+        return None
+    if isinstance(file.get(cfg.LEVEL_KEY), dict):
+        _remember_spans(filename, file, spans)
+    return file
+
+def _encode_level(level_name: str, file: dict) -> str:
+    """Return the text of a single level as it appears in a level file.
+    """
+    # Arrays are swapped for placeholders so they can be written in a more
+    # readable format after the rest of the level is encoded.
+    arrays = {}
+    def placeholder(text: str) -> str:
+        key = f'@@{len(arrays)}@@'
+        arrays[f'"{key}"'] = text
+        return key
+
+    level = file[cfg.LEVEL_KEY][level_name]
+    out = {}
+    for key, value in level.items():
+        if key == 'tileData':
+            out[key] = placeholder(_get_pretty_tile_data(level_name, file, INDENTATION))
+            out[COLLISION_KEY] = placeholder(_get_pretty_list(level[COLLISION_KEY], INDENTATION))
+        elif key == ENTITIES_KEY:
+            out[key] = placeholder(_get_pretty_list(get_entity_list(value), INDENTATION))
+        elif key == LAYERS_KEY:
+            out[key] = placeholder(_get_pretty_list(pack_layers(value), INDENTATION))
+        elif key != COLLISION_KEY:
+            out[key] = value
+
+    # Levels are nested two objects deep in the file.
+    text = json.dumps(out, ensure_ascii=False, indent=INDENTATION)
+    text = text.replace('\n', '\n' + ' ' * (INDENTATION * 2))
+    for key, array in arrays.items():
+        text = text.replace(key, array, 1)
+    return text
+
+def _write_full(filename: str, file: dict):
+    levels = file[cfg.LEVEL_KEY]
+    placeholders = {level_name: f'@@{i}@@' for i, level_name in enumerate(levels)}
+    skeleton = json.dumps({**file, cfg.LEVEL_KEY: placeholders}, ensure_ascii=False, indent=INDENTATION)
+
+    parts = []
+    spans = {}
+    pos = 0
+    length = 0
+    for level_name, key in placeholders.items():
+        index = skeleton.index(f'"{key}"', pos)
+        parts.append(skeleton[pos:index])
+        length += index - pos
+        text = _encode_level(level_name, file)
+        parts.append(text)
+        spans[level_name] = (length, length + len(text))
+        length += len(text)
+        pos = index + len(key) + 2
+    parts.append(skeleton[pos:] + '\n')
+
+    with open(filename, 'w', encoding='utf-8', newline='') as f: # Write contents to file.
+        f.write(''.join(parts))
+    _remember_spans(filename, file, spans)
+
+def _get_saved_spans(filename: str, file: dict) -> Union[Dict, None]:
+    """Return where each level is in the saved file or None if the file
+    can't be spliced (never loaded or written here, changed on disk since
+    or file has been restructured).
     """
-    INDENTATION = 2
-    # this puts the whole file in memory but the files probably won't be crazy large.
-    pretty_string = json.dumps(file, ensure_ascii=False, indent=INDENTATION)
+    saved = _level_spans.get(os.path.abspath(filename))
+    if saved is None or not file_exists(filename):
+        return None
+    signature, header, spans = saved
+    if signature != _get_signature(filename) or header != _get_header(file):
+        return None
+    return spans
 
-    # prettify how arrays are displayed.
-    for level_name in list(file[cfg.LEVEL_KEY].keys()):
-        file_pattern = re.compile(f'"{level_name}"' + r':[^\]]*]')
-        level_match = file_pattern.search(pretty_string).group()
-        array_pattern = re.compile(r'"tileData": \[[^\]]*]', re.S)
+def _write_dirty(filename: str, file: dict, dirty: set, spans: dict):
+    """Replace the text of the dirty levels in the saved file and copy
+    everything else as it is.
+    """
+    with open(filename, 'r', encoding='utf-8', newline='') as f:
+        old = f.read()
+    parts = []
+    new_spans = {}
+    pos = 0
+    shift = 0
+    for level_name, (start, end) in spans.items():
+        if level_name not in dirty:
+            new_spans[level_name] = (start + shift, end + shift)
+            continue
+        text = _encode_level(level_name, file)
+        parts += [old[pos:start], text]
+        new_spans[level_name] = (start + shift, start + shift + len(text))
+        shift += len(text) - (end - start)
+        pos = end
+    parts.append(old[pos:])
+
+    with open(filename, 'w', encoding='utf-8', newline='') as f:
+        f.write(''.join(parts))
+    _remember_spans(filename, file, new_spans)
 
-        array_width = int(file[cfg.LEVEL_KEY][level_name]["width"])
-        array_height = int(file[cfg.LEVEL_KEY][level_name]["height"])
+def _bake(file: dict, level_names=None) -> str:
+    report = collision.format_report(collision.update_collision_rects(file, level_names))
+    return report + '\n' + navigation.format_report(navigation.update_navigation(file, level_names))
 
-        tile_data = array_pattern.search(level_match).group()
-        pretty_tile_data = _get_pretty_tile_data(level_name, file, INDENTATION)
+def write_level_json(filename: str, file: dict, dirty=None, unbaked=None) -> str:
+    """Write the contents of file to filename's path.
 
-        pretty_string = pretty_string.replace(tile_data, pretty_tile_data)
+    The baked data of every level (collision rectangles and navigation
+    fields) is recomputed first, or only that of the levels in unbaked
+    if given. Return a report of what was baked.
 
-    open(filename, 'w').write(pretty_string) # Write contents to file.
+    If dirty (a set of level names) is given and the file was loaded or
+    written with this module, only those levels are rebaked and re-encoded;
+    the rest of the saved file is copied as it is. Nothing is written (and
+    '' returned) when dirty is empty.
+
+    Precondition: file dict is properly formatted.
+    """
+    spans = _get_saved_spans(filename, file) if dirty is not None else None
+    if spans is None:
+        report = _bake(file, unbaked)
+        _write_full(filename, file)
+    elif dirty:
+        report = _bake(file, dirty)
+        _write_dirty(filename, file, dirty, spans)
+    else:
+        report = ''
+    return report
+
+def load_level_file(filename: str) -> Union[Dict, None]:
+    """Load a level .json file or binary level container (see binary.py).
+    If an error occurs while loading, None is returned.
+    """
+    if not is_binary_level(filename):
+        return load_level_json(filename)
+    try:
+        return load_level_binary(filename)
+    except Exception as e:
+        print(f'Error while opening {filename}\nError message: {e}')
+        return None
+
+def write_level_file(filename: str, file: dict, dirty=None) -> str:
+    """Write file as json or a binary level container depending on the
+    extension of filename. Return a report of what was written.
+
+    Binary containers are always written whole and nothing is baked
+    into them; that happens when they are converted to json.
+    """
+    if not is_binary_level(filename):
+        return write_level_json(filename, file, dirty)
+    write_level_binary(filename, file)
+    return f'Wrote {len(file[cfg.LEVEL_KEY])} level(s) to {get_filename_from_path(filename)}'
@@ -0,0 +1,421 @@
+# ==================================================================
+# journal.py keeps a write-ahead journal of the edits made to a level
+# file so they can be recovered if the editor crashes, and serves the
+# undo/redo history from it.
+#
+# The journal sits next to the level file (<file>.journal) or in
+# cfg.cache_dir before the file is first saved. It's a series of
+# records, each a 4 byte big endian length followed by a zlib
+# compressed json object. Every record has a "kind":
+#   open   the journal was started for "file" (null if unsaved), whose
+#          [size, mtime] was "stamp"
+#   save   the edits so far were saved to "file", now with "stamp"
+#   do     an edit of a level's tiles, with "layer" (null for the base
+#          layer) and "tiles" (see _pack_tiles()) or of its entities,
+#          with "entities", [old list, new list]
+#   undo, redo   the edit at offset "ref" was undone or redone
+#   level  "data" is the whole of a level after a change the history
+#          doesn't cover (adding a level or layer, resizing, ...)
+#   clear  the undo history was cleared
+#
+# Recovering replays the records after the last open or save on top of
+# the saved file. The undo history in memory is only the offsets of
+# "do" records plus a cache of the last few used, the rest are read
+# back from the journal.
+#
+# Once a save leaves more than cfg.JOURNAL_COMPACT_SIZE bytes of
+# records the history no longer needs (and more than it does need),
+# the journal is rewritten with just the "do" records of the history,
+# the "undo" records of the edits that can be redone and the "save".
+# A journal with unsaved edits that weren't recovered is moved to
+# <journal>.bak rather than overwritten by the level's next journal.
+# ==================================================================
+from array import array
+from collections import OrderedDict
+from typing import Iterator, List, Optional, Tuple
+import base64, json, os, shutil, struct, zlib
+
+import numpy as np
+
+from . import cfg
+from .data import LevelData
+from .entities import ENTITIES_KEY, get_entity_list
+from .layers import LAYERS_KEY, pack_layers
+
+JOURNAL_EXT = '.journal'
+BACKUP_EXT = '.bak'
+UNTITLED_JOURNAL = os.path.join(cfg.cache_dir, 'untitled' + JOURNAL_EXT)
+# Holds the path of the journal of the running editor so the next launch
+# can find it if it wasn't closed properly.
+LAST_JOURNAL_FILE = os.path.join(cfg.cache_dir, 'last_journal.txt')
+EDIT_KINDS = ('do', 'undo', 'redo', 'level')
+_header = struct.Struct('>I')
+
+
+def get_journal_path(levelFile: Optional[str]) -> str:
+    return levelFile + JOURNAL_EXT if levelFile else UNTITLED_JOURNAL
+
+
+def get_last_journal() -> Optional[str]:
+    try:
+        with open(LAST_JOURNAL_FILE, encoding='utf-8') as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def _get_stamp(levelFile: Optional[str]) -> Optional[list]:
+    if not levelFile:
+        return None
+    try:
+        stat = os.stat(levelFile)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+def _encode(record: dict) -> bytes:
+    data = zlib.compress(json.dumps(record, separators=(',', ':')).encode('utf-8'))
+    return _header.pack(len(data)) + data
+
+def _read_record(f) -> Optional[dict]:
+    """Read the record at f's position or return None at the end of the
+    journal or at a record cut off by a crash.
+    """
+    header = f.read(_header.size)
+    if len(header) < _header.size:
+        return None
+    size, = _header.unpack(header)
+    data = f.read(size)
+    if len(data) < size:
+        return None
+    try:
+        return json.loads(zlib.decompress(data))
+    except (zlib.error, ValueError):
+        return None
+
+def read_records(journalPath: str) -> Iterator[Tuple[int, dict, int]]:
+    """Yield the (offset, record, end offset) of each record of a journal
+    up to its first damaged record.
+    """
+    with open(journalPath, 'rb') as f:
+        while True:
+            offset = f.tell()
+            record = _read_record(f)
+            if record is None:
+                return
+            yield offset, record, f.tell()
+
+def _encode_array(values, count: int) -> str:
+    return base64.b64encode(np.fromiter(values, dtype='<u4', count=count).tobytes()).decode('ascii')
+
+def _decode_array(text: str) -> list:
+    return np.frombuffer(base64.b64decode(text), dtype='<u4').tolist()
+
+def _pack_tiles(indexes: list, oldTiles: list, newTiles: list) -> dict:
+    """Return tile changes in the compact form they're journaled and
+    cached in. Like a packed layer (see layers.py) the tiles are indexes
+    into a dictionary of the distinct tiles, so an edit of the whole
+    level takes a few bytes per tile.
+    """
+    lookup = {}
+    count = len(indexes)
+    old = _encode_array((lookup.setdefault(tile, len(lookup)) for tile in oldTiles), count)
+    new = _encode_array((lookup.setdefault(tile, len(lookup)) for tile in newTiles), count)
+    return {'indexes': _encode_array(indexes, count), 'dictionary': list(lookup), 'old': old, 'new': new}
+
+def _unpack_tiles(tiles: dict) -> Tuple[list, list, list]:
+    """Return the indexes, old tiles and new tiles of packed changes.
+    """
+    dictionary = tiles['dictionary']
+    return (_decode_array(tiles['indexes']), [dictionary[i] for i in _decode_array(tiles['old'])],
+        [dictionary[i] for i in _decode_array(tiles['new'])])
+
+def get_level_snapshot(level: dict) -> dict:
+    """Return a copy of a level in its file format for a "level" record.
+    """
+    snapshot = dict(level, tileData=list(level['tileData']))
+    if ENTITIES_KEY in level:
+        snapshot[ENTITIES_KEY] = get_entity_list(level[ENTITIES_KEY])
+    if LAYERS_KEY in level:
+        snapshot[LAYERS_KEY] = pack_layers(level[LAYERS_KEY])
+    return snapshot
+
+def apply_edit(levelData: LevelData, record: dict, undo=False) -> Optional[List[int]]:
+    """Make (or with undo, revert) the edit of a "do" record. Return the
+    indexes of the tiles changed or None for an entity edit.
+    """
+    levelName = record['level']
+    if 'entities' in record:
+        levelData.setEntities(record['entities'][0 if undo else 1], levelName)
+        return None
+    indexes, old, new = _unpack_tiles(record['tiles'])
+    levelData.setLayerTilesAt(record['layer'], indexes, old if undo else new, levelName)
+    return indexes
+
+
+class JournalState:
+    """What replaying a journal found. See check_journal().
+    """
+    def __init__(self, journalPath: str):
+        self.journalPath = journalPath
+        self.levelFile = None
+        self.stamp = None
+        self.start = 0 # Index in records of the first edit not saved.
+        self.records = [] # (offset, record) of the whole journal.
+        self.end = 0 # Offset after the last undamaged record.
+
+    def getUnsavedCount(self) -> int:
+        return sum(record['kind'] in EDIT_KINDS for _, record in self.records[self.start:])
+
+    def isCurrent(self) -> bool:
+        """Return whether the level file is as the journal last saw it.
+        """
+        return _get_stamp(self.levelFile) == self.stamp
+
+
+def check_journal(journalPath: Optional[str]) -> Optional[JournalState]:
+    """Read a journal left behind by the editor. Return None if there's
+    nothing in it to recover.
+    """
+    if not journalPath or not os.path.exists(journalPath):
+        return None
+    state = JournalState(journalPath)
+    for offset, record, state.end in read_records(journalPath):
+        if record['kind'] in ('open', 'save'):
+            state.levelFile = record['file']
+            state.stamp = record['stamp']
+            state.start = len(state.records) + 1
+        state.records.append((offset, record))
+    return state if state.getUnsavedCount() else None
+
+def replay_journal(state: JournalState, file: dict) -> Tuple[set, array, array]:
+    """Replay the unsaved edits of a journal on file, the level file as
+    it was last saved. Return the names of the levels changed and the
+    undo and redo stacks of offsets.
+    """
+    levelData = None
+    changed = set()
+    undoStack, redoStack = array('q'), array('q')
+    byOffset = dict(state.records)
+    for i, (offset, record) in enumerate(state.records):
+        kind = record['kind']
+        replay = i >= state.start
+        if kind == 'clear':
+            del undoStack[:], redoStack[:]
+        elif kind == 'level' and replay:
+            file[cfg.LEVEL_KEY][record['level']] = record['data']
+            changed.add(record['level'])
+        elif kind in ('do', 'undo', 'redo'):
+            if kind == 'do':
+                undoStack.append(offset)
+                del redoStack[:]
+                edit = record
+            else:
+                source, dest = (undoStack, redoStack) if kind == 'undo' else (redoStack, undoStack)
+                dest.append(source.pop())
+                edit = byOffset[record['ref']]
+            if replay:
+                if levelData is None:
+                    levelData = LevelData(file)
+                apply_edit(levelData, edit, undo=kind == 'undo')
+                changed.add(edit['level'])
+    return changed, undoStack, redoStack
+
+def backup_journal(journalPath: str) -> Optional[str]:
+    """Move a journal with unsaved edits to <journal>.bak, replacing an
+    older backup, so a new journal doesn't overwrite them. Return the
+    backup's path or None if there was nothing to keep.
+    """
+    if check_journal(journalPath) is None:
+        return None
+    backupPath = journalPath + BACKUP_EXT
+    os.replace(journalPath, backupPath)
+    return backupPath
+
+
+class EditHistory:
+    """The undo and redo history of the open level file, written to its
+    journal as edits are made.
+
+    Only the journal offsets of edits are kept in memory with the last
+    cacheSize edits used, so memory use doesn't grow with the length of
+    the session however far back undo goes.
+    """
+    def __init__(self, cacheSize: int = cfg.HISTORY_CACHE_SIZE):
+        self.cacheSize = cacheSize
+        self.journal = None
+        self.journalPath = None
+        self.undoStack = array('q')
+        self.redoStack = array('q')
+        self.cache = OrderedDict() # offset: record
+
+    def start(self, levelFile: Optional[str]):
+        """Start a new journal for a level file just opened or created. A
+        journal already there with unsaved edits is moved to its backup
+        path rather than overwritten.
+        """
+        self.close(delete=False)
+        journalPath = get_journal_path(levelFile)
+        backup_journal(journalPath)
+        self._openJournal(journalPath, 'w+b')
+        self._append({'kind': 'open', 'file': levelFile, 'stamp': _get_stamp(levelFile)})
+
+    def resume(self, state: JournalState, undoStack: array, redoStack: array):
+        """Carry on with a journal after its edits were recovered.
+        """
+        self.close(delete=False)
+        self._openJournal(state.journalPath, 'r+b')
+        self.journal.truncate(state.end) # Drop a record cut off by the crash.
+        self.undoStack, self.redoStack = undoStack, redoStack
+
+    def _openJournal(self, journalPath: str, mode: str):
+        os.makedirs(os.path.dirname(journalPath) or '.', exist_ok=True)
+        self.journal = open(journalPath, mode)
+        self.journalPath = journalPath
+        self._setLastJournal(journalPath)
+
+    def _setLastJournal(self, journalPath: Optional[str]):
+        os.makedirs(cfg.cache_dir, exist_ok=True)
+        with open(LAST_JOURNAL_FILE, 'w', encoding='utf-8') as f:
+            f.write(journalPath or '')
+
+    def close(self, delete=True):
+        """Stop journaling. The journal is deleted unless delete is False.
+        """
+        self.undoStack, self.redoStack = array('q'), array('q')
+        self.cache.clear()
+        if self.journal is None:
+            return
+        self.journal.close()
+        if delete:
+            os.remove(self.journalPath)
+            self._setLastJournal(None)
+        self.journal = None
+        self.journalPath = None
+
+    def _append(self, record: dict) -> int:
+        """Write a record to the end of the journal and return its offset.
+        """
+        offset = self.journal.seek(0, os.SEEK_END)
+        self.journal.write(_encode(record))
+        # Flushed so the record survives the editor crashing (not the OS).
+        self.journal.flush()
+        return offset
+
+    def _cache(self, offset: int, record: dict):
+        self.cache[offset] = record
+        self.cache.move_to_end(offset)
+        while len(self.cache) > self.cacheSize:
+            self.cache.popitem(last=False)
+
+    def read(self, offset: int) -> dict:
+        """Return the "do" record at offset.
+        """
+        record = self.cache.get(offset)
+        if record is None:
+            self.journal.seek(offset)
+            record = _read_record(self.journal)
+        self._cache(offset, record)
+        return record
+
+    def isRecording(self) -> bool:
+        return self.journal is not None
+
+    def canUndo(self) -> bool:
+        return bool(self.undoStack)
+
+    def canRedo(self) -> bool:
+        return bool(self.redoStack)
+
+    def _addEdit(self, record: dict):
+        if self.journal is None:
+            return
+        record = dict(record, kind='do')
+        offset = self._append(record)
+        self._cache(offset, record)
+        self.undoStack.append(offset)
+        del self.redoStack[:]
+
+    def addTileEdit(self, levelName: str, layerName: Optional[str], indexes: list, oldTiles: list, newTiles: list):
+        """Record the tiles of a layer at indexes changing from oldTiles to
+        newTiles.
+        """
+        self._addEdit({'level': levelName, 'layer': layerName, 'tiles': _pack_tiles(indexes, oldTiles, newTiles)})
+
+    def addEntityEdit(self, levelName: str, before: List[dict], after: List[dict]):
+        self._addEdit({'level': levelName, 'entities': [before, after]})
+
+    def addLevel(self, levelName: str, level: dict):
+        """Record the whole of a level after a change that can't be undone.
+        """
+        if self.journal is not None:
+            self._append({'kind': 'level', 'level': levelName, 'data': get_level_snapshot(level)})
+
+    def undo(self) -> Optional[dict]:
+        """Move the last edit to the redo history and return its record for
+        the caller to revert.
+        """
+        return self._move(self.undoStack, self.redoStack, 'undo')
+
+    def redo(self) -> Optional[dict]:
+        return self._move(self.redoStack, self.undoStack, 'redo')
+
+    def _move(self, source: array, dest: array, kind: str) -> Optional[dict]:
+        if not source:
+            return None
+        offset = source.pop()
+        dest.append(offset)
+        self._append({'kind': kind, 'ref': offset})
+        return self.read(offset)
+
+    def clear(self):
+        del self.undoStack[:], self.redoStack[:]
+        self.cache.clear()
+        if self.journal is not None:
+            self._append({'kind': 'clear'})
+
+    def markSaved(self, levelFile: str):
+        """Record the edits so far as saved to levelFile, moving the journal
+        next to it if it was saved somewhere new.
+        """
+        if self.journal is None:
+            return
+        journalPath = get_journal_path(levelFile)
+        if journalPath != self.journalPath:
+            self.journal.close()
+            shutil.move(self.journalPath, journalPath)
+            self._openJournal(journalPath, 'r+b')
+        record = {'kind': 'save', 'file': levelFile, 'stamp': _get_stamp(levelFile)}
+        self._append(record)
+        kept = sum(map(self._getRecordSize, self.undoStack + self.redoStack))
+        unused = self.journal.seek(0, os.SEEK_END) - kept
+        if unused > max(kept, cfg.JOURNAL_COMPACT_SIZE):
+            self._compact(record)
+
+    def _getRecordSize(self, offset: int) -> int:
+        self.journal.seek(offset)
+        size, = _header.unpack(self.journal.read(_header.size))
+        return _header.size + size
+
+    def _compact(self, saveRecord: dict):
+        """Rewrite the journal with only the edits in the history, followed
+        by saveRecord.
+        """
+        offsets = {} # Old offset: new offset
+        compactPath = self.journalPath + '.tmp'
+        with open(compactPath, 'wb') as f:
+            # Edits that can be redone come after the history, the next
+            # to redo first, and are then undone, the last one first.
+            for offset in self.undoStack + self.redoStack[::-1]:
+                offsets[offset] = f.tell()
+                size = self._getRecordSize(offset)
+                self.journal.seek(offset)
+                f.write(self.journal.read(size))
+            for offset in self.redoStack:
+                f.write(_encode({'kind': 'undo', 'ref': offsets[offset]}))
+            f.write(_encode(saveRecord))
+        self.journal.close()
+        os.replace(compactPath, self.journalPath)
+        self._openJournal(self.journalPath, 'r+b')
+        self.undoStack = array('q', (offsets[offset] for offset in self.undoStack))
+        self.redoStack = array('q', (offsets[offset] for offset in self.redoStack))
+        self.cache = OrderedDict((offsets[offset], record) for offset, record in self.cache.items() if offset in offsets)
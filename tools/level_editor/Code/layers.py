@@ -0,0 +1,53 @@
+# ==================================================================
+# layers.py handles the extra tile layers of a level.
+#
+# A level's tileData is its base layer and also holds each tile's
+# type (FL, WA, ...) so collision and navigation only ever look at
+# it. "layers" is an optional ordered list of sprite-only layers
+# drawn above it, e.g. floor detail and decorations.
+#
+# In a level file each layer is stored as a dictionary of its
+# distinct sprites ("x-y", "" for empty) and a base64 encoded little
+# endian uint16 array of indexes into it, in row major order:
+#   {"name": "decor", "dictionary": ["", "3-4"], "tiles": "AAABAA=="}
+# In the editor tiles is unpacked into a list of sprites on first use.
+# See TileMap.loadLayers() in logic.js.
+# ==================================================================
+from typing import List
+import base64
+
+import numpy as np
+
+LAYERS_KEY = 'layers'
+EMPTY_SPRITE = ''
+
+def new_layer(name: str, size: int) -> dict:
+    return {'name': name, 'tiles': [EMPTY_SPRITE] * size}
+
+def is_packed(layer: dict) -> bool:
+    return isinstance(layer['tiles'], str)
+
+def pack_layer(layer: dict) -> dict:
+    """Return a copy of layer in its file format.
+    """
+    if is_packed(layer):
+        return dict(layer)
+    lookup = {EMPTY_SPRITE: 0}
+    indexes = np.fromiter((lookup.setdefault(tile, len(lookup)) for tile in layer['tiles']),
+        dtype='<u2', count=len(layer['tiles']))
+    packed = {key: value for key, value in layer.items() if key != 'tiles'}
+    packed['dictionary'] = list(lookup)
+    packed['tiles'] = base64.b64encode(indexes.tobytes()).decode('ascii')
+    return packed
+
+def unpack_layer(layer: dict) -> dict:
+    """Unpack layer's tiles in place (if it isn't already) and return it.
+    """
+    if is_packed(layer):
+        dictionary = layer.pop('dictionary')
+        indexes = np.frombuffer(base64.b64decode(layer['tiles']), dtype='<u2')
+        layer['tiles'] = [dictionary[i] for i in indexes.tolist()]
+    return layer
+
+def pack_layers(layers: List[dict]) -> List[dict]:
+    return [pack_layer(layer) for layer in layers]
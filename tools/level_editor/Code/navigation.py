@@ -0,0 +1,146 @@
+# ==================================================================
+# navigation.py bakes navigation data for each level so NPCs don't
+# have to search the TileMap at runtime.
+#
+# For every level it computes:
+#  - region ids: connected areas of walkable (FL) tiles.
+#  - per target: a BFS distance field (in tiles) and a flow field
+#    giving the step to take from each tile towards the nearest target.
+#
+# Targets come from a level's "navTargets" ({name: [[x, y], ...]} in
+# tiles). Levels without them get a single "player" target at the
+# player entity's spawn point.
+#
+# Arrays are stored as base64 encoded little endian packed arrays in
+# row major order, regions and distances as 16 bit numbers (format 1)
+# or as 32 bit ones if a level has too many regions or too long paths
+# for 16 bits (format 2). See TileMap.loadNavigation() in logic.js.
+# ==================================================================
+from typing import List, Dict
+import base64
+
+import numpy as np
+
+from . import cfg
+from .regions import label_mask
+
+NAV_KEY = 'navigation'
+TARGETS_KEY = 'navTargets'
+NAV_FORMATS = {1: '<u2', 2: '<u4'} # Format: type of the regions and distances.
+WALKABLE_IDS = ('FL',)
+UNREACHABLE = 0xFFFFFFFF # Distance of tiles that can't reach a target, the largest number of the format once stored.
+SMALL_RING = 64 # BFS rings with fewer tiles are expanded a tile at a time.
+# Flow directions. Index 0 means no step (a target or unreachable tile).
+# Corresponds to TileMap.flowDirections in logic.js.
+FLOW_DIRECTIONS = ((0, 0), (-1, 0), (1, 0), (0, -1), (0, 1))
+
+def get_walkable_mask(tile_data: List[str], width: int, height: int) -> np.ndarray:
+    ids = np.array([tile.split('-')[-1] for tile in tile_data]).reshape(height, width)
+    return np.isin(ids, WALKABLE_IDS)
+
+def _expand_ring(ring: np.ndarray, walkable: np.ndarray, dist: np.ndarray, width: int) -> np.ndarray:
+    """Return the unvisited walkable tiles 4-adjacent to the tiles of a BFS
+    ring (flat indexes), each once.
+    """
+    size = len(walkable)
+    if len(ring) < SMALL_RING:
+        # Long corridors have rings of a few tiles, too few for numpy to pay off.
+        found = set()
+        for index in ring.tolist():
+            x = index % width
+            for neighbour, inside in ((index - 1, x > 0), (index + 1, x < width - 1),
+                (index - width, index >= width), (index + width, index < size - width)):
+                if inside and walkable[neighbour] and dist[neighbour] == UNREACHABLE:
+                    found.add(neighbour)
+        return np.array(sorted(found), np.int64)
+    x = ring % width
+    neighbours = np.concatenate((ring[x > 0] - 1, ring[x < width - 1] + 1,
+        ring[ring >= width] - width, ring[ring < size - width] + width))
+    neighbours = neighbours[walkable[neighbours] & (dist[neighbours] == UNREACHABLE)]
+    return np.unique(neighbours)
+
+def distance_field(walkable: np.ndarray, targets: List[List[int]]) -> np.ndarray:
+    """Multi-source BFS from every walkable target, a ring of tiles at a
+    time. Each tile is visited once.
+    """
+    height, width = walkable.shape
+    flatWalkable = walkable.ravel()
+    dist = np.full(walkable.size, UNREACHABLE, dtype=np.uint32)
+    ring = np.unique(np.array([y * width + x for x, y in targets
+        if 0 <= y < height and 0 <= x < width and walkable[y, x]], np.int64))
+    step = 0
+    while len(ring):
+        dist[ring] = step
+        ring = _expand_ring(ring, flatWalkable, dist, width)
+        step += 1
+    return dist.reshape(walkable.shape)
+
+def flow_field(dist: np.ndarray) -> np.ndarray:
+    """Return the index into FLOW_DIRECTIONS of the neighbour closest to a
+    target for every tile.
+    """
+    padded = np.pad(dist.astype(np.int64), 1, constant_values=UNREACHABLE)
+    height, width = dist.shape
+    neighbours = np.stack([padded[1 + dy:1 + dy + height, 1 + dx:1 + dx + width]
+        for dx, dy in FLOW_DIRECTIONS[1:]])
+    best = neighbours.argmin(axis=0)
+    closer = neighbours.min(axis=0) < dist
+    return np.where(closer & (dist != UNREACHABLE), best + 1, 0).astype(np.uint8)
+
+def region_ids(walkable: np.ndarray) -> np.ndarray:
+    """Label connected walkable areas 1..n (0 for unwalkable tiles), in the
+    order of their first tile.
+    """
+    return label_mask(walkable)[0]
+
+def pack(array: np.ndarray, dtype: str) -> str:
+    return base64.b64encode(array.astype(dtype).tobytes()).decode('ascii')
+
+def unpack(data: str, dtype: str, width: int, height: int) -> np.ndarray:
+    return np.frombuffer(base64.b64decode(data), dtype=dtype).reshape(height, width)
+
+def get_targets(level: dict) -> Dict[str, List[List[int]]]:
+    if TARGETS_KEY in level:
+        return level[TARGETS_KEY]
+    for entity in level.get('entities', []):
+        if entity.get('id') == 'player':
+            return {'player': [[int(entity['x'] // cfg.TILESIZE), int(entity['y'] // cfg.TILESIZE)]]}
+    return {}
+
+def bake_level(level: dict) -> dict:
+    width, height = level['width'], level['height']
+    walkable = get_walkable_mask(level['tileData'], width, height)
+    regions = region_ids(walkable)
+    fields = {}
+    for name, targets in get_targets(level).items():
+        dist = distance_field(walkable, targets)
+        fields[name] = (dist, flow_field(dist))
+    largest = max([int(regions.max(initial=0))] + [int(dist[dist != UNREACHABLE].max(initial=0)) for dist, _ in fields.values()])
+    navFormat = 1 if largest < 0xFFFF else 2
+    dtype = NAV_FORMATS[navFormat]
+    unreachable = np.iinfo(dtype).max
+    return {
+        'format': navFormat,
+        'regions': pack(regions, dtype),
+        'fields': {name: {
+            'distance': pack(np.minimum(dist, unreachable), dtype),
+            'flow': pack(flow, 'u1')
+        } for name, (dist, flow) in fields.items()}
+    }
+
+def update_navigation(file: dict, level_names=None) -> dict:
+    """Rebake the navigation data of every level in file (or only those in
+    level_names). Return {level name: (walkable tiles, regions, fields)}
+    for reporting.
+    """
+    report = {}
+    for level_name in file[cfg.LEVEL_KEY] if level_names is None else level_names:
+        level = file[cfg.LEVEL_KEY][level_name]
+        navigation = level[NAV_KEY] = bake_level(level)
+        regions = unpack(navigation['regions'], NAV_FORMATS[navigation['format']], level['width'], level['height'])
+        report[level_name] = (int((regions > 0).sum()), int(regions.max(initial=0)), len(navigation['fields']))
+    return report
+
+def format_report(report: dict) -> str:
+    return '\n'.join(f'{level_name}: {tiles} walkable tiles, {regions} regions, {fields} flow fields'
+        for level_name, (tiles, regions, fields) in report.items())
@@ -0,0 +1,229 @@
+# ==================================================================
+# regions.py labels the connected regions of a tile layer, the areas
+# a fill spreads over, so the map view can show a fill before it's
+# made and the fill doesn't have to search for its tiles.
+#
+# A region is a 4-connected group of tiles with the same key, which
+# is the part of the tile id the fill compares: the sprite ("4-4") of
+# a sprite fill, the type ("FL") of a type fill, or the whole sprite
+# of an extra layer tile. See LevelData.fillTiles() and fillLayer().
+#
+# Every tile holds the label of its region and every label its size
+# and bounding box. Labelling is done with numpy on runs of equal
+# keys in each row, joining runs that touch the run above them.
+#
+# An edit only unlabels the regions it could have split or merged and
+# the tiles in them are labelled again on the next lookup. A region
+# whose tiles all changed to the same key (a fill) keeps its label
+# unless it now touches a region with that key.
+# ==================================================================
+from typing import Callable, Iterable, List, Tuple
+
+import numpy as np
+
+from . import cfg
+
+# Keys the tiles of a fill are compared by.
+FILL_KEYS = {
+    'sprite': lambda tile: tile.rsplit('-', 1)[0],
+    'type': lambda tile: tile.rsplit('-', 1)[-1],
+    'layer': lambda tile: tile
+}
+
+
+def get_fill_key(layerName, tile: str, typeFill: bool) -> str:
+    """Return the name of the key a fill starting on tile compares tiles
+    by. Fills on empty base tiles always compare types.
+    """
+    if layerName is not None:
+        return 'layer'
+    if typeFill or tile.rsplit('-', 1)[-1] == cfg.EMPTY_TILE_ID:
+        return 'type'
+    return 'sprite'
+
+
+class _KeyCodes(dict):
+    """tile id: number of the tile's key."""
+    def __init__(self, key: Callable[[str], str]):
+        super().__init__()
+        self.key = key
+        self.keys = {}
+
+    def __missing__(self, tile: str) -> int:
+        code = self[tile] = self.keys.setdefault(self.key(tile), len(self.keys))
+        return code
+
+
+def _unique_counts(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """np.unique(values, return_counts=True), sorting is faster than
+    hashing for the big arrays of a fill.
+    """
+    values = np.sort(values)
+    firsts = np.flatnonzero(np.r_[True, values[1:] != values[:-1]])[:len(values)]
+    return values[firsts], np.diff(np.r_[firsts, len(values)])
+
+
+def _label_runs(codes: np.ndarray, mask: np.ndarray) -> Tuple[np.ndarray, np.ndarray, int, np.ndarray]:
+    """Label the regions of equal codes among the cells in mask (2D).
+    Return the run of every cell, where each run starts, the number of
+    regions and the region of every run.
+    """
+    height, width = codes.shape
+    flatCodes = codes.ravel()
+    flatMask = mask.ravel()
+    # A run starts on every masked cell that doesn't continue the one to its left.
+    starts = flatMask.copy()
+    starts[1:] &= ~(flatMask[:-1] & (flatCodes[1:] == flatCodes[:-1]))
+    starts[::width] = flatMask[::width]
+    runs = np.cumsum(starts) - 1
+    count = int(runs[-1]) + 1 if len(runs) else 0
+
+    # Join runs with the equal cells under them.
+    below = flatMask[width:] & flatMask[:-width] & (flatCodes[width:] == flatCodes[:-width])
+    pairs = _unique_counts(runs[width:][below] * count + runs[:-width][below])[0]
+    a, b = pairs // count, pairs % count
+    parents = np.arange(count)
+    while len(a):
+        rootA, rootB = parents[a], parents[b]
+        joined = rootA != rootB
+        a, b, rootA, rootB = a[joined], b[joined], rootA[joined], rootB[joined]
+        np.minimum.at(parents, np.maximum(rootA, rootB), np.minimum(rootA, rootB))
+        while True:
+            grandparents = parents[parents]
+            if (grandparents == parents).all():
+                break
+            parents = grandparents
+    roots = parents == np.arange(count)
+    regions = (np.cumsum(roots) - 1)[parents]
+    return runs, np.flatnonzero(starts), int(roots.sum()), regions
+
+
+def label_mask(mask: np.ndarray) -> Tuple[np.ndarray, int]:
+    """Number the 4-connected regions of the true cells of a 2D mask 1..n
+    in the order of their first cell, 0 for the false cells. Return the
+    numbers and n.
+    """
+    runs, _, count, regions = _label_runs(np.zeros(mask.shape, np.int8), mask)
+    flatMask = mask.ravel()
+    labels = np.zeros(mask.size, np.int64)
+    labels[flatMask] = regions[runs[flatMask]] + 1
+    return labels.reshape(mask.shape), count
+
+
+class RegionLabels:
+    """The fill regions of one tile layer for one key (see FILL_KEYS).
+    """
+    def __init__(self, tiles: List[str], width: int, key: Callable[[str], str]):
+        self.width = width
+        self.height = len(tiles) // width
+        self.keyCodes = _KeyCodes(key)
+        self.codes = np.fromiter(map(self.keyCodes.__getitem__, tiles), np.int32, len(tiles))
+        self.codes = self.codes.reshape(self.height, self.width)
+        self.clear()
+
+    def clear(self):
+        """Unlabel every tile.
+        """
+        self.labels = np.full((self.height, self.width), -1, np.int64)
+        self.sizes = np.zeros(0, np.int64)
+        self.boxes = np.zeros((0, 4), np.int64) # x0, y0, x1, y1 of each label, ends excluded.
+        self.unlabelled = (0, 0, self.width, self.height) # Box around the unlabelled tiles or None.
+
+    def _labelTiles(self):
+        """Label the tiles in the unlabelled box that have no label.
+        """
+        if len(self.sizes) > 2 * self.codes.size:
+            self.clear() # Labels are never reused, start over once most are stale.
+        x0, y0, x1, y1 = self.unlabelled
+        self.unlabelled = None
+        labels = self.labels[y0:y1, x0:x1]
+        mask = labels < 0
+        runs, starts, count, regions = _label_runs(self.codes[y0:y1, x0:x1], mask)
+        if not count:
+            return
+
+        # Sizes and boxes of the new regions are gathered from their runs.
+        width = x1 - x0
+        flatMask = mask.ravel()
+        lengths = np.bincount(runs[flatMask], minlength=len(starts))
+        runX, runY = starts % width + x0, starts // width + y0
+        boxes = np.empty((count, 4), np.int64)
+        boxes[:, :2] = np.iinfo(np.int64).max
+        boxes[:, 2:] = -1
+        np.minimum.at(boxes[:, 0], regions, runX)
+        np.minimum.at(boxes[:, 1], regions, runY)
+        np.maximum.at(boxes[:, 2], regions, runX + lengths)
+        np.maximum.at(boxes[:, 3], regions, runY + 1)
+
+        first = len(self.sizes)
+        np.copyto(labels, (regions[runs] + first).reshape(labels.shape), where=mask)
+        self.sizes = np.concatenate((self.sizes, np.bincount(regions, lengths).astype(np.int64)))
+        self.boxes = np.concatenate((self.boxes, boxes))
+
+    def _unlabel(self, dirty: np.ndarray):
+        """Unlabel the tiles of the labels in dirty.
+        """
+        boxes = self.boxes[dirty]
+        box = (*boxes[:, :2].min(0), *boxes[:, 2:].max(0))
+        if self.unlabelled:
+            box = (*np.minimum(box[:2], self.unlabelled[:2]), *np.maximum(box[2:], self.unlabelled[2:]))
+        x0, y0, x1, y1 = (int(n) for n in box)
+        labels = self.labels[y0:y1, x0:x1]
+        labels[np.isin(labels, dirty)] = -1
+        self.unlabelled = (x0, y0, x1, y1)
+
+    def update(self, tiles: List[str], indexes: Iterable[int]):
+        """Update the labels after the tiles at indexes changed.
+        """
+        indexes = _unique_counts(np.fromiter(indexes, np.int64))[0]
+        if not len(indexes):
+            return
+        codes = self.codes.reshape(-1)
+        labels = self.labels.reshape(-1)
+        codes[indexes] = np.fromiter(map(self.keyCodes.__getitem__, map(tiles.__getitem__, indexes.tolist())), np.int32, len(indexes))
+        dirty = []
+
+        # A region may have split unless all of it changed to one key.
+        changed = labels[indexes]
+        labelled = changed >= 0
+        pairs = _unique_counts(changed[labelled] << 32 | codes[indexes][labelled])[0]
+        changedLabels, keys = _unique_counts(pairs >> 32)
+        sizes = _unique_counts(changed[labelled])[1]
+        dirty.append(changedLabels[(keys > 1) | (sizes != self.sizes[changedLabels])])
+
+        # Neighbours with the same key in another region merge with it.
+        xs, ys = indexes % self.width, indexes // self.width
+        for dx, dy in ((1, 0), (-1, 0), (0, 1), (0, -1)):
+            inside = (0 <= xs + dx) & (xs + dx < self.width) & (0 <= ys + dy) & (ys + dy < self.height)
+            cells = indexes[inside]
+            neighbours = cells + dy * self.width + dx
+            merged = (codes[cells] == codes[neighbours]) & (labels[cells] != labels[neighbours])
+            dirty += [labels[cells[merged]], labels[neighbours[merged]]]
+
+        dirty = _unique_counts(np.concatenate(dirty))[0]
+        dirty = dirty[dirty >= 0]
+        if len(dirty):
+            self._unlabel(dirty)
+
+    def getLabel(self, index: int) -> int:
+        """Return the label of the region of the tile at index. A region
+        keeps its label for as long as it covers the same tiles.
+        """
+        if self.unlabelled:
+            self._labelTiles()
+        return int(self.labels.flat[index])
+
+    def getRegion(self, index: int) -> Tuple[int, int, int, np.ndarray]:
+        """Return the label of the region of the tile at index, the top left
+        of its box and a mask of its tiles in the box.
+        """
+        label = self.getLabel(index)
+        x0, y0, x1, y1 = (int(n) for n in self.boxes[label])
+        return label, x0, y0, self.labels[y0:y1, x0:x1] == label
+
+    def getIndexes(self, index: int) -> List[int]:
+        """Return the indexes of the tiles in the region of the tile at index.
+        """
+        _, x0, y0, mask = self.getRegion(index)
+        ys, xs = np.nonzero(mask)
+        return ((ys + y0) * self.width + xs + x0).tolist()
@@ -0,0 +1,191 @@
+# ==================================================================
+# render.py renders levels to full resolution PNG images.
+#
+# Levels are rendered a band of tile rows at a time and each band is
+# streamed straight into the PNG encoder, so memory use depends only
+# on the width of the level and the band height, never on the size
+# of the whole image. This also avoids QImage's size limits.
+#
+# The base layer is drawn first, then every extra layer on top (see
+# layers.py).
+# ==================================================================
+from typing import Optional
+import struct, zlib
+
+import numpy as np
+from PyQt5.QtGui import QImage
+
+from . import cfg
+from .layers import EMPTY_SPRITE, LAYERS_KEY, unpack_layer
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+IDAT_SIZE = 1 << 20 # Compressed bytes buffered before an IDAT chunk is written.
+
+
+class PNGStreamWriter:
+    """Writes an 8 bit RGBA PNG a few rows at a time.
+    """
+    def __init__(self, filename: str, width: int, height: int, compression: int = 6):
+        self.file = open(filename, 'wb')
+        self.width = width
+        self.height = height
+        self.rowsWritten = 0
+        self.compressor = zlib.compressobj(compression)
+        self.buffer = []
+        self.buffered = 0
+        self.file.write(PNG_SIGNATURE)
+        # Bit depth 8, colour type 6 (RGBA), default compression, filter and interlace.
+        self.writeChunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0))
+
+    def writeChunk(self, chunk_type: bytes, data: bytes):
+        self.file.write(struct.pack('>I', len(data)) + chunk_type + data)
+        self.file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(chunk_type))))
+
+    def writeRows(self, rows: np.ndarray):
+        """Write a (rows, width, 4) uint8 array of pixels.
+        """
+        # Each row starts with its filter type (0, none).
+        filtered = np.zeros((rows.shape[0], self.width * 4 + 1), dtype=np.uint8)
+        filtered[:, 1:] = rows.reshape(rows.shape[0], -1)
+        self._addData(self.compressor.compress(filtered.tobytes()))
+        self.rowsWritten += rows.shape[0]
+
+    def _addData(self, data: bytes):
+        self.buffer.append(data)
+        self.buffered += len(data)
+        if self.buffered >= IDAT_SIZE:
+            self._flushData()
+
+    def _flushData(self):
+        if self.buffered:
+            self.writeChunk(b'IDAT', b''.join(self.buffer))
+        self.buffer = []
+        self.buffered = 0
+
+    def close(self):
+        if self.rowsWritten != self.height:
+            raise ValueError(f'{self.rowsWritten} rows written, expected {self.height}')
+        self._addData(self.compressor.flush())
+        self._flushData()
+        self.writeChunk(b'IEND', b'')
+        self.file.close()
+
+
+def get_image_pixels(image: QImage) -> np.ndarray:
+    """Return a copy of an image as a (height, width, 4) RGBA array.
+    """
+    image = image.convertToFormat(QImage.Format_RGBA8888)
+    bits = image.constBits()
+    bits.setsize(image.byteCount())
+    pixels = np.frombuffer(bits, dtype=np.uint8).reshape(image.height(), image.bytesPerLine())
+    return pixels[:, :image.width() * 4].reshape(image.height(), image.width(), 4).copy()
+
+def load_sheet(filename: str, scale: int = 1) -> np.ndarray:
+    """Return a spritesheet as a (height, width, 4) RGBA array, shrunk by
+    scale with a box filter.
+    """
+    image = QImage(filename)
+    if image.isNull():
+        raise FileNotFoundError(f'Could not load spritesheet {filename}')
+    pixels = get_image_pixels(image)
+    if scale == 1:
+        return pixels
+    height, width = pixels.shape[0] // scale, pixels.shape[1] // scale
+    return shrink_pixels(pixels[:height * scale, :width * scale], scale)
+
+def shrink_pixels(pixels: np.ndarray, scale: int) -> np.ndarray:
+    """Return (..., height, width, 4) RGBA pixels shrunk by scale with a
+    box filter. Sides scale doesn't divide are padded with transparent
+    pixels first.
+    """
+    height, width = -(-pixels.shape[-3] // scale), -(-pixels.shape[-2] // scale)
+    padding = [(0, 0)] * (pixels.ndim - 3) + [(0, height * scale - pixels.shape[-3]), (0, width * scale - pixels.shape[-2]), (0, 0)]
+    blocks = np.pad(pixels, padding).reshape(*pixels.shape[:-3], height, scale, width, scale, 4).astype(np.float32)
+    alpha = blocks[..., 3:].sum(axis=(-4, -2))
+    # Weight colours by alpha so transparent pixels don't darken edges.
+    rgb = (blocks[..., :3] * blocks[..., 3:]).sum(axis=(-4, -2)) / np.maximum(alpha, 1)
+    return np.concatenate([rgb, alpha / (scale * scale)], axis=-1).round().astype(np.uint8)
+
+
+class SpriteAtlas:
+    """Sprites cut from a sheet, looked up by index. Index 0 is empty.
+    """
+    def __init__(self, sheet: np.ndarray, tileSize: int):
+        self.sheet = sheet
+        self.tileSize = tileSize
+        self.indexes = {EMPTY_SPRITE: 0}
+        self.sprites = [np.zeros((tileSize, tileSize, 4), dtype=np.uint8)]
+        self.array = None
+
+    def getIndex(self, sprite: str) -> int:
+        """Return the index of an "x-y" sprite, cutting it out if it's new.
+        """
+        index = self.indexes.get(sprite)
+        if index is None:
+            x, y = (int(n) * self.tileSize for n in sprite.split('-'))
+            self.sprites.append(self.sheet[y:y + self.tileSize, x:x + self.tileSize])
+            index = self.indexes[sprite] = len(self.sprites) - 1
+            self.array = None
+        return index
+
+    def getArray(self) -> np.ndarray:
+        if self.array is None:
+            self.array = np.stack(self.sprites)
+        return self.array
+
+    def renderRow(self, spriteIndexes: np.ndarray) -> np.ndarray:
+        """Return the pixels of one row of tiles.
+        """
+        tiles = self.getArray()[spriteIndexes] # (tiles, size, size, 4)
+        return tiles.transpose(1, 0, 2, 3).reshape(self.tileSize, -1, 4)
+
+
+def _composite(dest: np.ndarray, src: np.ndarray):
+    """Draw src over dest in place.
+    """
+    alpha = src[..., 3:].astype(np.uint16)
+    inverse = 255 - alpha
+    dest[..., :3] = (src[..., :3] * alpha + dest[..., :3] * inverse + 127) // 255
+    dest[..., 3:] = alpha + (dest[..., 3:] * inverse + 127) // 255
+
+def _base_sprite(tile: str) -> str:
+    sprite, type_code = tile.rsplit('-', 1)
+    return EMPTY_SPRITE if type_code == cfg.EMPTY_TILE_ID else sprite
+
+def render_level_png(level: dict, filename: str, sheet_file: Optional[str] = None,
+    scale: int = 1, band_rows: int = 4, compression: int = 6) -> tuple:
+    """Render a level (a level dict from a level file) to filename and
+    return the image's (width, height).
+
+    scale shrinks the image by an integer factor of the tile size.
+    band_rows is how many rows of tiles are rendered at once.
+    """
+    if cfg.TILESIZE % scale:
+        raise ValueError(f'scale must divide the tile size ({cfg.TILESIZE})')
+    if sheet_file is None:
+        sheet_file = cfg.get_assetURL(cfg.sprite_dir, level['spriteSheet'], '.png')
+    tileSize = cfg.TILESIZE // scale
+    atlas = SpriteAtlas(load_sheet(sheet_file, scale), tileSize)
+    width, height = level['width'], level['height']
+    tiles = level['tileData']
+    # Unpacked copies so the level itself is left as it was.
+    layers = [unpack_layer(dict(layer))['tiles'] for layer in level.get(LAYERS_KEY, [])]
+
+    writer = PNGStreamWriter(filename, width * tileSize, height * tileSize, compression)
+    try:
+        for band_start in range(0, height, band_rows):
+            band = []
+            for y in range(band_start, min(band_start + band_rows, height)):
+                row = slice(y * width, (y + 1) * width)
+                pixels = atlas.renderRow(np.array([atlas.getIndex(_base_sprite(t)) for t in tiles[row]]))
+                for layer in layers:
+                    indexes = np.array([atlas.getIndex(s) for s in layer[row]])
+                    if indexes.any():
+                        _composite(pixels, atlas.renderRow(indexes))
+                band.append(pixels)
+            writer.writeRows(np.concatenate(band))
+        writer.close()
+    except BaseException:
+        writer.file.close()
+        raise
+    return width * tileSize, height * tileSize
@@ -0,0 +1,88 @@
+# ==================================================================
+# sheets.py decodes spritesheets off the UI thread.
+#
+# prefetch_sheets() queues the PNG decode of each sheet on a thread
+# pool. get_sheet_pixmap() then only has to convert the
+# decoded QImage, or wait for the rest of a decode already running
+# instead of starting a new one. Sheets are decoded again if their
+# file changes.
+# ==================================================================
+from typing import Iterable, Optional
+import os, threading
+
+from PyQt5.QtCore import QRunnable, QThreadPool
+from PyQt5.QtGui import QImage, QPixmap
+
+_lock = threading.Lock()
+_images = {} # path: (mtime, QImage)
+_pending = {} # path: threading.Event set once the decode finishes
+_pixmaps = {} # path: (mtime, QPixmap). Only touched on the UI thread.
+# Not QThreadPool.globalInstance(): Qt splits large image conversions over
+# that pool, and a decode task waiting there for the GIL would deadlock
+# QPixmap.fromImage() on the UI thread.
+_pool = None
+
+
+def _get_mtime(path: str) -> Optional[float]:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
+class _DecodeTask(QRunnable):
+    def __init__(self, path: str, mtime: Optional[float]):
+        super().__init__()
+        self.path = path
+        self.mtime = mtime
+
+    def run(self):
+        image = QImage(self.path)
+        with _lock:
+            _images[self.path] = (self.mtime, image)
+            _pending.pop(self.path).set()
+
+
+def _is_current(cache: dict, path: str, mtime: Optional[float]) -> bool:
+    return path in cache and cache[path][0] == mtime
+
+def prefetch_sheets(paths: Iterable[str]):
+    """Start decoding every sheet in paths that isn't decoded or being
+    decoded already.
+    """
+    global _pool
+    if _pool is None:
+        _pool = QThreadPool()
+    for path in set(paths):
+        mtime = _get_mtime(path)
+        with _lock:
+            if path in _pending or _is_current(_images, path, mtime):
+                continue
+            _pending[path] = threading.Event()
+        _pool.start(_DecodeTask(path, mtime))
+
+def get_sheet_image(path: str) -> QImage:
+    """Return a decoded sheet (a null image if it can't be read).
+    """
+    mtime = _get_mtime(path)
+    with _lock:
+        event = _pending.get(path)
+        current = _is_current(_images, path, mtime)
+    if event is not None:
+        event.wait()
+    elif not current:
+        # Not prefetched, so decode it here rather than wait on the pool.
+        image = QImage(path)
+        with _lock:
+            _images[path] = (mtime, image)
+        return image
+    with _lock:
+        return _images[path][1]
+
+def get_sheet_pixmap(path: str) -> QPixmap:
+    """Return a sheet as a pixmap. Must be called from the UI thread.
+    """
+    mtime = _get_mtime(path)
+    if not _is_current(_pixmaps, path, mtime):
+        _pixmaps[path] = (mtime, QPixmap.fromImage(get_sheet_image(path)))
+    return _pixmaps[path][1]
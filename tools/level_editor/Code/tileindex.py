@@ -0,0 +1,120 @@
+# ==================================================================
+# tileindex.py keeps track of where each tile id, sprite and type is
+# used in a level's tileData, so finding or replacing a tile takes
+# time in proportion to how often it's used instead of the map size.
+#
+# Every distinct tile id gets a code and the index holds the code of
+# each cell plus the cells sorted by code, so the cells of a code are
+# one slice. Changed cells are added to a set per code rather than
+# moved in the sorted array, and cells that no longer have the code
+# are skipped when read. The array is sorted again once a quarter of
+# the level has changed.
+#
+# Values are looked up by their kind: "4-4-FL" is a tile id, "4-4" a
+# sprite and "FL" a type. See get_tile_key().
+# ==================================================================
+from typing import List, Sequence
+
+import numpy as np
+
+TILE_KEYS = {
+    'id': lambda tile: tile,
+    'sprite': lambda tile: tile.rsplit('-', 1)[0],
+    'type': lambda tile: tile.rsplit('-', 1)[-1]
+}
+
+
+def get_tile_key(value: str) -> str:
+    """Return whether value is a tile id, sprite or type.
+    """
+    return ('type', 'sprite', 'id')[min(value.count('-'), 2)]
+
+
+def replace_tile(tile: str, key: str, value: str) -> str:
+    """Return tile with its id, sprite or type (key) replaced by value.
+    """
+    if key == 'sprite':
+        return value + '-' + TILE_KEYS['type'](tile)
+    if key == 'type':
+        return TILE_KEYS['sprite'](tile) + '-' + value
+    return value
+
+
+class TileIndex:
+    """Where the tiles of one level's tileData are used.
+    """
+    def __init__(self, tiles: Sequence[str]):
+        self.tiles = tiles
+        self.tileIds = [] # code: tile id
+        self.codes = {} # tile id: code
+        self.groups = {'sprite': {}, 'type': {}} # key: {sprite or type: codes}
+        if hasattr(tiles, 'getIndexes'): # Binary levels are already coded, see binary.py
+            for tile in tiles.getDictionary():
+                self._getCode(tile)
+            self.cells = tiles.getIndexes().astype(np.int32)
+        else:
+            self.cells = np.fromiter(map(self._getCode, tiles), np.int32, len(tiles))
+        self._sort()
+
+    def _getCode(self, tile: str) -> int:
+        code = self.codes.get(tile)
+        if code is None:
+            code = self.codes[tile] = len(self.tileIds)
+            self.tileIds.append(tile)
+            for key, groups in self.groups.items():
+                groups.setdefault(TILE_KEYS[key](tile), []).append(code)
+        return code
+
+    def _sort(self):
+        self.order = np.argsort(self.cells, kind='stable').astype(np.int32)
+        self.starts = np.searchsorted(self.cells[self.order], np.arange(len(self.tileIds) + 1))
+        self.added = {} # code: cells changed to it since sorting.
+        self.changes = 0
+
+    def getCells(self) -> np.ndarray:
+        """Return the code of every cell. See getTileIds().
+        """
+        return self.cells
+
+    def getTileIds(self) -> List[str]:
+        return self.tileIds
+
+    def update(self, indexes: Sequence[int]):
+        """Update the index after the tiles at indexes changed.
+        """
+        cells = self.cells
+        for index in indexes:
+            code = self._getCode(self.tiles[index])
+            if cells[index] != code:
+                cells[index] = code
+                self.added.setdefault(code, set()).add(index)
+                self.changes += 1
+        if self.changes > len(cells) // 4 + 1024:
+            self._sort()
+
+    def _findCode(self, code: int) -> List[np.ndarray]:
+        cells = self.cells
+        found = []
+        if code + 1 < len(self.starts):
+            sortedCells = self.order[self.starts[code]:self.starts[code + 1]]
+            found.append(sortedCells[cells[sortedCells] == code])
+        if code in self.added:
+            added = np.fromiter(self.added[code], np.int64, len(self.added[code]))
+            added = added[cells[added] == code]
+            self.added[code] = set(added.tolist())
+            found.append(added)
+        return found
+
+    def find(self, value: str, key: str = None) -> np.ndarray:
+        """Return the sorted indexes of the cells with a tile id, sprite or
+        type. key defaults to get_tile_key(value).
+        """
+        key = key or get_tile_key(value)
+        if key == 'id':
+            codes = [self.codes[value]] if value in self.codes else []
+        else:
+            codes = self.groups[key].get(value, [])
+        found = [np.zeros(0, np.int64)] + [cells for code in codes for cells in self._findCode(code)]
+        found = np.sort(np.concatenate(found).astype(np.int64))
+        # A cell that changed back to its old tile is found twice.
+        return found[np.r_[True, found[1:] != found[:-1]][:len(found)]]
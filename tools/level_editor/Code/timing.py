@@ -0,0 +1,34 @@
+# ===========================================================
+# timing.py contains the startup timer used by main.py.
+# ===========================================================
+
+import time
+
+from . import cfg
+
+class StartupTimer:
+    """Records how long each step of the editor's startup takes.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.last = self.start
+        self.steps = []
+
+    def mark(self, step: str):
+        """Record the time since the previous mark as step.
+        """
+        now = time.perf_counter()
+        self.steps.append((step, (now - self.last) * 1000))
+        self.last = now
+
+    def total(self) -> float:
+        return (self.last - self.start) * 1000
+
+    def report(self) -> str:
+        lines = [f'{step:<24} {ms:>8.1f} ms' for step, ms in self.steps]
+        lines.append(f'{"total":<24} {self.total():>8.1f} ms (budget {cfg.STARTUP_BUDGET} ms)')
+        if self.total() > cfg.STARTUP_BUDGET:
+            lines.append('Startup is over budget!')
+        return '\n'.join(lines)
+
+startup = StartupTimer()
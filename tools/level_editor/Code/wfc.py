@@ -0,0 +1,208 @@
+# ==================================================================
+# wfc.py generates levels with wave function collapse, learning which
+# tiles can sit next to each other from hand-made levels.
+#
+# Every tile id (sprite and type, e.g. "4-4-FL") in the example levels
+# is a tile of the model. In a generated level two tiles can only be
+# neighbours in a direction if they are neighbours in that direction
+# somewhere in the examples, and tiles are picked about as often as
+# they appear in them.
+#
+# The tiles a cell could still be are the bits of an int. The cell with
+# the fewest options left (the lowest entropy) is collapsed to one
+# tile, then the tiles that lost every neighbour they could have are
+# removed from the cells around it, spreading only as far as cells
+# change. Cells wait in a heap ordered by entropy; entries that went
+# stale when a cell changed are skipped when popped.
+# ==================================================================
+from typing import Iterable, List, Optional
+from collections import deque
+import heapq, math, random
+
+DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1)) # Right, left, down, up.
+OPPOSITE = (1, 0, 3, 2)
+
+
+def _iter_bits(bits: int):
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+class TileModel:
+    """The tiles of a set of example levels and which of them can be
+    next to each other.
+    """
+    def __init__(self, spriteSheet: str):
+        self.spriteSheet = spriteSheet
+        self.tiles = [] # Tile ids. A tile's index is its bit in a domain.
+        self.indexes = {} # tile id: index
+        self.weights = [] # How many times each tile appears in the examples.
+        self.neighbours = [[] for _ in DIRECTIONS] # [direction][tile]: bits of tiles allowed there.
+        self.supportCache = [{} for _ in DIRECTIONS]
+        self.entropyCache = {}
+
+    def _getIndex(self, tile: str) -> int:
+        index = self.indexes.get(tile)
+        if index is None:
+            index = self.indexes[tile] = len(self.tiles)
+            self.tiles.append(tile)
+            self.weights.append(0)
+            for neighbours in self.neighbours:
+                neighbours.append(0)
+        return index
+
+    def addLevel(self, level: dict):
+        """Learn the tiles and neighbours of a level (a level dict from a
+        level file).
+        """
+        if level['spriteSheet'] != self.spriteSheet:
+            raise ValueError(f'{level["name"]} uses {level["spriteSheet"]}, not {self.spriteSheet}')
+        width, height = level['width'], level['height']
+        cells = [self._getIndex(tile) for tile in level['tileData']]
+        for index, tile in enumerate(cells):
+            self.weights[tile] += 1
+            x, y = index % width, index // width
+            for direction, (dx, dy) in enumerate(DIRECTIONS):
+                nx, ny = x + dx, y + dy
+                if 0 <= nx < width and 0 <= ny < height:
+                    self.neighbours[direction][tile] |= 1 << cells[ny * width + nx]
+        for cache in self.supportCache:
+            cache.clear()
+        self.entropyCache.clear()
+
+    def getAllTiles(self) -> int:
+        return (1 << len(self.tiles)) - 1
+
+    def getSupport(self, direction: int, domain: int) -> int:
+        """Return the bits of the tiles that can be in direction of a cell
+        that could be any tile in domain.
+        """
+        cache = self.supportCache[direction]
+        support = cache.get(domain)
+        if support is None:
+            neighbours = self.neighbours[direction]
+            support = 0
+            for tile in _iter_bits(domain):
+                support |= neighbours[tile]
+            cache[domain] = support
+        return support
+
+    def getEntropy(self, domain: int) -> float:
+        entropy = self.entropyCache.get(domain)
+        if entropy is None:
+            weights = [self.weights[tile] for tile in _iter_bits(domain)]
+            total = sum(weights)
+            entropy = math.log(total) - sum(w * math.log(w) for w in weights) / total
+            self.entropyCache[domain] = entropy
+        return entropy
+
+    def pickTile(self, domain: int, rng: random.Random) -> int:
+        """Return one of the tiles in domain, chosen by weight.
+        """
+        tiles = list(_iter_bits(domain))
+        return rng.choices(tiles, [self.weights[tile] for tile in tiles])[0]
+
+
+def learn_model(levels: Iterable[dict]) -> TileModel:
+    """Return a TileModel of example levels, which must share a sprite sheet.
+    """
+    model = None
+    for level in levels:
+        if model is None:
+            model = TileModel(level['spriteSheet'])
+        model.addLevel(level)
+    if model is None:
+        raise ValueError('No example levels to learn from')
+    return model
+
+
+def _collapse(model: TileModel, width: int, height: int, rng: random.Random) -> Optional[List[int]]:
+    """Run wave function collapse once. Return the tile index of each cell
+    or None if it ran into a cell with no tiles left.
+    """
+    domains = []
+    allTiles = model.getAllTiles()
+    # Tiles never seen with a neighbour in a direction can only be at that edge.
+    hasNeighbour = [sum(1 << t for t, bits in enumerate(neighbours) if bits) for neighbours in model.neighbours]
+    for y in range(height):
+        for x in range(width):
+            domain = allTiles
+            for direction, (dx, dy) in enumerate(DIRECTIONS):
+                if 0 <= x + dx < width and 0 <= y + dy < height:
+                    domain &= hasNeighbour[direction]
+            domains.append(domain)
+
+    supportCache = model.supportCache
+    def propagate(cells: list) -> bool:
+        changed = set()
+        queue = deque(cells)
+        pending = set(cells) # A cell only needs to be on the queue once.
+        while queue:
+            cell = queue.popleft()
+            pending.discard(cell)
+            domain = domains[cell]
+            x, y = cell % width, cell // width
+            for direction, (dx, dy) in enumerate(DIRECTIONS):
+                nx, ny = x + dx, y + dy
+                if not (0 <= nx < width and 0 <= ny < height):
+                    continue
+                neighbour = ny * width + nx
+                old = domains[neighbour]
+                support = supportCache[direction].get(domain)
+                if support is None:
+                    support = model.getSupport(direction, domain)
+                new = old & support
+                if new != old:
+                    if not new:
+                        return False
+                    domains[neighbour] = new
+                    changed.add(neighbour)
+                    if neighbour not in pending:
+                        pending.add(neighbour)
+                        queue.append(neighbour)
+        # Queued once the cells have settled rather than on every change.
+        for cell in sorted(changed):
+            domain = domains[cell]
+            if domain & (domain - 1): # Still more than one tile.
+                heapq.heappush(heap, (model.getEntropy(domain), rng.random(), cell, domain))
+        return True
+
+    heap = []
+    if not propagate(list(range(width * height))):
+        return None
+    heap = [] # Every cell is queued below anyway.
+    for cell, domain in enumerate(domains):
+        if domain & (domain - 1):
+            heap.append((model.getEntropy(domain), rng.random(), cell, domain))
+    heapq.heapify(heap)
+
+    while heap:
+        _, _, cell, domain = heapq.heappop(heap)
+        if domains[cell] != domain:
+            continue # Stale, the cell changed since this was pushed.
+        domains[cell] = 1 << model.pickTile(domain, rng)
+        if not propagate([cell]):
+            return None
+    return [domain.bit_length() - 1 for domain in domains]
+
+def generate_level(model: TileModel, name: str, width: int, height: int, seed: int = 0, attempts: int = 20) -> dict:
+    """Generate a level (a level dict like in a level file) from a model.
+    The same model and seed always give the same level.
+
+    WFC can paint itself into a corner; it's retried up to attempts times
+    before giving up with a ValueError.
+    """
+    rng = random.Random(seed)
+    for _ in range(attempts):
+        cells = _collapse(model, width, height, rng)
+        if cells is not None:
+            return {
+                'name': name,
+                'spriteSheet': model.spriteSheet,
+                'width': width,
+                'height': height,
+                'tileData': [model.tiles[tile] for tile in cells]
+            }
+    raise ValueError(f'Could not generate a {width}x{height} level in {attempts} attempts')
@@ -3,22 +3,31 @@
 # =======================================================
 
 # PyQt imports
-from PyQt5.QtGui import QIcon, QPainter, QPixmap, QPen, QColor, QFont, QBrush, QTransform
+from PyQt5.QtGui import QIcon, QPainter, QPixmap, QPen, QColor, QFont, QBrush, QTransform, QImage
 from PyQt5.QtCore import Qt, QSize, QLineF, QLine, QRect, QRectF, QTimer
 from PyQt5.QtWidgets import (QMainWindow, QLabel, QAction, QWidget,
 QVBoxLayout, QHBoxLayout, QGridLayout, QPushButton, QGraphicsView, QGraphicsScene,
-QGraphicsProxyWidget, QGraphicsPixmapItem, QFileDialog, QFrame, QListView,
+QGraphicsProxyWidget, QGraphicsPixmapItem, QGraphicsItem, QFileDialog, QFrame, QListView,
 QScrollArea, QButtonGroup, QComboBox, QTabWidget, QSizePolicy, QFormLayout,
-QLineEdit, QCheckBox, QDialog, QMessageBox)
+QLineEdit, QCheckBox, QDialog, QMessageBox, QInputDialog)
 
 # Other python imports
-import math, sys
-from typing import Tuple, Optional
+import json, math, sys
+import numpy as np
+from typing import Callable, Iterable, Tuple, Optional, List
 
 # Custom imports
 from . import cfg
-from .file import load_json, load_stylesheet, write_level_json, get_filename_from_path
+from .file import load_level_file, load_stylesheet, write_level_file, get_filename_from_path
 from .data import LevelData, AbstractTile
+from .layers import EMPTY_SPRITE
+from .entities import get_entity_bounds
+from .autotile import load_rules
+from .render import SpriteAtlas, get_image_pixels, render_level_png, shrink_pixels
+from .sheets import prefetch_sheets, get_sheet_pixmap
+from .regions import RegionLabels, FILL_KEYS, get_fill_key
+from .tileindex import get_tile_key
+from .journal import EditHistory, apply_edit, backup_journal, check_journal, get_journal_path, get_last_journal, replay_journal
 
 def is_level(d: dict) -> bool:
     """Simply checks that the first key is the level key
@@ -26,6 +35,14 @@ def is_level(d: dict) -> bool:
     """
     return list(d.keys())[0] == cfg.LEVEL_KEY
 
+def get_mask_image(mask: np.ndarray, color: QColor) -> QImage:
+    """Return an image of a 2d boolean array, one pixel per cell, with
+    the true cells in color.
+    """
+    height, width = mask.shape
+    pixels = np.where(mask, np.uint32(color.rgba()), np.uint32(0))
+    return QImage(pixels.data, width, height, width * 4, QImage.Format_ARGB32).copy()
+
 
 class MainWindow(QMainWindow):
     def __init__(self, parent):
@@ -37,24 +54,29 @@ class MainWindow(QMainWindow):
         self.workingDirectory = None
 
         self.levelData = None
+        self.activeLayer = None # Name of the layer being edited. None is the base layer (tileData).
 
-        # Arrays containing previous states of the current level's tileData
-        self.undoHistory = []
-        self.redoHistory = []
+        # Undo/redo history, kept in the edit journal of the open file. See journal.py
+        self.history = EditHistory()
 
         self.allCursorModes = [
             'draw',
             'fill',
-            'erase'
+            'erase',
+            'entity'
         ]
 
         self.cursorShortcuts = {
             'b': 'draw',
             'g': 'fill',
-            'e': 'erase'
+            'e': 'erase',
+            'o': 'entity'
         }
 
         self.cursorMode = 'draw'
+        # Rendered views of recently shown levels and the level shown in mapView.
+        self.viewCache = LevelViewCache(cfg.VIEW_CACHE_BUDGET)
+        self.shownLevel = None
         self.initUI() # Should be done last always!
 
     # =================
@@ -82,6 +104,13 @@ class MainWindow(QMainWindow):
         self.centralWidget.setLayout(self.layout)
         self.setupStyleSheet()
 
+        # Anything not needed to draw the first frame is loaded once the event loop starts.
+        QTimer.singleShot(0, self.finishStartup)
+
+    def finishStartup(self):
+        self.toolBar.loadIcons()
+        self.toolBar.loadTileMenus()
+
     def addWidgets(self):
         self.levelMenu = LevelMenuBar(self)
         self.mapView = MapView(self)
@@ -102,6 +131,8 @@ class MainWindow(QMainWindow):
     def setupStatusBar(self):
         self.statusBar = self.statusBar()
         self.statusComponents = {
+            'entity': QLabel(''), # Entity under the mouse.
+            'usages': QLabel(''), # Tiles found by Find Tile Usages.
             'levelName': QLabel(' No level open '),
             'levelSize': QLabel(' 0x0 '),
             'mousePos': QLabel(' (0, 0) '),
@@ -127,6 +158,12 @@ class MainWindow(QMainWindow):
         self.viewMenu = self.menubar.addMenu('&' + 'View')
         self.configureViewMenu()
 
+        self.layerMenu = self.menubar.addMenu('&' + 'Layers')
+        self.configureLayerMenu()
+
+        self.entityMenu = self.menubar.addMenu('&' + 'Entities')
+        self.configureEntityMenu()
+
     def configureFileMenu(self):
         newAct = QAction('&' + 'New Level', self)
         newAct.triggered.connect(self.newLevel)
@@ -144,6 +181,9 @@ class MainWindow(QMainWindow):
         saveAsAct.triggered.connect(self.saveAsAction)
         saveAsAct.setShortcut('Ctrl+Shift+S')
 
+        exportImageAct = QAction('&' + 'Export Level Image', self)
+        exportImageAct.triggered.connect(self.exportImageAction)
+
         exitAct = QAction('&' + 'Exit', self)
         exitAct.triggered.connect(self.close)
 
@@ -151,6 +191,7 @@ class MainWindow(QMainWindow):
         self.fileMenu.addAction(openAct)
         self.fileMenu.addAction(saveAct)
         self.fileMenu.addAction(saveAsAct)
+        self.fileMenu.addAction(exportImageAct)
         self.fileMenu.addAction(exitAct)
 
     def configureEditMenu(self):
@@ -168,10 +209,29 @@ class MainWindow(QMainWindow):
         resizeLevelAct = QAction('&' + 'Change Map Dimensions', self)
         resizeLevelAct.triggered.connect(self.resizeMapAction)
 
+        # Autotiling uses the rules file of the level's spritesheet. See autotile.py
+        self.autotileAct = QAction('&' + 'Autotile While Drawing', self)
+        self.autotileAct.setCheckable(True)
+
+        autotileLevelAct = QAction('&' + 'Autotile Level', self)
+        autotileLevelAct.triggered.connect(self.autotileLevelAction)
+
+        findUsagesAct = QAction('&' + 'Find Tile Usages', self)
+        findUsagesAct.triggered.connect(self.findUsagesAction)
+        findUsagesAct.setShortcut('Ctrl+F')
+
+        replaceTilesAct = QAction('&' + 'Replace Tiles', self)
+        replaceTilesAct.triggered.connect(self.replaceTilesAction)
+        replaceTilesAct.setShortcut('Ctrl+R')
+
         self.editMenu.addAction(undoAct)
         self.editMenu.addAction(redoAct)
         self.editMenu.addAction(changeTileAct)
         self.editMenu.addAction(resizeLevelAct)
+        self.editMenu.addAction(self.autotileAct)
+        self.editMenu.addAction(autotileLevelAct)
+        self.editMenu.addAction(findUsagesAct)
+        self.editMenu.addAction(replaceTilesAct)
 
     def configureViewMenu(self):
         self.gridAct = QAction('&' + 'Toggle Grid', self)
@@ -189,10 +249,48 @@ class MainWindow(QMainWindow):
         defaultZoomAct = QAction('&' + 'Reset Zoom', self)
         defaultZoomAct.triggered.connect(self.setDefaultZoom)
 
+        fitZoomAct = QAction('&' + 'Zoom to Fit', self)
+        fitZoomAct.triggered.connect(self.fitZoomAction)
+        fitZoomAct.setShortcut('Ctrl+0')
+
         self.viewMenu.addAction(self.gridAct)
         self.viewMenu.addAction(zoomInAct)
         self.viewMenu.addAction(zoomOutAct)
         self.viewMenu.addAction(defaultZoomAct)
+        self.viewMenu.addAction(fitZoomAct)
+
+    def configureLayerMenu(self):
+        addLayerAct = QAction('&' + 'Add Layer', self)
+        addLayerAct.triggered.connect(self.addLayerAction)
+
+        removeLayerAct = QAction('&' + 'Remove Layer', self)
+        removeLayerAct.triggered.connect(self.removeLayerAction)
+
+        toggleLayerAct = QAction('&' + 'Toggle Layer Visibility', self)
+        toggleLayerAct.triggered.connect(self.toggleLayerAction)
+        toggleLayerAct.setShortcut('Ctrl+H')
+
+        self.layerMenu.addAction(addLayerAct)
+        self.layerMenu.addAction(removeLayerAct)
+        self.layerMenu.addAction(toggleLayerAct)
+
+    def configureEntityMenu(self):
+        editEntityAct = QAction('&' + 'Edit Entity Properties', self)
+        editEntityAct.triggered.connect(self.editEntityAction)
+        editEntityAct.setShortcut('Ctrl+E')
+
+        deleteEntitiesAct = QAction('&' + 'Delete Selected Entities', self)
+        deleteEntitiesAct.triggered.connect(self.deleteEntitiesAction)
+        deleteEntitiesAct.setShortcut('Delete')
+
+        self.showEntitiesAct = QAction('&' + 'Show Entities', self)
+        self.showEntitiesAct.setCheckable(True)
+        self.showEntitiesAct.setChecked(True)
+        self.showEntitiesAct.toggled.connect(self.toggleEntitiesAction)
+
+        self.entityMenu.addAction(editEntityAct)
+        self.entityMenu.addAction(deleteEntitiesAct)
+        self.entityMenu.addAction(self.showEntitiesAct)
 
     # ====================
     # FILE RELATED METHODS
@@ -221,8 +319,10 @@ class MainWindow(QMainWindow):
         if newFile:
             file = {cfg.LEVEL_KEY: {levelName: data_dict}}
             self.workingDirectory = None
+            dirtyLevels = set()
         else:
             file = self.levelData.getLevelJson()
+            dirtyLevels = self.levelData.getDirtyLevels() | {levelName}
 
             if levelName in file[cfg.LEVEL_KEY]: # Check if level already exists.
                 msg = f'Detected an existing level in file with name {levelName}. Do you want to overwrite this data?'
@@ -235,56 +335,145 @@ class MainWindow(QMainWindow):
             newLevelDialog.close()
 
         self.loadLevelData(file)
+        self.levelData.markDirty(*dirtyLevels)
 
         if newFile:
-            self.clearHistory()
+            self.history.start(None)
         else:
             self.levelMenu.setLevel(levelName)
+        self.history.addLevel(levelName, data_dict)
 
     def clearHistory(self):
-        self.undoHistory.clear()
-        self.redoHistory.clear()
+        self.history.clear()
+
+    def recordLevel(self):
+        """Journal the whole of the current level after a change that isn't
+        in the undo history.
+        """
+        self.history.addLevel(self.shownLevel, self.levelData.getLevel())
 
     def getLevelData(self):
         return self.levelData
 
+    def closeEvent(self, event):
+        # The journal is only kept for recovering from a crash.
+        self.history.close()
+        super().closeEvent(event)
+
     def loadLevelData(self, file: dict):
         """Load in level data from a given file (json.load() dictionary).
         """
         self.levelData = LevelData(file)
+        self.viewCache.clear()
+        self.shownLevel = None
+        # Decode every sheet the file uses in the background so switching levels doesn't wait.
+        prefetch_sheets(self.levelData.getSpriteURL(levelName) for levelName in self.levelData.getLevelNames())
         self.levelMenu.enableLevelSelect()
         self.levelMenu.updateLevelSelect(self.levelData.getLevelNames())
 
     def loadLevel(self, levelName: str):
         """Load in specified level from level data file.
+
+        A level shown recently is restored from self.viewCache as it was
+        left unless it changed since.
         """
         self.statusComponents['levelName'].setText(' ' + levelName + ' ')
+        self.shownLevel = levelName
+        view = self.viewCache.take(levelName, self.levelData.getRevision(levelName))
+        if view is not None:
+            self.restoreView(view)
+            return
+
+        self.toolBar.loadTileMenus()
+        self.mapView.hiddenLayers.clear()
         self.mapView.drawLevel()
+        self.updateLayerSelect()
 
         spriteURL = self.levelData.getSpriteURL()
         self.toolBar.tileTabMenu.loadTiles(spriteURL)
         self.setDefaultZoom()
 
+    def takeView(self) -> dict:
+        """Return the rendered state of the shown level, leaving mapView
+        and the tile menus empty.
+        """
+        tileTabMenu = self.toolBar.tileTabMenu
+        menus = {name: menu.takeView() for name, menu in tileTabMenu.tileMenus.items()}
+        view = {
+            'map': self.mapView.takeView(),
+            'menus': menus,
+            'zoom': self.zoom,
+            'activeLayer': self.activeLayer
+        }
+        view['size'] = view['map']['size'] + sum(menu['byteSize'] for menu in menus.values())
+        return view
+
+    def restoreView(self, view: dict):
+        self.mapView.restoreView(view['map'])
+        for name, menu in self.toolBar.tileTabMenu.tileMenus.items():
+            menu.restoreView(view['menus'][name])
+        self.zoom = view['zoom']
+        self.statusComponents['zoom'].setText(f' {int(self.zoom * 100)}% ')
+        self.updateLayerSelect(view['activeLayer'])
+
     def saveLevelData(self):
         """Save levelData to file specified in self.workingDirectory.
 
         Precondition: self.workingDirectory is not None
         """
         file = self.levelData.getLevelJson()
-        print('SAVED!')
-        s = write_level_json(self.workingDirectory, file)
+        report = write_level_file(self.workingDirectory, file, self.levelData.getDirtyLevels())
+        self.levelData.clearDirty()
+        self.history.markSaved(self.workingDirectory)
+        if report:
+            message = f'Saved {get_filename_from_path(self.workingDirectory)}: ' + '; '.join(report.splitlines())
+        else:
+            message = 'No changes to save.'
+        self.statusBar.showMessage(message, 10000)
 
     def openLevelAction(self):
         directory = cfg.level_dir if cfg.SETTINGS['inRepo'] else cfg.main_dir
-        path = QFileDialog.getOpenFileName(None, 'Open Level', directory, 'Level data file (*.json)')[0]
+        path = QFileDialog.getOpenFileName(None, 'Open Level', directory, 'Level data file (*.json *.lvl)')[0]
+        if path != '' and self.offerRecovery(get_journal_path(path)):
+            return
         self.workingDirectory = path
-        file = load_json(path) if path != '' else None
+        file = load_level_file(path) if path != '' else None
         if file and is_level(file): # Check if filename isn't blank
             self.loadLevelData(file)
-            self.clearHistory()
+            self.history.start(path)
         elif file and not is_level(file):
             QMessageBox.information(None, ' ', 'Not a valid level file.')
 
+    def offerRecovery(self, journalPath=None) -> bool:
+        """Offer to replay the unsaved edits in a journal left behind by a
+        crash, by default the one of the last session. Return True if they
+        were recovered.
+        """
+        state = check_journal(journalPath or get_last_journal())
+        if state is None:
+            return False
+        name = get_filename_from_path(state.levelFile) if state.levelFile else 'an unsaved level file'
+        if not state.isCurrent():
+            backupPath = backup_journal(state.journalPath)
+            self.statusBar.showMessage(f'{name} changed since its edit journal was written. Not recovering it, the journal was moved to {backupPath}.', 10000)
+            return False
+        msg = f'The editor closed with {state.getUnsavedCount()} unsaved edits to {name}. Recover them?'
+        if QMessageBox.question(self, 'Message', msg, QMessageBox.Yes | QMessageBox.No) == QMessageBox.No:
+            # Kept in case they're wanted after all, the level's next journal would overwrite them.
+            backupPath = backup_journal(state.journalPath)
+            self.statusBar.showMessage(f'Unsaved edits to {name} not recovered, their journal was moved to {backupPath}.', 10000)
+            return False
+        file = load_level_file(state.levelFile) if state.levelFile else {cfg.LEVEL_KEY: {}}
+        if not file:
+            QMessageBox.warning(None, ' ', f'Could not open {name}.')
+            return False
+        changed, undoStack, redoStack = replay_journal(state, file)
+        self.workingDirectory = state.levelFile
+        self.loadLevelData(file)
+        self.levelData.markDirty(*changed)
+        self.history.resume(state, undoStack, redoStack)
+        return True
+
     def saveAction(self):
         if self.levelData and self.workingDirectory:
             self.saveLevelData()
@@ -296,7 +485,7 @@ class MainWindow(QMainWindow):
     def saveAsAction(self):
         if self.levelData:
             directory = cfg.level_dir if cfg.SETTINGS['inRepo'] else cfg.data_dir
-            path = QFileDialog.getSaveFileName(None, 'Save Level', directory, '(*.json)')[0]
+            path = QFileDialog.getSaveFileName(None, 'Save Level', directory, 'Level data file (*.json);;Binary level file (*.lvl)')[0]
             if path == '':
                 return
             self.workingDirectory = path
@@ -304,28 +493,44 @@ class MainWindow(QMainWindow):
         else:
             QMessageBox.information(None, ' ', 'Nothing to save.')
 
+    def exportImageAction(self):
+        if self.levelData:
+            level = self.levelData.getLevel()
+            path = QFileDialog.getSaveFileName(None, 'Export Level Image', level['name'] + '.png', 'PNG image (*.png)')[0]
+            if path == '':
+                return
+            try:
+                render_level_png(level, path)
+            except (ValueError, FileNotFoundError) as e:
+                QMessageBox.warning(None, ' ', str(e))
+        else:
+            QMessageBox.information(None, ' ', 'No level to export.')
+
     # ====================
     # EDIT RELATED METHODS
     # ====================
-    def _applyHistory(self, stack1, stack2):
-        """Appends a copy of current tileData to stack1
-        and removes it from stack2.
+    def _applyHistory(self, record: dict, undo: bool):
+        """Revert (or redo) an edit from the history, switching to the
+        level it was made in first.
 
         This is just a general function for undo / redo
         because the logic is the same.
         """
-        if self.levelData and stack2:
-            stack1.append(self.levelData.getTileData().copy())
-            self.levelData.setTileData(stack2.pop())
-            self.mapView.redrawLevel()
+        if record['level'] != self.shownLevel:
+            self.levelMenu.levelSelectBox.setCurrentText(record['level'])
+        changed = apply_edit(self.levelData, record, undo)
+        if changed is None:
+            self.mapView.resetEntities()
+        else:
+            self.mapView.renderLayer(record['layer'], changed)
 
     def undoAction(self):
-        if self.levelData and self.undoHistory:
-            self._applyHistory(self.redoHistory, self.undoHistory)
+        if self.levelData and self.history.canUndo():
+            self._applyHistory(self.history.undo(), True)
 
     def redoAction(self):
-        if self.levelData and self.redoHistory:
-            self._applyHistory(self.undoHistory, self.redoHistory)
+        if self.levelData and self.history.canRedo():
+            self._applyHistory(self.history.redo(), False)
 
     def changeTilesetAction(self):
         if self.levelData:
@@ -333,19 +538,141 @@ class MainWindow(QMainWindow):
             path = QFileDialog.getOpenFileName(None, 'Choose a level spritesheet', directory, 'PNG (*.png)')[0]
             if path:
                 filename = get_filename_from_path(path).replace('.png', '')
-                self.levelData.getLevel()["spriteSheet"] = filename
+                self.levelData.setSpriteSheet(filename)
+                self.recordLevel()
                 self.toolBar.tileTabMenu.clearTiles()
                 self.toolBar.tileTabMenu.loadTiles(path)
                 self.mapView.redrawLevel()
         else:
             QMessageBox.information(None, ' ', 'No level to load tileset into.')
 
+    def addLayerAction(self):
+        if self.levelData:
+            layerName, ok = QInputDialog.getText(self, 'Add Layer', 'Layer name:')
+            layerName = layerName.strip()
+            if not ok or not layerName:
+                return
+            if layerName in self.levelData.getLayerNames():
+                QMessageBox.information(None, ' ', f'There is already a layer named {layerName}.')
+                return
+            self.levelData.addLayer(layerName)
+            self.recordLevel()
+            self.mapView.redrawLevel()
+            self.updateLayerSelect(layerName)
+        else:
+            QMessageBox.information(None, ' ', 'No level to add a layer to.')
+
+    def removeLayerAction(self):
+        if self.levelData and self.activeLayer is not None:
+            msg = f'Remove layer {self.activeLayer} and all of its tiles?'
+            if QMessageBox.question(self, 'Message', msg, QMessageBox.Yes | QMessageBox.No) == QMessageBox.No:
+                return
+            self.levelData.removeLayer(self.activeLayer)
+            self.clearHistory()
+            self.recordLevel()
+            self.mapView.redrawLevel()
+            self.updateLayerSelect()
+        else:
+            QMessageBox.information(None, ' ', 'Select a layer to remove. The base layer can not be removed.')
+
+    def toggleLayerAction(self):
+        if self.levelData:
+            self.mapView.setLayerVisible(self.activeLayer, self.activeLayer in self.mapView.hiddenLayers)
+
+    def setActiveLayer(self, layerName):
+        self.activeLayer = layerName
+
+    def updateLayerSelect(self, activeLayer=None):
+        self.activeLayer = activeLayer
+        self.levelMenu.updateLayerSelect(self.levelData.getLayerNames(), activeLayer)
+
+    def editEntityAction(self):
+        """Edit the properties of the selected entity as json.
+        """
+        selected = self.mapView.selectedEntities
+        if not self.levelData or len(selected) != 1:
+            QMessageBox.information(None, ' ', 'Select one entity to edit with the entity tool.')
+            return
+        key = next(iter(selected))
+        entities = self.levelData.getEntities()
+        text, ok = QInputDialog.getMultiLineText(self, 'Edit Entity', 'Properties:',
+            json.dumps(entities.get(key), indent=4))
+        if not ok:
+            return
+        try:
+            entity = json.loads(text)
+            if not (isinstance(entity, dict) and entity.get('name') in cfg.ENTITY_TYPES):
+                raise ValueError('name must be one of ' + ', '.join(cfg.ENTITY_TYPES))
+            if not all(isinstance(entity.get(k), (int, float)) for k in ('x', 'y')):
+                raise ValueError('x and y must be numbers')
+        except ValueError as e:
+            QMessageBox.warning(None, ' ', f'Invalid entity: {e}')
+            return
+        before = entities.toList()
+        self.mapView.updateEntities([key])
+        self.levelData.setEntity(key, entity)
+        self.mapView.updateEntities([key])
+        self.mapView.saveEntityHistory(before)
+
+    def deleteEntitiesAction(self):
+        if self.levelData and self.mapView.selectedEntities:
+            before = self.levelData.getEntities().toList()
+            keys = sorted(self.mapView.selectedEntities)
+            self.mapView.updateEntities(keys)
+            self.levelData.removeEntities(keys)
+            self.mapView.selectedEntities.clear()
+            self.mapView.hoveredEntity = None
+            self.mapView.saveEntityHistory(before)
+
+    def toggleEntitiesAction(self, visible: bool):
+        if self.mapView.entityItem is not None:
+            self.mapView.entityItem.setVisible(visible)
+
+    def autotileLevelAction(self):
+        if self.levelData:
+            oldTileData = self.levelData.getTileData().copy()
+            changed = self.levelData.autotile()
+            if changed:
+                self.mapView.saveTileHistory(None, oldTileData, changed)
+                self.mapView.renderLayer(None, changed)
+            elif load_rules(self.levelData.getLevel()["spriteSheet"]) is None:
+                QMessageBox.information(None, ' ', 'The level\'s spritesheet has no autotile rules.')
+        else:
+            QMessageBox.information(None, ' ', 'No level to autotile.')
+
     def resizeMapAction(self):
         if self.levelData:
             ResizeMapWindow(self).show()
         else:
             QMessageBox.information(None, ' ', 'No level to change.')
 
+    def getSelectedTileValue(self) -> str:
+        """Return the sprite or type of the selected tile in the tile menus.
+        """
+        tileTabMenu = self.toolBar.tileTabMenu
+        selectedTile = tileTabMenu.getActiveSelection()
+        if not selectedTile:
+            return ''
+        if tileTabMenu.getActiveMenu() == 'Tile Ids':
+            return str(selectedTile.getMetaData()["id"])
+        return '{}-{}'.format(selectedTile.getMetaData()["sprite_x"], selectedTile.getMetaData()["sprite_y"])
+
+    def findUsagesAction(self):
+        if not self.levelData:
+            QMessageBox.information(None, ' ', 'No level to search.')
+            return
+        value, ok = QInputDialog.getText(self, 'Find Tile Usages',
+            'Tile id (4-4-FL), sprite (4-4) or type (FL). Leave empty to clear:',
+            text=self.mapView.usageHighlight or self.getSelectedTileValue())
+        if ok:
+            self.mapView.setUsageHighlight(value.strip() or None)
+
+    def replaceTilesAction(self):
+        if self.levelData:
+            ReplaceTilesWindow(self).show()
+        else:
+            QMessageBox.information(None, ' ', 'No level to change.')
+
     # ====================
     # EDIT RELATED METHODS
     # ====================
@@ -356,11 +683,18 @@ class MainWindow(QMainWindow):
             self.statusComponents['zoom'].setText(f' {int(self.zoom * 100)}% ')
 
     def zoomOutAction(self):
-        if self.levelData and self.zoom > 0.7:
+        # Big levels can zoom out until the whole level fits.
+        if self.levelData and self.zoom > min(0.7, self.mapView.getFitZoom()):
             self.mapView.scale(0.8, 0.8)
             self.zoom *= 0.8
             self.statusComponents['zoom'].setText(f' {int(self.zoom * 100)}% ')
 
+    def fitZoomAction(self):
+        if self.levelData:
+            self.zoom = min(1, self.mapView.getFitZoom())
+            self.mapView.setTransform(QTransform.fromScale(self.zoom, self.zoom))
+            self.statusComponents['zoom'].setText(f' {int(self.zoom * 100)}% ')
+
     def setDefaultZoom(self):
         if self.levelData:
             self.mapView.setTransform(QTransform())
@@ -385,12 +719,18 @@ class MainWindow(QMainWindow):
             self.mapView.updateScene()
 
     def clearLevel(self):
-        """Clear anything associated with the current level.
+        """Clear anything associated with the current level. Its rendered
+        state is kept in self.viewCache.
 
         Note: It does NOT touch self.levelData
         """
-        self.toolBar.tileTabMenu.clearTiles()
-        self.mapView.clearScene(True)
+        if self.levelData and self.shownLevel in self.levelData.getLevelNames():
+            view = self.takeView()
+            self.viewCache.store(self.shownLevel, self.levelData.getRevision(self.shownLevel), view, view['size'])
+        else:
+            self.toolBar.tileTabMenu.clearTiles()
+            self.mapView.clearScene(True)
+        self.shownLevel = None
 
 
 class CustomView(QGraphicsView):
@@ -429,7 +769,19 @@ class MapView(CustomView):
         super().__init__()
         self.parent = parent
         self.checkerTileSize = 16
+        self.checkerBrush = None # Tiled pattern of the checker grid. See drawCheckerGrid()
         self.mousePos = None
+        self.spriteAtlas = None # Sprites of the shown level's sheet. See LayerItem
+        self.layerItems = {} # Layer name (None for the base layer): LayerItem
+        self.hiddenLayers = set()
+        self.entityItem = None
+        self.selectedEntities = set() # Keys of the selected entities.
+        self.hoveredEntity = None
+        self.entityDrag = None # ('move' or 'box', start position) while dragging with the entity tool.
+        self.fillRegions = {} # (layer name, fill key): RegionLabels of the shown level.
+        self.fillPreview = None # (RegionLabels, label, rect, QImage) last drawn by drawFillPreview().
+        self.usageHighlight = None # Tile id, sprite or type highlighted. See setUsageHighlight()
+        self.usagePreview = None # (key, rect, QImage) last drawn by drawUsageHighlight().
         self.editTimer = QTimer()
         self.editTimer.setInterval(1)
         self.editTimer.timeout.connect(self.editMapEvent)
@@ -441,18 +793,28 @@ class MapView(CustomView):
     # =================
     def drawBackground(self, painter, rect):
         if self.parent.levelData:
-            self.drawCheckerGrid(painter)
+            self.drawCheckerGrid(painter, rect)
 
     def drawForeground(self, painter, rect):
         if self.parent.levelData and self.parent.toolBar.tileTabMenu.getActiveMenu() == 'Tile Ids':
-            self.drawTileIds(painter)
+            self.drawTileIds(painter, rect)
+
+        if self.parent.levelData and self.usageHighlight:
+            self.drawUsageHighlight(painter)
 
         if self.parent.gridAct.isChecked() and self.parent.levelData:
-            self.drawGrid(painter)
+            self.drawGrid(painter, rect)
+
+        if self.parent.levelData and self.parent.cursorMode == 'fill' and self.mousePos:
+            self.drawFillPreview(painter)
 
         if self.parent.levelData and self.parent.cursorMode in ('fill', 'draw', 'erase') and self.mousePos:
             self.drawSelectOutline(painter)
 
+        if self.entityDrag and self.entityDrag[0] == 'box' and self.mousePos:
+            painter.setPen(QColor(cfg.colors['light teal']))
+            painter.drawRect(self.getBoxRect())
+
         self.updateSceneSize() # Call this once everything is drawn.
 
     def mouseMoveEvent(self, event):
@@ -460,19 +822,33 @@ class MapView(CustomView):
         topleft = self.getNearestTopLeft(pos.x(), pos.y())
         s = f'({int(topleft[0] / cfg.TILESIZE)},{int(topleft[1] / cfg.TILESIZE)})'
         self.parent.statusComponents['mousePos'].setText(' ' + s + ' ')
+        lastPos = self.mousePos
         self.mousePos = (pos.x(), pos.y())
+        if self.parent.cursorMode == 'entity' and self.parent.levelData:
+            self.entityMoveEvent(lastPos)
+            # Only the selection box needs the whole view repainted.
+            if self.entityDrag and self.entityDrag[0] == 'box':
+                self.updateScene()
+            return
         self.updateScene()
 
     def mousePressEvent(self, event):
+        if self.parent.cursorMode == 'entity':
+            self.entityPressEvent(event)
+            return
         self.editMapEvent()
         self.startEditTimer()
 
     def mouseReleaseEvent(self, event):
+        if self.parent.cursorMode == 'entity':
+            self.entityReleaseEvent(event)
+            return
         self.stopEditTimer()
 
     def leaveEvent(self, event):
         self.mousePos = None
         self.stopEditTimer()
+        self.setHoveredEntity(None)
         self.updateScene()
 
     # ==============
@@ -526,6 +902,14 @@ class MapView(CustomView):
         """
         return self.parent.levelData.getMapSize(cfg.TILESIZE)
 
+    def getFitZoom(self) -> float:
+        """Return the zoom at which the whole level fits in the view.
+        Precondition: self.parent.levelData is not None
+        """
+        width, height = self.getMapSize()
+        viewport = self.viewport()
+        return min(viewport.width() / max(width, 1), viewport.height() / max(height, 1))
+
     # ==========================
     # LEVEL MANIPULATION METHODS
     # ==========================
@@ -534,143 +918,757 @@ class MapView(CustomView):
         """
         cursorMode = self.parent.cursorMode
         levelData = self.parent.getLevelData()
-        tileTabMenu = self.parent.toolBar.tileTabMenu
+        layerName = self.parent.activeLayer
         levelWidth, levelHeight = levelData.getMapSize(cfg.TILESIZE)
         x, y = self.mousePos
         # We only care if it's in level bounds
         if x < levelWidth and y < levelHeight:
-            oldTileData = levelData.getTileData().copy()
+            tileData = levelData.getLayerTiles(layerName)
             index = self.getNearestTileIndex(x, y)
-            activeTileMenu = tileTabMenu.getActiveMenu()
-            selectedTile = tileTabMenu.getActiveSelection()
-            tile_data = levelData.getTileData()[index].split('-')
-            if cursorMode == 'draw' and activeTileMenu == 'Tile Sprites' and selectedTile:
-                tile_data[0] = str(selectedTile.getMetaData()["sprite_x"])
-                tile_data[1] = str(selectedTile.getMetaData()["sprite_y"])
-                if tile_data[2] == cfg.EMPTY_TILE_ID:
-                    tile_data[2] = 'FL' # Floor is the default value for anything not empty.
-                tile_data = '-'.join(tile_data)
-                levelData.setTile(index, tile_data)
-            elif cursorMode == 'draw' and activeTileMenu == 'Tile Ids' and selectedTile:
-                tile_data[2] = selectedTile.getMetaData()["id"]
-                tile_data = '-'.join(tile_data)
-                levelData.setTile(index, tile_data)
-            elif cursorMode == 'erase':
-                levelData.eraseTile(index)
-            elif cursorMode == 'fill' and activeTileMenu == 'Tile Sprites' and selectedTile:
-                source_id = '-'.join(tile_data)
-                tile_data[0] = str(selectedTile.getMetaData()["sprite_x"])
-                tile_data[1] = str(selectedTile.getMetaData()["sprite_y"])
-                if tile_data[2] == cfg.EMPTY_TILE_ID:
-                    tile_data[2] = 'FL'
-                new_id = '-'.join(tile_data)
-                levelData.fillTiles(index, new_id, fill_indexes=(0, 2))
-            elif cursorMode == 'fill' and activeTileMenu == 'Tile Ids' and selectedTile:
-                source_id = '-'.join(tile_data)
-                tile_data[2] = str(selectedTile.getMetaData()["id"])
-                new_id = '-'.join(tile_data)
-                levelData.fillTiles(index, new_id, fill_indexes=(2, cfg.TILE_ARRAY_SIZE))
+            # Only the tiles the edit can touch are kept for the history, the
+            # layer isn't copied on every tick of a stroke. A fill touches its
+            # region, which is already known. See getFillRegion()
+            region = None
+            if cursorMode == 'fill' and self.canFill(layerName):
+                region = self.getFillRegion(layerName, index)
+            touched = [index] if region is None else region
+            oldTiles = {i: tileData[i] for i in touched}
+            if layerName is None:
+                self.editBaseLayer(index, region)
+            else:
+                self.editLayer(layerName, index, region)
 
             # Checks if there was a change made.
-            if oldTileData != levelData.getTileData():
-                self.parent.undoHistory.append(oldTileData)
-                self.parent.redoHistory.clear()
-                self.redrawLevel()
-
-    # =====================
-    # SCENE DRAWING METHODS
-    # =====================
-    def drawCheckerGrid(self, painter):
-        """Draws a pattern of grey and white squares into the scene.
-        Used to represent transparency in the background.
+            changed = [i for i in touched if tileData[i] != oldTiles[i]]
+            if changed:
+                if layerName is None and self.parent.autotileAct.isChecked():
+                    changed += levelData.autotile(changed, oldTiles=oldTiles)
+                self.saveTileHistory(layerName, oldTiles, changed)
+                self.renderLayer(layerName, changed)
+
+    def editBaseLayer(self, index: int, region=None):
+        cursorMode = self.parent.cursorMode
+        levelData = self.parent.getLevelData()
+        tileTabMenu = self.parent.toolBar.tileTabMenu
+        activeTileMenu = tileTabMenu.getActiveMenu()
+        selectedTile = tileTabMenu.getActiveSelection()
+        tile_data = levelData.getTileData()[index].split('-')
+        if cursorMode == 'draw' and activeTileMenu == 'Tile Sprites' and selectedTile:
+            tile_data[0] = str(selectedTile.getMetaData()["sprite_x"])
+            tile_data[1] = str(selectedTile.getMetaData()["sprite_y"])
+            if tile_data[2] == cfg.EMPTY_TILE_ID:
+                tile_data[2] = 'FL' # Floor is the default value for anything not empty.
+            tile_data = '-'.join(tile_data)
+            levelData.setTile(index, tile_data)
+        elif cursorMode == 'draw' and activeTileMenu == 'Tile Ids' and selectedTile:
+            tile_data[2] = selectedTile.getMetaData()["id"]
+            tile_data = '-'.join(tile_data)
+            levelData.setTile(index, tile_data)
+        elif cursorMode == 'erase':
+            levelData.eraseTile(index)
+        elif cursorMode == 'fill' and activeTileMenu == 'Tile Sprites' and selectedTile:
+            tile_data[0] = str(selectedTile.getMetaData()["sprite_x"])
+            tile_data[1] = str(selectedTile.getMetaData()["sprite_y"])
+            if tile_data[2] == cfg.EMPTY_TILE_ID:
+                tile_data[2] = 'FL'
+            new_id = '-'.join(tile_data)
+            levelData.fillTiles(index, new_id, fill_indexes=(0, 2), region=region)
+        elif cursorMode == 'fill' and activeTileMenu == 'Tile Ids' and selectedTile:
+            tile_data[2] = str(selectedTile.getMetaData()["id"])
+            new_id = '-'.join(tile_data)
+            levelData.fillTiles(index, new_id, fill_indexes=(2, cfg.TILE_ARRAY_SIZE), region=region)
+
+    def editLayer(self, layerName: str, index: int, region=None):
+        """Extra layers only hold sprites so tile ids can't be drawn on them.
+        region is the fill region at index if it's already known.
+        """
+        cursorMode = self.parent.cursorMode
+        levelData = self.parent.getLevelData()
+        tileTabMenu = self.parent.toolBar.tileTabMenu
+        selectedTile = tileTabMenu.getActiveSelection()
+        sprite = None
+        if cursorMode == 'erase':
+            sprite = EMPTY_SPRITE
+        elif tileTabMenu.getActiveMenu() == 'Tile Sprites' and selectedTile:
+            sprite = '{}-{}'.format(selectedTile.getMetaData()["sprite_x"], selectedTile.getMetaData()["sprite_y"])
+
+        if sprite is None:
+            return
+        if cursorMode == 'fill':
+            levelData.fillLayer(layerName, index, sprite, region=region)
+        else:
+            levelData.setLayerTile(layerName, index, sprite)
 
-        Precondition: self.parent.level is not None
+    def canFill(self, layerName) -> bool:
+        """Return True if the tile menus have a tile selected that can fill
+        a layer.
         """
-        mapSize = self.getMapSize()
-        width, height = mapSize[0], mapSize[1]
+        tileTabMenu = self.parent.toolBar.tileTabMenu
+        activeTileMenu = tileTabMenu.getActiveMenu()
+        if layerName is not None and activeTileMenu != 'Tile Sprites':
+            return False
+        return bool(tileTabMenu.getActiveSelection()) and activeTileMenu in ('Tile Sprites', 'Tile Ids')
+
+    def getFillRegions(self, layerName, index: int) -> RegionLabels:
+        """Return the fill regions a fill at index on a layer would use with
+        the active tile menu. They're labelled on first use and kept up to
+        date by renderLayer().
+        """
+        levelData = self.parent.getLevelData()
+        tiles = levelData.getLayerTiles(layerName)
+        typeFill = self.parent.toolBar.tileTabMenu.getActiveMenu() == 'Tile Ids'
+        key = (layerName, get_fill_key(layerName, tiles[index], typeFill))
+        if key not in self.fillRegions:
+            self.fillRegions[key] = RegionLabels(tiles, levelData.getWidth(), FILL_KEYS[key[1]])
+        return self.fillRegions[key]
+
+    def getFillRegion(self, layerName, index: int) -> List[int]:
+        """Return the indexes of the tiles a fill at index would cover.
+        """
+        return self.getFillRegions(layerName, index).getIndexes(index)
 
-        tileSize = self.checkerTileSize
+    def updateFillRegions(self, layerName, indexes=None):
+        """Update the fill regions of a layer after the tiles at indexes
+        changed. They're dropped if indexes is None.
+        """
+        tiles = self.parent.getLevelData().getLayerTiles(layerName)
+        for key in [key for key in self.fillRegions if key[0] == layerName]:
+            if indexes is None:
+                del self.fillRegions[key]
+            else:
+                self.fillRegions[key].update(tiles, indexes)
 
-        yrange = math.ceil(height / tileSize)
-        xrange = math.ceil(width / tileSize)
-        for y in range(yrange):
-            for x in range(xrange):
-                if (x + y) % 2 == 0: # Make every other square light grey.
-                    color = QColor(cfg.colors['grey light'])
-                else:
-                    color = QColor(cfg.colors['grey lighter'])
+    # =====================
+    # ENTITY EDITING METHODS
+    # =====================
+    # With the entity tool, clicking an entity selects it and dragging
+    # moves the selection. Clicking an empty spot places an entity of the
+    # type picked in the menu bar on the middle of the tile and dragging
+    # from one selects every entity in the box. Shift adds to the selection.
+    def entityPressEvent(self, event):
+        levelData = self.parent.getLevelData()
+        if not levelData or not self.mousePos or not self.parent.showEntitiesAct.isChecked():
+            return
+        key = levelData.getEntities().hitTest(*self.mousePos)
+        shift = event.modifiers() & Qt.ShiftModifier
+        if key is None:
+            self.entityDrag = ('box', self.mousePos)
+            return
+
+        if shift and key in self.selectedEntities:
+            self.setSelectedEntities(self.selectedEntities - {key})
+            return
+        if shift:
+            self.setSelectedEntities(self.selectedEntities | {key})
+        elif key not in self.selectedEntities:
+            self.setSelectedEntities({key})
+        # Saved on release if anything moved so clicks don't fill the undo history.
+        self.entityDrag = ('move', self.mousePos, levelData.getEntities().toList())
+
+    def entityMoveEvent(self, lastPos):
+        levelData = self.parent.getLevelData()
+        entities = levelData.getEntities()
+        if self.entityDrag is None:
+            self.setHoveredEntity(entities.hitTest(*self.mousePos))
+        elif self.entityDrag[0] == 'move' and lastPos:
+            dx, dy = round(self.mousePos[0] - lastPos[0]), round(self.mousePos[1] - lastPos[1])
+            # Keep the remainder so slow drags still move.
+            self.mousePos = (lastPos[0] + dx, lastPos[1] + dy)
+            keys = sorted(self.selectedEntities)
+            self.updateEntities(keys)
+            levelData.moveEntities(keys, dx, dy)
+            self.updateEntities(keys)
+
+    def entityReleaseEvent(self, event):
+        drag, self.entityDrag = self.entityDrag, None
+        levelData = self.parent.getLevelData()
+        if drag is not None and drag[0] == 'move' and levelData.getEntities().toList() != drag[2]:
+            self.saveEntityHistory(drag[2])
+        if drag is None or drag[0] != 'box' or not self.mousePos:
+            return
+        shift = event.modifiers() & Qt.ShiftModifier
+        box = self.getBoxRect(drag[1])
+        self.updateScene()
+        if box.width() < 4 and box.height() < 4:
+            self.placeEntity(*drag[1])
+            return
+        keys = levelData.getEntities().query(box.x(), box.y(), box.width(), box.height())
+        self.setSelectedEntities((self.selectedEntities if shift else set()) | set(keys))
 
-                painter.setPen(color)
-                painter.setBrush(QBrush(color, Qt.SolidPattern))
-                if (x == xrange) and (xrange * tileSize) - width != 0:
-                    tileWidth = (xrange * tileSize) - width
-                else:
-                    tileWidth = tileSize
+    def placeEntity(self, x: float, y: float):
+        levelData = self.parent.getLevelData()
+        levelWidth, levelHeight = levelData.getMapSize(cfg.TILESIZE)
+        if not (0 <= x < levelWidth and 0 <= y < levelHeight):
+            return
+        left, top = self.getNearestTopLeft(x, y)
+        half = cfg.TILESIZE // 2
+        entity = {'name': self.parent.levelMenu.getEntityType(), 'x': int(left) + half, 'y': int(top) + half}
+        before = levelData.getEntities().toList()
+        key = levelData.addEntity(entity)
+        self.updateEntities([key])
+        self.setSelectedEntities({key})
+        self.saveEntityHistory(before)
+
+    def saveEntityHistory(self, before: list):
+        """Add a change to the current level's entities to the undo history.
+        before is the entity list from before the change.
+        """
+        levelData = self.parent.getLevelData()
+        self.parent.history.addEntityEdit(self.parent.shownLevel, before, levelData.getEntities().toList())
 
-                if (y == yrange) and (yrange * tileSize) - height != 0:
-                    tileHeight = (yrange * tileSize) - height
-                else:
-                    tileHeight = tileSize
+    def saveTileHistory(self, layerName, oldTiles, indexes: list):
+        """Add a change to tiles of the current level to the undo history.
+        oldTiles holds the tiles from before the change by index, either a
+        copy of the layer or a dict of the tiles at indexes.
+        """
+        levelData = self.parent.getLevelData()
+        tiles = levelData.getLayerTiles(layerName)
+        indexes = [i for i in sorted(set(indexes)) if oldTiles[i] != tiles[i]]
+        self.parent.history.addTileEdit(self.parent.shownLevel, layerName, indexes,
+            [oldTiles[i] for i in indexes], [tiles[i] for i in indexes])
 
-                # Shifting it one makes it look less jarring. Not sure why the tiles
-                # are off.
-                painter.drawRect(x * tileSize - 1, y * tileSize - 1, tileWidth, tileHeight)
+    def getBoxRect(self, start=None) -> QRectF:
+        """Return the selection box from start (the drag start by default) to the mouse.
+        """
+        if start is None:
+            start = self.entityDrag[1]
+        x1, y1 = start
+        x2, y2 = self.mousePos
+        return QRectF(min(x1, x2), min(y1, y2), abs(x2 - x1), abs(y2 - y1))
+
+    def setSelectedEntities(self, keys: set):
+        changed = self.selectedEntities ^ keys
+        self.selectedEntities = set(keys)
+        self.updateEntities(changed)
+
+    def setHoveredEntity(self, key):
+        if key == self.hoveredEntity:
+            return
+        changed = [k for k in (self.hoveredEntity, key) if k is not None]
+        self.hoveredEntity = key
+        self.updateEntities(changed)
+        name = '' if key is None else ' ' + self.parent.getLevelData().getEntities().get(key)['name'] + ' '
+        self.parent.statusComponents['entity'].setText(name)
+
+    def updateEntities(self, keys):
+        """Repaint the area under the given entities.
+        """
+        if self.entityItem is None:
+            return
+        entities = self.parent.getLevelData().getEntities()
+        for key in keys:
+            x, y, width, height = get_entity_bounds(entities.get(key))
+            self.entityItem.update(QRectF(x - 1, y - 1, width + 2, height + 2))
+
+    def resetEntities(self):
+        """Clear the selection after the level's entities were replaced.
+        """
+        self.selectedEntities.clear()
+        self.hoveredEntity = None
+        self.entityDrag = None
+        if self.entityItem is not None:
+            self.entityItem.update()
 
+    # =====================
+    # SCENE DRAWING METHODS
+    # =====================
+    def drawCheckerGrid(self, painter, rect=None):
+        """Draws a pattern of grey and white squares into the scene.
+        Used to represent transparency in the background. Only the part of
+        the map inside rect is drawn if given.
 
-    def drawGrid(self, painter):
+        Precondition: self.parent.level is not None
+        """
+        width, height = self.getMapSize()
+        area = QRectF(0, 0, width, height)
+        if rect is not None:
+            area &= rect
+
+        if self.checkerBrush is None:
+            tileSize = self.checkerTileSize
+            pattern = QPixmap(tileSize * 2, tileSize * 2)
+            pattern.fill(QColor(cfg.colors['grey lighter']))
+            patternPainter = QPainter(pattern)
+            light = QColor(cfg.colors['grey light']) # Every other square is light grey.
+            patternPainter.fillRect(0, 0, tileSize, tileSize, light)
+            patternPainter.fillRect(tileSize, tileSize, tileSize, tileSize, light)
+            patternPainter.end()
+            self.checkerBrush = QBrush(pattern)
+
+        # Shifting it one makes it look less jarring. Not sure why the tiles
+        # are off.
+        painter.setBrushOrigin(-1, -1)
+        painter.fillRect(area, self.checkerBrush)
+
+    def drawGrid(self, painter, rect: QRectF):
         """Draws a grid by drawing a series of lines into the scene.
+        Only the lines inside rect are drawn.
         Precondition: self.grid is None and self.parent.level is not NOne
         """
+        # Lines would merge into a solid fill this far out.
+        if painter.worldTransform().m11() < 0.25:
+            return
         mapSize = self.getMapSize()
         width, height = mapSize[0], mapSize[1]
 
         painter.setPen(QColor(cfg.colors['cobalt']))
         tileSize = cfg.TILESIZE
 
-        for y in range(round(height / tileSize) + 1):
-            h_line = QLine(0, y * tileSize, width, y * tileSize)
-            painter.drawLine(h_line)
-            for x in range(round(width / tileSize) + 1):
-                v_line = QLine(x * tileSize, 0, x * tileSize, height)
-                painter.drawLine(v_line)
+        top = max(0, int(rect.top()) // tileSize)
+        bottom = min(round(height / tileSize), int(rect.bottom()) // tileSize + 1)
+        left = max(0, int(rect.left()) // tileSize)
+        right = min(round(width / tileSize), int(rect.right()) // tileSize + 1)
+        for y in range(top, bottom + 1):
+            painter.drawLine(QLine(left * tileSize, y * tileSize, right * tileSize, y * tileSize))
+        for x in range(left, right + 1):
+            painter.drawLine(QLine(x * tileSize, top * tileSize, x * tileSize, bottom * tileSize))
+
+    def drawFillPreview(self, painter):
+        """Shades the tiles a fill at the cursor would cover.
+        """
+        layerName = self.parent.activeLayer
+        if not self.canFill(layerName):
+            return
+        width, height = self.parent.getLevelData().getMapSize(cfg.TILESIZE)
+        if not (0 <= self.mousePos[0] < width and 0 <= self.mousePos[1] < height):
+            return
+
+        index = self.getNearestTileIndex(*self.mousePos)
+        regions = self.getFillRegions(layerName, index)
+        label = regions.getLabel(index)
+        if not self.fillPreview or self.fillPreview[0] is not regions or self.fillPreview[1] != label:
+            _, x, y, mask = regions.getRegion(index)
+            color = QColor(cfg.colors['light teal'])
+            color.setAlpha(90)
+            tileSize = cfg.TILESIZE
+            rect = QRectF(x * tileSize, y * tileSize, mask.shape[1] * tileSize, mask.shape[0] * tileSize)
+            self.fillPreview = (regions, label, rect, get_mask_image(mask, color))
+        painter.drawImage(self.fillPreview[2], self.fillPreview[3])
+
+    def setUsageHighlight(self, value: Optional[str]):
+        """Highlight the tiles with a tile id, sprite or type (see
+        tileindex.py) in every level shown, or stop if value is None.
+        """
+        self.usageHighlight = value
+        self.usagePreview = None
+        if value is None:
+            self.parent.statusComponents['usages'].setText('')
+        self.updateScene()
 
-    def drawTileIds(self, painter):
-        """Draws the tile id over the tiles in the level.
+    def drawUsageHighlight(self, painter):
+        """Shades the tiles found by setUsageHighlight(). They're looked up
+        again only after the level changes.
         """
         levelData = self.parent.getLevelData()
-        tileData = levelData.getTileData()
+        key = (self.parent.shownLevel, levelData.getRevision(), self.usageHighlight)
+        if not self.usagePreview or self.usagePreview[0] != key:
+            indexes = levelData.getTileIndex().find(self.usageHighlight)
+            self.parent.statusComponents['usages'].setText(f' {len(indexes)} x {self.usageHighlight} ')
+            if not len(indexes):
+                self.usagePreview = (key, None, None)
+                return
+            xs, ys = indexes % levelData.getWidth(), indexes // levelData.getWidth()
+            x, y = int(xs.min()), int(ys.min())
+            mask = np.zeros((int(ys.max()) + 1 - y, int(xs.max()) + 1 - x), bool)
+            mask[ys - y, xs - x] = True
+            color = QColor(cfg.colors['yellow'])
+            color.setAlpha(110)
+            tileSize = cfg.TILESIZE
+            rect = QRectF(x * tileSize, y * tileSize, mask.shape[1] * tileSize, mask.shape[0] * tileSize)
+            self.usagePreview = (key, rect, get_mask_image(mask, color))
+        if self.usagePreview[1] is not None:
+            painter.drawImage(self.usagePreview[1], self.usagePreview[2])
+
+    def drawTileIds(self, painter, rect: QRectF):
+        """Draws the tile id over the tiles in the level that are inside
+        rect. Tiles are read from the level's TileIndex so no tile ids
+        are split while painting.
+        """
+        levelData = self.parent.getLevelData()
+        tileIndex = levelData.getTileIndex()
+        width, height = levelData.getMapSize(1)
         tileSize = cfg.TILESIZE
+        top = max(0, int(rect.top()) // tileSize)
+        bottom = min(height, int(rect.bottom()) // tileSize + 1)
+        left = max(0, int(rect.left()) // tileSize)
+        right = min(width, int(rect.right()) // tileSize + 1)
 
         tiles = self.parent.toolBar.tileTabMenu.getMenu('Tile Ids').getTiles()
         tile_pixmap = {t.getMetaData()['id']: t.getMetaData()["image"] for t in tiles}
+        pixmaps = [tile_pixmap.get(tile.split('-')[-1]) for tile in tileIndex.getTileIds()]
+        cells = tileIndex.getCells().reshape(height, width)[top:bottom, left:right]
         painter.setOpacity(0.50)
-        for index in range(len(tileData)):
-            id = tileData[index].split('-')[-1]
-            pos = levelData.getTilePos(index, tileSize)
-            painter.drawPixmap(pos[0], pos[1], tile_pixmap[id])
+        for y, row in enumerate(cells.tolist(), top):
+            for x, code in enumerate(row, left):
+                if pixmaps[code] is not None:
+                    painter.drawPixmap(x * tileSize, y * tileSize, pixmaps[code])
         painter.setOpacity(1)
 
     def drawLevel(self):
         """Draws in the tiles of a level. Should only be called once
         everytime the level is updated.
+
+        Each layer is drawn by its own LayerItem so editing one only
+        repaints the tiles that changed on it. Hidden layers aren't
+        rendered until they're shown again.
         """
         levelData = self.parent.getLevelData()
-        tileData = levelData.getTileData()
-        tileSize = cfg.TILESIZE
-        for index in range(len(tileData)):
-            data = [int(n) for n in tileData[index].split('-')[:-1]]
-            id = tileData[index].split('-')[-1]
-            if id != cfg.EMPTY_TILE_ID:
-                slice = QRect(data[0] * tileSize, data[1] * tileSize, tileSize, tileSize)
-                tile = QPixmap(levelData.getSpriteURL()).copy(slice)
-                pos = levelData.getTilePos(index, tileSize)
+        self.spriteAtlas = SpriteAtlas(get_image_pixels(get_sheet_pixmap(levelData.getSpriteURL()).toImage()), cfg.TILESIZE)
+        self.layerItems = {}
+        self.fillRegions = {}
+        self.usagePreview = None
+        for z, layerName in enumerate((None,) + levelData.getLayerNames()):
+            getSprite = lambda tile, layerName=layerName: self.getSprite(tile, layerName)
+            item = LayerItem(levelData.getWidth(), levelData.getHeight(), self.spriteAtlas, getSprite)
+            item.setZValue(z)
+            item.setVisible(layerName not in self.hiddenLayers)
+            self.scene().addItem(item)
+            self.layerItems[layerName] = item
+            self.renderLayer(layerName)
+
+        self.entityItem = EntityItem(self, *levelData.getMapSize(cfg.TILESIZE))
+        self.entityItem.setZValue(len(self.layerItems))
+        self.entityItem.setVisible(self.parent.showEntitiesAct.isChecked())
+        self.scene().addItem(self.entityItem)
+        self.resetEntities()
+
+    def renderLayer(self, layerName, indexes=None):
+        """Pass a layer's tiles to its LayerItem. Only the tiles at indexes
+        are updated if given.
+        """
+        self.updateFillRegions(layerName, indexes)
+        item = self.layerItems[layerName]
+        if layerName in self.hiddenLayers:
+            item.stale = True
+            return
+
+        tiles = self.parent.getLevelData().getLayerTiles(layerName)
+        if indexes is None:
+            item.setTiles(tiles)
+        else:
+            item.updateTiles(tiles, indexes)
+        item.stale = False
+        item.update()
 
-                self.scene().addPixmap(tile).setPos(pos[0], pos[1])
+    def getSprite(self, tile: str, layerName) -> str:
+        """Return the "x-y" sprite of a tile or EMPTY_SPRITE if the tile is
+        empty.
+        """
+        if layerName is not None:
+            return tile
+        sprite, typeId = tile.rsplit('-', 1)
+        return EMPTY_SPRITE if typeId == cfg.EMPTY_TILE_ID else sprite
+
+    def setLayerVisible(self, layerName, visible: bool):
+        if visible:
+            self.hiddenLayers.discard(layerName)
+        else:
+            self.hiddenLayers.add(layerName)
+        item = self.layerItems.get(layerName)
+        if item is not None:
+            item.setVisible(visible)
+            if visible and item.stale:
+                self.renderLayer(layerName)
 
     def redrawLevel(self):
         self.clearScene(True)
         self.drawLevel()
 
+    def takeView(self) -> dict:
+        """Return the level's scene and view settings and switch to an
+        empty scene. See MainWindow.takeView()
+        """
+        view = {
+            'scene': self.scene(),
+            'layerItems': self.layerItems,
+            'entityItem': self.entityItem,
+            'hiddenLayers': self.hiddenLayers,
+            'spriteAtlas': self.spriteAtlas,
+            'selectedEntities': self.selectedEntities,
+            'fillRegions': self.fillRegions,
+            'transform': self.transform(),
+            'scroll': (self.horizontalScrollBar().value(), self.verticalScrollBar().value()),
+            # Layer chunks are most of the memory a view holds.
+            'size': sum(item.getByteSize() for item in self.layerItems.values())
+        }
+        self.setScene(QGraphicsScene())
+        self.layerItems = {}
+        self.entityItem = None
+        self.hiddenLayers = set()
+        self.selectedEntities = set()
+        self.hoveredEntity = None
+        self.entityDrag = None
+        self.fillRegions = {}
+        return view
+
+    def restoreView(self, view: dict):
+        self.setScene(view['scene'])
+        self.layerItems = view['layerItems']
+        self.entityItem = view['entityItem']
+        self.hiddenLayers = view['hiddenLayers']
+        self.spriteAtlas = view['spriteAtlas']
+        self.selectedEntities = view['selectedEntities']
+        self.fillRegions = view['fillRegions']
+        self.entityItem.setVisible(self.parent.showEntitiesAct.isChecked())
+        self.setTransform(view['transform'])
+        self.horizontalScrollBar().setValue(view['scroll'][0])
+        self.verticalScrollBar().setValue(view['scroll'][1])
+
+
+class _SpriteCodes(dict):
+    """tile id: index of the tile's sprite in a SpriteAtlas."""
+    def __init__(self, atlas: SpriteAtlas, getSprite: Callable[[str], str]):
+        super().__init__()
+        self.atlas = atlas
+        self.getSprite = getSprite
+
+    def __missing__(self, tile: str) -> int:
+        code = self[tile] = self.atlas.getIndex(self.getSprite(tile))
+        return code
+
+
+class LayerItem(QGraphicsItem):
+    """The rendering of one tile layer of a level.
+
+    The layer is drawn in square chunks that are rendered from its tiles
+    when they first come into view and dropped when a tile under them
+    changes. Only the most recently drawn chunks are kept, up to
+    cfg.LAYER_CACHE_BUDGET bytes, so the memory a layer takes doesn't
+    grow with the size of the map.
+
+    Zoomed out, chunks come from a pyramid of levels at 1/2, 1/4, 1/8,
+    ... scale (levels 1, 2, 3, ...) so painting doesn't get slower as
+    more of the map is in view. Every chunk is rendered straight from
+    the tiles under it with the sprites shrunk to its level's scale,
+    and once tiles are smaller than a pixel, by averaging the colours of
+    the tiles in each pixel.
+    """
+    CHUNK_SIZE = 256 # Pixels per side of a chunk on every level.
+
+    def __init__(self, width: int, height: int, atlas: SpriteAtlas, getSprite: Callable[[str], str]):
+        """width and height are in tiles. getSprite returns the "x-y" sprite
+        of a tile id or EMPTY_SPRITE.
+        """
+        super().__init__()
+        self.width = width
+        self.height = height
+        self.atlas = atlas
+        self.spriteCodes = _SpriteCodes(atlas, getSprite)
+        self.codes = np.zeros((height, width), np.int32) # Sprite of each tile. See SpriteAtlas.getIndex()
+        self.shrunkSprites = {} # Scale: sprites of the atlas shrunk by it. See _getSprites()
+        self.chunks = {} # (level, column, row): QPixmap or None if empty, least recently drawn first.
+        self.chunkBytes = 0
+        self.stale = False # True if the layer changed while hidden.
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+
+        self.rect = QRectF(0, 0, width * cfg.TILESIZE, height * cfg.TILESIZE)
+        self.pixelLevel = int(math.log2(cfg.TILESIZE)) # Tiles are a pixel wide on this level.
+        self.levelCount = 1 # Levels stop once a chunk covers the whole layer.
+        while self.CHUNK_SIZE << (self.levelCount - 1) < max(width, height) * cfg.TILESIZE:
+            self.levelCount += 1
+
+    def boundingRect(self):
+        return self.rect
+
+    def paint(self, painter, option, widget=None):
+        rect = option.exposedRect
+        if painter.hasClipping():
+            rect &= painter.clipBoundingRect()
+        rect &= self.rect
+        level = self.getLevel(option.levelOfDetailFromTransform(painter.worldTransform()))
+        size = self.CHUNK_SIZE << level
+        for row in range(int(rect.top()) // size, math.ceil(rect.bottom() / size)):
+            for column in range(int(rect.left()) // size, math.ceil(rect.right() / size)):
+                pixmap = self.getChunk(level, column, row)
+                if pixmap is not None:
+                    target = QRectF(column * size, row * size, pixmap.width() << level, pixmap.height() << level)
+                    painter.drawPixmap(target, pixmap, QRectF(pixmap.rect()))
+
+    def getLevel(self, scale: float) -> int:
+        """Return the level to draw at a scale. Levels are never enlarged.
+        """
+        if scale >= 1:
+            return 0
+        return min(int(math.log2(1 / scale)), self.levelCount - 1)
+
+    def getByteSize(self) -> int:
+        return self.chunkBytes + self.codes.nbytes
+
+    def setTiles(self, tiles: List[str]):
+        """Take every tile of the layer from tiles.
+        """
+        if hasattr(tiles, 'getIndexes'): # Binary levels are already coded, see binary.py
+            sprites = np.array([self.spriteCodes[tile] for tile in tiles.getDictionary()], np.int32)
+            codes = sprites[tiles.getIndexes()]
+        else:
+            codes = np.fromiter(map(self.spriteCodes.__getitem__, tiles), np.int32, len(tiles))
+        self.codes = codes.reshape(self.height, self.width)
+        self.chunks = {}
+        self.chunkBytes = 0
+
+    def updateTiles(self, tiles: List[str], indexes: Iterable[int]):
+        """Take the tiles at indexes from tiles and drop the chunks under them.
+        """
+        indexes = np.fromiter(indexes, np.int64)
+        if not len(indexes):
+            return
+        codes = map(self.spriteCodes.__getitem__, map(tiles.__getitem__, indexes.tolist()))
+        self.codes.flat[indexes] = np.fromiter(codes, np.int32, len(indexes))
+
+        # Chunks with a changed tile, on each level.
+        tileCount = self.CHUNK_SIZE // cfg.TILESIZE
+        changed = [np.zeros((-(-self.height // tileCount), -(-self.width // tileCount)), bool)]
+        changed[0][indexes // self.width // tileCount, indexes % self.width // tileCount] = True
+        for _ in range(1, self.levelCount):
+            below = changed[-1]
+            grid = np.zeros((-(-below.shape[0] // 2) * 2, -(-below.shape[1] // 2) * 2), bool)
+            grid[:below.shape[0], :below.shape[1]] = below
+            changed.append(grid.reshape(grid.shape[0] // 2, 2, grid.shape[1] // 2, 2).any(axis=(1, 3)))
+        for key in [key for key in self.chunks if changed[key[0]][key[2], key[1]]]:
+            self._dropChunk(key)
+
+    def getChunk(self, level: int, column: int, row: int) -> Optional[QPixmap]:
+        """Return a chunk, rendering it if it isn't kept. None if it's empty.
+        """
+        key = (level, column, row)
+        if key in self.chunks:
+            pixmap = self.chunks.pop(key)
+        else:
+            pixmap = self._renderChunk(level, column, row)
+            self.chunkBytes += self._getChunkBytes(pixmap)
+            while self.chunks and self.chunkBytes > cfg.LAYER_CACHE_BUDGET:
+                self._dropChunk(next(iter(self.chunks)))
+        self.chunks[key] = pixmap
+        return pixmap
+
+    def _getChunkBytes(self, pixmap: Optional[QPixmap]) -> int:
+        return 0 if pixmap is None else pixmap.width() * pixmap.height() * 4
+
+    def _dropChunk(self, key: tuple):
+        self.chunkBytes -= self._getChunkBytes(self.chunks.pop(key))
+
+    def _getSprites(self, level: int) -> np.ndarray:
+        """Return the sprites of the atlas shrunk to a level's scale, at
+        most to a pixel.
+        """
+        sprites = self.atlas.getArray()
+        scale = 1 << min(level, self.pixelLevel)
+        if scale > 1:
+            shrunk = self.shrunkSprites.get(scale)
+            if shrunk is None or len(shrunk) != len(sprites):
+                shrunk = self.shrunkSprites[scale] = shrink_pixels(sprites, scale)
+            sprites = shrunk
+        return sprites
+
+    def _renderChunk(self, level: int, column: int, row: int) -> Optional[QPixmap]:
+        tileCount = (self.CHUNK_SIZE // cfg.TILESIZE) << level
+        codes = self.codes[row * tileCount:(row + 1) * tileCount, column * tileCount:(column + 1) * tileCount]
+        if not codes.any():
+            return None
+        height, width = codes.shape
+        sprites = self._getSprites(level)
+        if level <= self.pixelLevel:
+            size = sprites.shape[1]
+            pixels = sprites[codes] # (rows, columns, size, size, 4)
+            pixels = np.ascontiguousarray(pixels.transpose(0, 2, 1, 3, 4)).reshape(height * size, width * size, 4)
+        else:
+            # Tiles are smaller than a pixel, each pixel is the average of
+            # the tiles' colours. Done a band of rows at a time to bound the
+            # memory used for the largest levels.
+            colors = sprites.reshape(-1, 4)
+            scale = 1 << (level - self.pixelLevel)
+            band = max(1, (1 << 20) // (width * scale)) * scale
+            pixels = np.concatenate([shrink_pixels(colors[codes[top:top + band]], scale) for top in range(0, height, band)])
+        image = QImage(pixels.data, pixels.shape[1], pixels.shape[0], pixels.shape[1] * 4, QImage.Format_RGBA8888)
+        return QPixmap.fromImage(image)
+
+
+class EntityItem(QGraphicsItem):
+    """Draws a level's entities above its tile layers. Only the entities
+    inside the area being repainted are looked up and drawn.
+    """
+    def __init__(self, mapView: MapView, width: int, height: int):
+        super().__init__()
+        self.mapView = mapView
+        self.rect = QRectF(0, 0, width, height)
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+
+    def boundingRect(self):
+        return self.rect
+
+    def paint(self, painter, option, widget=None):
+        rect = option.exposedRect
+        if painter.hasClipping():
+            rect &= painter.clipBoundingRect()
+        entities = self.mapView.parent.getLevelData().getEntities()
+        # Names are unreadable when zoomed out.
+        drawNames = option.levelOfDetailFromTransform(painter.worldTransform()) >= 1
+        fill = QColor(cfg.colors['teal'])
+        fill.setAlpha(120)
+        painter.setFont(QFont('Arial', 7))
+        for key in entities.query(rect.x(), rect.y(), rect.width(), rect.height()):
+            entity = entities.get(key)
+            bounds = QRectF(*get_entity_bounds(entity))
+            if key in self.mapView.selectedEntities:
+                painter.setPen(QPen(QColor(cfg.colors['yellow']), 2))
+            elif key == self.mapView.hoveredEntity:
+                painter.setPen(QPen(QColor(cfg.colors['light teal']), 2))
+            else:
+                painter.setPen(QColor(cfg.colors['white']))
+            painter.fillRect(bounds, fill)
+            painter.drawRect(bounds)
+            if drawNames:
+                painter.drawText(bounds, Qt.AlignCenter | Qt.TextWrapAnywhere, entity['name'])
+
+
+class LevelViewCache:
+    """An LRU of the rendered views of levels (see MainWindow.takeView())
+    holding at most budget bytes. A view is only handed back if its level
+    hasn't changed since it was stored.
+    """
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.views = {} # Level name: (revision, view, size), least recently used first.
+        self.size = 0
+
+    def store(self, levelName: str, revision: int, view: dict, size: int):
+        self.discard(levelName)
+        self.views[levelName] = (revision, view, size)
+        self.size += size
+        while self.size > self.budget:
+            self.discard(next(iter(self.views)))
+
+    def take(self, levelName: str, revision: int) -> Optional[dict]:
+        """Remove and return the view of a level, or None if there is no
+        view of its current revision.
+        """
+        entry = self.views.pop(levelName, None)
+        if entry is None:
+            return None
+        self.size -= entry[2]
+        if entry[0] != revision:
+            _free_view(entry[1])
+            return None
+        return entry[1]
+
+    def discard(self, levelName: str):
+        entry = self.views.pop(levelName, None)
+        if entry is not None:
+            self.size -= entry[2]
+            _free_view(entry[1])
+
+    def clear(self):
+        for levelName in list(self.views):
+            self.discard(levelName)
+
+
+def _free_view(view: dict):
+    """Delete the scenes of a view now rather than whenever they're collected.
+    """
+    for scene in [view['map']['scene']] + [menu['scene'] for menu in view['menus'].values()]:
+        scene.clear()
+        scene.deleteLater()
+
 
 class ToolBar(QWidget):
     def __init__(self, parent):
@@ -683,17 +1681,19 @@ class ToolBar(QWidget):
         self.buttonGroup.buttonClicked.connect(self.changeCursorMode)
 
         invShortcuts = {name: shortcut for shortcut, name in parent.cursorShortcuts.items()}
-        self.drawBtn = ToolButton(cfg.icons['paint-brush'], 'draw', invShortcuts['draw'])
+        self.drawBtn = ToolButton('paint-brush', 'draw', invShortcuts['draw'])
         self.drawBtn.setChecked(True)
-        self.fillBtn = ToolButton(cfg.icons['fill'], 'fill', invShortcuts['fill'])
-        self.eraseBtn = ToolButton(cfg.icons['eraser'], 'erase', invShortcuts['erase'])
+        self.fillBtn = ToolButton('fill', 'fill', invShortcuts['fill'])
+        self.eraseBtn = ToolButton('eraser', 'erase', invShortcuts['erase'])
+        self.entityBtn = ToolButton('map-marker', 'entity', invShortcuts['entity'])
 
-        self.tileTabMenu = TileTabMenu(self)
+        self.tileTabMenu = None # Built by loadTileMenus() once the window is up.
 
         btns = [
             self.drawBtn,
             self.fillBtn,
             self.eraseBtn,
+            self.entityBtn,
         ]
 
         self.buttons = {} # button reference.
@@ -703,12 +1703,20 @@ class ToolBar(QWidget):
             self.layout.addWidget(b)
 
         # self.layout.addWidget(self.separator)
-        self.layout.addWidget(self.tileTabMenu)
         self.setLayout(self.layout)
 
     def getCheckedButton(self):
         return self.buttonGroup.checkedButton()
 
+    def loadIcons(self):
+        for button in self.buttons.values():
+            button.loadIcon()
+
+    def loadTileMenus(self):
+        if self.tileTabMenu is None:
+            self.tileTabMenu = TileTabMenu(self)
+            self.layout.addWidget(self.tileTabMenu)
+
     def changeCursorMode(self):
         btn = self.getCheckedButton()
         if btn.name in self.allCursorModes:
@@ -716,13 +1724,13 @@ class ToolBar(QWidget):
 
 
 class ToolButton(QPushButton):
-    def __init__(self, iconURL, name, shortcut=None):
+    def __init__(self, iconName, name, shortcut=None):
         super().__init__()
-        self.icon = QIcon(iconURL)
+        self.iconName = iconName
+        self.icon = None # Loaded by loadIcon() once the window is up.
         self.iconSize = QSize(24, 24)
         self.name = name
 
-        self.setIcon(QIcon(iconURL))
         self.setIconSize(self.iconSize)
 
         toolTip = name.title() + ' Tool'
@@ -731,6 +1739,11 @@ class ToolButton(QPushButton):
         self.setToolTip(toolTip)
         self.setCheckable(True)
 
+    def loadIcon(self):
+        if self.icon is None:
+            self.icon = QIcon(cfg.get_icon(self.iconName))
+            self.setIcon(self.icon)
+
 
 class TileTabMenu(QTabWidget):
     """Contains all the tile menus.
@@ -865,6 +1878,12 @@ class TileMenu(CustomView):
     def getTiles(self):
         return self.tiles
 
+    def getByteSize(self) -> int:
+        """Return the bytes of the pixmaps of the loaded tiles, a tile's
+        worth of 32 bit pixels each.
+        """
+        return len(self.tiles) * cfg.TILESIZE * cfg.TILESIZE * 4
+
     def loadTiles(self):
         """Load tiles into the tileMenu. Needs to be implemented
         individually.
@@ -882,6 +1901,32 @@ class TileMenu(CustomView):
         self.clearScene()
         self.selectedTile = None
 
+    def takeView(self) -> dict:
+        """Return the loaded tiles and scene and switch to an empty scene.
+        """
+        view = {
+            'scene': self.scene(),
+            'tiles': self.tiles,
+            'size': (self.width, self.height, self.tileArrayWidth),
+            'selectedTile': self.selectedTile,
+            'scroll': (self.horizontalScrollBar().value(), self.verticalScrollBar().value()),
+            'byteSize': self.getByteSize()
+        }
+        self.setScene(QGraphicsScene())
+        self.tiles = []
+        self.selectedTile = None
+        self.width = self.height = self.tileArrayWidth = 0
+        return view
+
+    def restoreView(self, view: dict):
+        self.setScene(view['scene'])
+        self.tiles = view['tiles']
+        self.width, self.height, self.tileArrayWidth = view['size']
+        self.selectedTile = view['selectedTile']
+        self.tilesLoaded = True
+        self.horizontalScrollBar().setValue(view['scroll'][0])
+        self.verticalScrollBar().setValue(view['scroll'][1])
+
 
 class TileSpriteMenu(TileMenu):
     def loadTiles(self, spriteSheetURL):
@@ -890,7 +1935,7 @@ class TileSpriteMenu(TileMenu):
         and that 32 divides the area of the spriteSheet evenly.
         """
         # Load tileset sprite into scene.
-        spriteSheet = QPixmap(spriteSheetURL)
+        spriteSheet = get_sheet_pixmap(spriteSheetURL)
         print(spriteSheetURL)
         self.scene().addPixmap(spriteSheet)
         # Note that this range only works because the tiles are squares.
@@ -914,9 +1959,14 @@ class TileSpriteMenu(TileMenu):
 
 
 class TileIDMenu(TileMenu):
+    tileImages = {} # tile_id: QPixmap. The images never change so they are shared.
+
     def _createTileImage(self, tile_id: str, bg_color: Optional[str]) -> 'QPixmap':
         """Construct and return a pixmap representing the tile_id
         """
+        if tile_id in self.tileImages:
+            return self.tileImages[tile_id]
+
         width, height = cfg.TILESIZE, cfg.TILESIZE
         image = QPixmap(width, height)
         painter = QPainter(image)
@@ -927,6 +1977,8 @@ class TileIDMenu(TileMenu):
         painter.drawRect(0, 0, width, height)
         painter.setPen(QColor(cfg.colors['yellow']))
         painter.drawText(image.rect(), Qt.AlignCenter, tile_id)
+        painter.end()
+        self.tileImages[tile_id] = image
         return image
 
     def loadTiles(self):
@@ -978,7 +2030,13 @@ class LevelMenuBar(QWidget):
         self.layout = QHBoxLayout()
 
         self.levelSelectBox = LevelSelectBox(self)
+        self.layerSelectBox = LayerSelectBox(self)
+        self.entitySelectBox = QComboBox()
+        self.entitySelectBox.addItems(cfg.ENTITY_TYPES)
+        self.entitySelectBox.setToolTip('Entity placed by the entity tool')
         self.layout.addWidget(self.levelSelectBox)
+        self.layout.addWidget(self.layerSelectBox)
+        self.layout.addWidget(self.entitySelectBox)
         self.setLayout(self.layout)
 
     def enableLevelSelect(self):
@@ -990,6 +2048,15 @@ class LevelMenuBar(QWidget):
     def updateLevelSelect(self, options):
         self.levelSelectBox.updateLevelSelect(options)
 
+    def updateLayerSelect(self, layerNames, activeLayer=None):
+        self.layerSelectBox.updateLayerSelect(layerNames, activeLayer)
+
+    def setLayer(self, layerName):
+        self.parent.setActiveLayer(layerName)
+
+    def getEntityType(self) -> str:
+        return self.entitySelectBox.currentText()
+
     def setLevel(self, levelName):
         """Handle the setting and clearing of levelData.
         """
@@ -1028,6 +2095,30 @@ class LevelSelectBox(QComboBox):
         selected = self.itemText(index)
         self.parent.setLevel(selected)
 
+
+class LayerSelectBox(QComboBox):
+    """Picks the layer being edited. The first item is the base layer.
+    """
+    def __init__(self, parent):
+        super().__init__()
+        self.parent = parent
+        self.updateLayerSelect(())
+        self.setEnabled(False)
+        self.currentIndexChanged.connect(self.setLayer)
+
+    def updateLayerSelect(self, layerNames: Tuple[str], activeLayer=None):
+        self.blockSignals(True)
+        self.clear()
+        self.addItem('Base layer', None)
+        for layerName in layerNames:
+            self.addItem(layerName, layerName)
+        self.setCurrentIndex(max(self.findData(activeLayer), 0))
+        self.setEnabled(True)
+        self.blockSignals(False)
+
+    def setLayer(self, index):
+        self.parent.setLayer(self.itemData(index))
+
 # =========================
 # NEW LEVEL RELATED WIDGETS
 # =========================
@@ -1176,6 +2267,9 @@ class ResizeMapWindow(QDialog):
             newHeight = int(self.heightInput.text())
             anchorPoint = self.anchorMenu.getAnchorPoint()
             level.resizeTileArray(anchorPoint, newWidth, newHeight)
+            # Tile indexes in the history don't match the new size.
+            self.parent.clearHistory()
+            self.parent.recordLevel()
             self.parent.mapView.redrawLevel()
             mapSize = ' {}x{} '.format(newWidth, newHeight)
             self.parent.statusComponents['levelSize'].setText(mapSize)
@@ -1184,6 +2278,54 @@ class ResizeMapWindow(QDialog):
             msg = 'Incorrect input detected. Please ensure dimensions are correct and try again.'
             QMessageBox.information(None, ' ', msg)
 
+class ReplaceTilesWindow(QDialog):
+    """Replaces every use of a tile id, sprite or type with another of the
+    same kind. See LevelData.replaceTiles()
+    """
+    def __init__(self, parent):
+        super().__init__(parent)
+        self.parent = parent
+        self.setWindowTitle('Replace tiles')
+        self.setWindowFlags(self.windowFlags() & ~Qt.WindowContextHelpButtonHint)
+        self.setModal(True)
+
+        self.layout = QFormLayout()
+
+        self.findInput = QLineEdit()
+        self.replaceInput = QLineEdit()
+        self.allLevelsInput = QCheckBox('Every level in the file')
+        self.layout.addRow(QLabel('Tile id (4-4-FL), sprite (4-4) or type (FL)'))
+        self.layout.addRow(QLabel('Find: '), self.findInput)
+        self.layout.addRow(QLabel('Replace with: '), self.replaceInput)
+        self.layout.addRow(self.allLevelsInput)
+
+        self.submitButton = QPushButton('Replace All')
+        self.submitButton.clicked.connect(self.replaceTiles)
+        self.layout.addRow(self.submitButton)
+
+        self.findInput.setText(self.parent.mapView.usageHighlight or self.parent.getSelectedTileValue())
+        self.setLayout(self.layout)
+
+    def replaceTiles(self):
+        value = self.findInput.text().strip()
+        new_value = self.replaceInput.text().strip()
+        if not value or not new_value or get_tile_key(value) != get_tile_key(new_value):
+            msg = 'Find and replace must both be tile ids, sprites or types.'
+            QMessageBox.information(None, ' ', msg)
+            return
+
+        levelData = self.parent.getLevelData()
+        levelNames = None if self.allLevelsInput.isChecked() else [self.parent.shownLevel]
+        replaced = levelData.replaceTiles(value, new_value, levelNames)
+        # Each level is its own step in the undo history.
+        for levelName, (indexes, oldTiles, newTiles) in replaced.items():
+            self.parent.history.addTileEdit(levelName, None, indexes, oldTiles, newTiles)
+        if self.parent.shownLevel in replaced:
+            self.parent.mapView.renderLayer(None, replaced[self.parent.shownLevel][0])
+        count = sum(len(indexes) for indexes, _, _ in replaced.values())
+        QMessageBox.information(None, ' ', f'Replaced {count} tiles in {len(replaced)} levels.')
+        self.close()
+
 class ResizeAnchorMenu(QWidget):
     def __init__(self):
         super().__init__()
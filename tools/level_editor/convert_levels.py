@@ -0,0 +1,33 @@
+# ==============================================================
+# Use this script to convert level files between json and the
+# binary level container (*.lvl, see Code/binary.py).
+#
+# Usage: python convert_levels.py SOURCE DEST
+# The direction is picked from DEST's extension. Converting to
+# json rebakes collision rectangles and navigation fields like a
+# normal save.
+#
+# Scripts can work on a binary file's tiles with numpy directly:
+#   from Code.binary import load_level_binary
+#   tiles = load_level_binary(path)['levels'][name]['tileData']
+#   tiles.getIndexes(), tiles.getDictionary()
+# ==============================================================
+from Code import cfg
+from Code.file import load_level_file, write_level_file
+import os, sys, time
+
+def main():
+    if len(sys.argv) != 3:
+        sys.exit('Usage: python convert_levels.py SOURCE DEST')
+    source, dest = sys.argv[1:]
+    start = time.perf_counter()
+    file = load_level_file(source)
+    if file is None or cfg.LEVEL_KEY not in file:
+        sys.exit(f'{source} is not a level file.')
+    report = write_level_file(dest, file)
+    print(report)
+    print(f'Converted {source} ({os.path.getsize(source)} bytes) to {dest} '
+        f'({os.path.getsize(dest)} bytes) in {time.perf_counter() - start:.2f}s')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,24 @@
+# ==============================================================
+# Use this script to rebuild the data the editor bakes into level
+# files on save (collision rectangles and navigation fields)
+# without opening them.
+#
+# Usage: python export_levels.py [level file ...]
+# Defaults to the game's levels.json.
+# ==============================================================
+from Code import cfg
+from Code.file import load_json, write_level_json
+import os, sys
+
+def main():
+    paths = sys.argv[1:] or [os.path.join(cfg.level_dir, 'levels.json')]
+    for path in paths:
+        file = load_json(path)
+        if file is None or cfg.LEVEL_KEY not in file:
+            sys.exit(f'{path} is not a level file.')
+        report = write_level_json(path, file)
+        print(f'Exported {path}')
+        print(report)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+# ==============================================================
+# Use this script to generate a level of any size with wave
+# function collapse, using hand-made levels as examples of which
+# tiles go next to each other. See Code/wfc.py.
+#
+# Usage: python generate_level.py NAME WIDTH HEIGHT -o FILE
+#        [--seed N] [--example FILE [LEVEL ...]] ...
+# The level is added to FILE (replacing a level with the same
+# name) or FILE is created. Examples default to startingArea in
+# the game's levels.json and the starting area prototype; with
+# no LEVEL every level in the file is used. The same examples
+# and seed always give the same level.
+# ==============================================================
+from Code import cfg
+from Code.file import file_exists, load_level_file, write_level_file
+from Code.wfc import learn_model, generate_level
+import argparse, os, sys, time
+
+DEFAULT_EXAMPLES = [
+    [os.path.join(cfg.level_dir, 'levels.json'), 'startingArea'],
+    [os.path.join(cfg.data_dir, 'starting_area_prototype', 'levels.json')]
+]
+
+def load_examples(examples: list) -> list:
+    levels = []
+    for path, *names in examples:
+        file = load_level_file(path)
+        if file is None or cfg.LEVEL_KEY not in file:
+            sys.exit(f'{path} is not a level file.')
+        for name in names or file[cfg.LEVEL_KEY]:
+            if name not in file[cfg.LEVEL_KEY]:
+                sys.exit(f'{path} has no level named {name}.')
+            levels.append(file[cfg.LEVEL_KEY][name])
+    return levels
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a level with wave function collapse.')
+    parser.add_argument('name', help='name of the new level')
+    parser.add_argument('width', type=int)
+    parser.add_argument('height', type=int)
+    parser.add_argument('-o', '--output', required=True, help='level file to add the level to')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--example', nargs='+', action='append', metavar=('FILE', 'LEVEL'),
+        help='level file (and levels in it) to learn from')
+    args = parser.parse_args()
+
+    try:
+        model = learn_model(load_examples(args.example or DEFAULT_EXAMPLES))
+        start = time.perf_counter()
+        level = generate_level(model, args.name, args.width, args.height, args.seed)
+    except ValueError as e:
+        sys.exit(str(e))
+    print(f'Generated {args.name} ({args.width}x{args.height}, {len(model.tiles)} tiles learned) '
+        f'in {time.perf_counter() - start:.2f}s')
+
+    if file_exists(args.output):
+        file = load_level_file(args.output)
+        if file is None or cfg.LEVEL_KEY not in file:
+            sys.exit(f'{args.output} is not a level file.')
+        file[cfg.LEVEL_KEY][args.name] = level
+        print(write_level_file(args.output, file, {args.name}))
+    else:
+        print(write_level_file(args.output, {cfg.LEVEL_KEY: {args.name: level}}))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# ==============================================================
+# Use this script to compare or merge level files level by level
+# as tile grids instead of as text.
+#
+# Usage:
+#   python level_diff.py diff OLD NEW
+#   python level_diff.py merge BASE OURS THEIRS [-o OUT]
+#
+# merge writes the result to OURS unless -o is given and exits
+# with status 1 if there were conflicts. Conflicting cells keep
+# our tile. This makes it usable as a git merge driver:
+#
+#   git config merge.levels.driver "python tools/level_editor/level_diff.py merge %O %A %B"
+#   echo "src/data/levels.json merge=levels" >> .git/info/attributes
+# ==============================================================
+from Code import cfg
+from Code.diff import diff_files, format_diff, get_unbaked_levels, merge_files
+from Code.file import load_json, write_level_json
+import argparse, sys, time
+
+def load_level_file(path: str) -> dict:
+    file = load_json(path)
+    if file is None or cfg.LEVEL_KEY not in file:
+        sys.exit(f'{path} is not a level file.')
+    return file
+
+def diff(args):
+    start = time.perf_counter()
+    result = diff_files(load_level_file(args.old), load_level_file(args.new))
+    print(format_diff(result))
+    if args.time:
+        print(f'\nCompared in {(time.perf_counter() - start) * 1000:.1f}ms')
+
+def merge(args):
+    start = time.perf_counter()
+    merged, conflicts = merge_files(*map(load_level_file, (args.base, args.ours, args.theirs)))
+    out = args.output or args.ours
+    # Levels taken whole from one side keep their baked data.
+    write_level_json(out, merged, unbaked=get_unbaked_levels(merged))
+    for level_name, level_conflicts in conflicts.items():
+        print(f'{level_name}:')
+        for conflict in level_conflicts:
+            print(f'    {conflict}')
+    print(f'Merged into {out}' + (f' with conflicts in {len(conflicts)} level(s)' if conflicts else ''))
+    if args.time:
+        print(f'Merged in {(time.perf_counter() - start) * 1000:.1f}ms')
+    if conflicts:
+        sys.exit(1)
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare or merge level files.')
+    parser.add_argument('--time', action='store_true', help='print how long it took')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    diff_parser = commands.add_parser('diff', help='list what changed in each level')
+    diff_parser.add_argument('old')
+    diff_parser.add_argument('new')
+    diff_parser.set_defaults(run=diff)
+
+    merge_parser = commands.add_parser('merge', help='three-way merge of level files')
+    merge_parser.add_argument('base')
+    merge_parser.add_argument('ours')
+    merge_parser.add_argument('theirs')
+    merge_parser.add_argument('-o', '--output', help='write here instead of OURS')
+    merge_parser.set_defaults(run=merge)
+
+    args = parser.parse_args()
+    args.run(args)
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,23 @@
+from Code.timing import startup
 from Code import widgets, cfg
 from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QTimer
 import sys
 
 def main():
+    startup.mark('import')
     app = QApplication(sys.argv)
+    startup.mark('create application')
     window = widgets.MainWindow(app)
+    startup.mark('create window')
     window.show()
+    startup.mark('show window')
+    # Offer to recover the edits of a session that crashed.
+    QTimer.singleShot(0, window.offerRecovery)
+
+    if '--startup-times' in sys.argv:
+        # Fires once the first frame is drawn and deferred work is done.
+        QTimer.singleShot(0, lambda: (startup.mark('first frame'), print(startup.report())))
     sys.exit(app.exec_())
 
 if __name__ == '__main__':
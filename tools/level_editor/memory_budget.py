@@ -0,0 +1,212 @@
+# ==============================================================
+# Use this script to check how much memory the editor's level
+# structures take per tile and catch regressions in it.
+#
+# Usage: python memory_budget.py [--sizes N ...] [--edits N]
+# For each size a synthetic NxN level is written to a temporary
+# file, then loaded, drawn and edited in an offscreen editor
+# window while tracemalloc is running. Prints the bytes per tile
+# of each structure and exits with an error if any is over its
+# budget in cfg.MEMORY_BUDGETS or couldn't be measured.
+#
+# tracemalloc only sees python allocations. The pixmaps of the
+# layers don't grow with the level but with what was drawn, so
+# they are measured from their sizes per layer in bytes against
+# cfg.LAYER_CACHE_BUDGET instead.
+# ==============================================================
+import os
+os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+
+from Code import cfg, widgets
+from Code.data import LevelData
+from Code.file import load_level_file
+from PyQt5.QtCore import QRectF
+from PyQt5.QtGui import QImage, QPainter
+from PyQt5.QtWidgets import QApplication
+import argparse, gc, json, random, sys, tempfile, tracemalloc
+
+SPRITE_SHEET = 'outdoors_tileset'
+WARMUP_SIZE = 16
+MIN_EDITS = 100 # Fewer single tile edits are too few to average out the history's allocations.
+
+def write_synthetic_level(filename: str, size: int, seed: int = 0):
+    """Write a level file with one size x size level of random floor and
+    wall tiles.
+    """
+    rng = random.Random(seed)
+    ids = [f'{x}-{y}-{t}' for x in range(16) for y in range(4) for t in ('FL', 'WA')]
+    with open(filename, 'w', encoding='utf-8') as f:
+        f.write('{"%s": {"synthetic": ' % cfg.LEVEL_KEY)
+        f.write(json.dumps({'name': 'synthetic', 'spriteSheet': SPRITE_SHEET, 'width': size, 'height': size})[:-1])
+        f.write(', "tileData": [')
+        for row in range(size):
+            f.write((',' if row else '') + ','.join(f'"{rng.choice(ids)}"' for _ in range(size)))
+        f.write(']}}}')
+
+def get_traced() -> int:
+    gc.collect()
+    return tracemalloc.get_traced_memory()[0]
+
+def draw_level(mapView, size: int):
+    """Draw the shown level, render it whole zoomed out so the chunks of
+    the smaller levels are made too, then a screenful of it at full size.
+    """
+    mapView.drawLevel()
+    fitScale = min(1, 512 / (size * cfg.TILESIZE))
+    for scale, width, height in ((fitScale, 512, 512), (1, 1920, 1080)):
+        image = QImage(width, height, QImage.Format_ARGB32)
+        painter = QPainter(image)
+        mapView.scene().render(painter, QRectF(image.rect()), QRectF(0, 0, width / scale, height / scale))
+        painter.end()
+
+def get_sprite_bytes(mapView) -> int:
+    """Return the bytes of the sprites of the shown level's sheet held
+    by its atlas and layers.
+    """
+    atlas = mapView.spriteAtlas
+    # The sprites other than the empty one are views of the sheet.
+    size = atlas.sheet.nbytes + atlas.sprites[0].nbytes + (0 if atlas.array is None else atlas.array.nbytes)
+    for item in mapView.layerItems.values():
+        size += sum(sprites.nbytes for sprites in item.shrunkSprites.values())
+    return size
+
+def measure_level(window, filename: str, size: int, edits: int) -> dict:
+    """Return the bytes per tile of each structure for a level, and the
+    bytes of pixmaps of its largest layer as 'layer pixmaps'.
+    """
+    tiles = size * size
+    results = {}
+
+    start = get_traced()
+    levelData = LevelData(load_level_file(filename))
+    levelData.getTileData()
+    levelData.getEntities()
+    results['level data'] = (get_traced() - start) / tiles
+
+    window.levelData = levelData
+    window.shownLevel = levelData.currentLevel
+    mapView = window.mapView
+    # The sprites cut from the sheet are bounded by the sheet, not the level,
+    # so they are left out of the scene's bytes per tile. The last level's
+    # layers and sprites are dropped first so they aren't freed while the
+    # scene is measured.
+    mapView.layerItems = {}
+    mapView.spriteAtlas = None
+    start = get_traced()
+    draw_level(mapView, size)
+    results['scene'] = (get_traced() - start - get_sprite_bytes(mapView)) / tiles
+    # The tile codes are python allocations, already counted above.
+    results['layer pixmaps'] = max(item.getByteSize() - item.codes.nbytes for item in mapView.layerItems.values())
+    mapView.clearScene(False)
+
+    # Undo history and journal are measured per changed tile for single
+    # tile edits and for one edit that changes every tile, like filling a
+    # level of one kind of tile, and the worse of the two is kept. Single
+    # edits are measured once the cache of recent edits has filled and
+    # settled, it holds the same number of edits at every size. See
+    # EditHistory
+    rng = random.Random(size)
+    history = window.history
+    history.start(filename)
+    tileData = levelData.getTileData()
+
+    def editTile():
+        index = rng.randrange(tiles)
+        old, new = tileData[index], '0-0-FL' if tileData[index] != '0-0-FL' else '1-0-FL'
+        tileData[index] = new
+        history.addTileEdit(levelData.currentLevel, None, [index], [old], [new])
+
+    for _ in range(4 * cfg.HISTORY_CACHE_SIZE):
+        editTile()
+    start, journalStart = get_traced(), os.path.getsize(history.journalPath)
+    for _ in range(edits):
+        editTile()
+    undo = [(get_traced() - start) / edits]
+    journal = [(os.path.getsize(history.journalPath) - journalStart) / edits]
+
+    newTiles = ['2-2-WA'] * tiles
+    start, journalStart = get_traced(), os.path.getsize(history.journalPath)
+    history.addTileEdit(levelData.currentLevel, None, range(tiles), tileData, newTiles)
+    undo.append((get_traced() - start) / tiles)
+    journal.append((os.path.getsize(history.journalPath) - journalStart) / tiles)
+    levelData.setTileData(newTiles)
+    del tileData, newTiles
+    results['undo'] = max(undo)
+    results['journal'] = max(journal)
+    history.close()
+
+    mapView.clearScene(False)
+    window.levelData = None
+    return results
+
+def measure_palette(window) -> float:
+    """Return the bytes per tile of the tile menus.
+    """
+    tileTabMenu = window.toolBar.tileTabMenu
+    start = get_traced()
+    tileTabMenu.loadTiles(cfg.get_assetURL(cfg.sprite_dir, SPRITE_SHEET, '.png'))
+    count = sum(len(menu.getTiles()) for menu in tileTabMenu.tileMenus.values())
+    size = (get_traced() - start) / count
+    tileTabMenu.clearTiles()
+    return size
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the memory used per tile by the level editor.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[64, 256, 1024, 4096], help='widths of the levels to test')
+    parser.add_argument('--edits', type=int, default=1000, help='single tile edits made to each level')
+    args = parser.parse_args()
+    if args.edits < MIN_EDITS:
+        parser.error(f'--edits must be at least {MIN_EDITS}')
+
+    app = QApplication(sys.argv[:1])
+    window = widgets.MainWindow(app)
+    window.finishStartup()
+    tracemalloc.start()
+    failures = []
+    # Draw a level once so the sheet pixmap, fonts and other caches that
+    # don't grow with the level aren't counted in the first level's scene.
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'warmup.json')
+        write_synthetic_level(filename, WARMUP_SIZE)
+        window.levelData = LevelData(load_level_file(filename))
+        window.shownLevel = window.levelData.currentLevel
+        draw_level(window.mapView, WARMUP_SIZE)
+        window.mapView.clearScene(False)
+        window.levelData = None
+
+    def report(name: str, size: float, label: str):
+        budget = cfg.MEMORY_BUDGETS[name]
+        over = size > budget
+        print(f'  {name:<12} {size:>8.1f} B  budget {budget} B{"  OVER BUDGET" if over else ""}')
+        if over:
+            failures.append(f'{label}: {name} at {size:.1f} B/tile is over its budget of {budget} B')
+
+    def reportLayer(size: int, label: str):
+        budget = cfg.LAYER_CACHE_BUDGET
+        over = size > budget
+        print(f'  {"layer pixmaps":<12} {size:>8} B  budget {budget} B per layer{"  OVER BUDGET" if over else ""}')
+        if over:
+            failures.append(f'{label}: a layer has {size} B of pixmaps, over its budget of {budget} B')
+
+    print('palette (per tile menu tile)')
+    report('palette', measure_palette(window), 'tile menus')
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            filename = os.path.join(directory, f'{size}.json')
+            write_synthetic_level(filename, size)
+            print(f'{size}x{size} level (per tile, per changed tile for undo and journal)')
+            results = measure_level(window, filename, size, args.edits)
+            os.remove(filename)
+            reportLayer(results.pop('layer pixmaps'), f'{size}x{size} level')
+            for name, result in results.items():
+                report(name, result, f'{size}x{size} level')
+            # Every structure must be measured at every size asked for, a
+            # missing one would pass unnoticed.
+            for name in cfg.MEMORY_BUDGETS.keys() - results.keys() - {'palette'}:
+                failures.append(f'{size}x{size} level: {name} was not measured')
+
+    if failures:
+        sys.exit('\n'.join(failures))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+# ==============================================================
+# Use this script to render levels to full resolution PNG images
+# (e.g. for design reviews or the wiki).
+#
+# Usage: python render_levels.py LEVEL_FILE [LEVEL ...] [-o DIR]
+#        [--scale N] [--band-rows N]
+# Renders every level in LEVEL_FILE unless some are named. Images
+# are written to DIR/<level name>.png. --scale shrinks them by an
+# integer factor of the tile size.
+#
+# Levels are rendered in bands and streamed into the PNG encoder so
+# maps of any size can be rendered. See Code/render.py.
+# ==============================================================
+from Code import cfg
+from Code.file import load_level_file
+from Code.render import render_level_png
+import argparse, os, sys, time
+
+def main():
+    parser = argparse.ArgumentParser(description='Render levels to PNG images.')
+    parser.add_argument('file', help='level file (.json or .lvl)')
+    parser.add_argument('levels', nargs='*', help='levels to render (default: all)')
+    parser.add_argument('-o', '--output', default='.', help='directory to write the images to')
+    parser.add_argument('--scale', type=int, default=1, help=f'shrink by this factor of the tile size ({cfg.TILESIZE})')
+    parser.add_argument('--band-rows', type=int, default=4, help='rows of tiles rendered at once')
+    args = parser.parse_args()
+
+    file = load_level_file(args.file)
+    if file is None or cfg.LEVEL_KEY not in file:
+        sys.exit(f'{args.file} is not a level file.')
+    levels = file[cfg.LEVEL_KEY]
+    for level_name in args.levels:
+        if level_name not in levels:
+            sys.exit(f'{args.file} has no level named {level_name}.')
+
+    os.makedirs(args.output, exist_ok=True)
+    failed = 0
+    for level_name in args.levels or levels:
+        start = time.perf_counter()
+        path = os.path.join(args.output, level_name + '.png')
+        try:
+            width, height = render_level_png(levels[level_name], path, scale=args.scale, band_rows=args.band_rows)
+        except (ValueError, FileNotFoundError) as e:
+            print(f'{level_name}: {e}', file=sys.stderr)
+            failed += 1
+            continue
+        print(f'{level_name}: {width}x{height} -> {path} ({time.perf_counter() - start:.2f}s)')
+    if failed:
+        sys.exit(f'{failed} level(s) could not be rendered.')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+
+# ==============================================================
+# Use this script to pack the spritesheets listed in image.json
+# into a few large texture atlases.
+#
+# image.json is rewritten so every packed sheet points at its
+# atlas and records where it sits in it (offsetX / offsetY). The
+# original file name is kept as "source" so the script can be run
+# again after sheets are added or changed. Pass --unpack to point
+# every sheet back at its original file.
+#
+# Only fixedSize sheets are packed. variableSize sheets (i.e. the
+# gui sheet) are addressed with raw pixel coordinates in several
+# places and are left as they are.
+#
+# Requires PyQt5 (the level editor already depends on it).
+# ==============================================================
+import os, sys, json, argparse
+
+from PyQt5.QtGui import QImage, QPainter
+from PyQt5.QtCore import Qt
+
+import game_assets
+
+ATLAS_DIR = 'atlas' # Relative to src/img.
+ATLAS_NAME = 'atlas{}.png'
+
+class Skyline:
+    """Bottom-left skyline bin packer for a single atlas.
+    """
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.segments = [[0, 0, width]] # [x, y, width] sorted by x.
+
+    def _fit(self, index: int, width: int, height: int):
+        """Return the lowest y a width x height rect fits at when its
+        left edge is at segment index, or None if it does not fit.
+        """
+        x = self.segments[index][0]
+        if x + width > self.width:
+            return None
+        y = 0
+        remaining = width
+        while remaining > 0:
+            y = max(y, self.segments[index][1])
+            if y + height > self.height:
+                return None
+            remaining -= self.segments[index][2]
+            index += 1
+        return y
+
+    def insert(self, width: int, height: int):
+        """Place a rect and return its (x, y) or None if the atlas is full.
+        """
+        best = None
+        for index in range(len(self.segments)):
+            y = self._fit(index, width, height)
+            if y is None:
+                continue
+            x = self.segments[index][0]
+            if best is None or (y + height, x) < (best[1] + height, best[0]):
+                best = (x, y, index)
+
+        if best is None:
+            return None
+        x, y, index = best
+        self._place(x, y, width, height, index)
+        return x, y
+
+    def _place(self, x: int, y: int, width: int, height: int, index: int):
+        self.segments.insert(index, [x, y + height, width])
+        right = x + width
+        i = index + 1
+        while i < len(self.segments) and self.segments[i][0] < right:
+            sx, sy, sw = self.segments[i]
+            overlap = right - sx
+            if sw <= overlap:
+                del self.segments[i]
+            else:
+                self.segments[i] = [sx + overlap, sy, sw - overlap]
+                break
+
+        # Merge neighbouring segments at the same height.
+        i = 0
+        while i < len(self.segments) - 1:
+            if self.segments[i][1] == self.segments[i + 1][1]:
+                self.segments[i][2] += self.segments[i + 1][2]
+                del self.segments[i + 1]
+            else:
+                i += 1
+
+
+def get_source(image: dict) -> str:
+    return image.get('source', image['name'])
+
+def is_packable(image: dict) -> bool:
+    return image.get('type', 'fixedSize') == 'fixedSize'
+
+def pack(sheets: dict, max_size: int, padding: int) -> list:
+    """Pack sheets ({id: (width, height)}) into as few atlases as needed.
+    Return a list of atlases, each a dict of {id: (x, y)}.
+    """
+    order = sorted(sheets, key=lambda i: (sheets[i][1], sheets[i][0]), reverse=True)
+    atlases = []
+    bins = []
+    for image_id in order:
+        width, height = sheets[image_id]
+        if width > max_size or height > max_size:
+            sys.exit(f'{image_id} ({width}x{height}) does not fit in a {max_size}x{max_size} atlas.')
+
+        for atlas, skyline in zip(atlases, bins):
+            pos = skyline.insert(width + padding, height + padding)
+            if pos:
+                atlas[image_id] = pos
+                break
+        else:
+            skyline = Skyline(max_size, max_size)
+            atlases.append({image_id: skyline.insert(width + padding, height + padding)})
+            bins.append(skyline)
+    return atlases
+
+def write_atlas(path: str, placements: dict, images: dict, sheets: dict) -> tuple:
+    """Render one atlas to path. Return its (width, height).
+    """
+    width = max(placements[i][0] + sheets[i][0] for i in placements)
+    height = max(placements[i][1] + sheets[i][1] for i in placements)
+
+    atlas = QImage(width, height, QImage.Format_ARGB32)
+    atlas.fill(Qt.transparent)
+    painter = QPainter(atlas)
+    painter.setCompositionMode(QPainter.CompositionMode_Source) # Copy pixels exactly.
+    for image_id, (x, y) in placements.items():
+        painter.drawImage(x, y, images[image_id])
+    painter.end()
+
+    if not atlas.save(path, 'PNG'):
+        sys.exit(f'Could not write {path}')
+    return width, height
+
+def unpack(image_data: dict) -> dict:
+    for image in image_data.values():
+        if 'source' in image:
+            image['name'] = image.pop('source')
+        image.pop('offsetX', None)
+        image.pop('offsetY', None)
+    return image_data
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack the spritesheets in image.json into texture atlases.')
+    parser.add_argument('--max-size', type=int, default=1024, help='maximum atlas width and height in pixels')
+    parser.add_argument('--padding', type=int, default=2, help='transparent pixels between sheets')
+    parser.add_argument('--dry-run', action='store_true', help='print the report without writing anything')
+    parser.add_argument('--unpack', action='store_true', help='point image.json back at the original sheets')
+    args = parser.parse_args()
+
+    root = game_assets.src_dir
+    img_dir = os.path.join(root, game_assets.IMG_LOCATION)
+    json_path = os.path.join(root, game_assets.DATA_LOCATION, 'image.json')
+    with open(json_path, 'r') as f:
+        file = json.load(f)
+    image_data = file['images']
+
+    if args.unpack:
+        unpack(image_data)
+        with open(json_path, 'w') as f:
+            json.dump(file, f, indent=2)
+        print(f'Restored {json_path}')
+        return
+
+    images = {}
+    sheets = {}
+    for image_id, image in image_data.items():
+        if not is_packable(image):
+            continue
+        qimage = QImage(os.path.join(img_dir, get_source(image)))
+        if qimage.isNull():
+            sys.exit(f'Could not load {get_source(image)} for {image_id}.')
+        if (qimage.width(), qimage.height()) != (image['width'], image['height']):
+            print(f'Warning: {image_id} is {qimage.width()}x{qimage.height()} but image.json '
+                f'says {image["width"]}x{image["height"]}. Using the real size.')
+        images[image_id] = qimage
+        sheets[image_id] = (qimage.width(), qimage.height())
+
+    atlases = pack(sheets, args.max_size, args.padding)
+
+    sources_before = {get_source(i) for i in image_data.values()}
+    unpacked = {get_source(i) for i in image_data.values() if not is_packable(i)}
+    sheet_area = sum(w * h for w, h in sheets.values())
+    atlas_area = 0
+
+    atlas_dir = os.path.join(img_dir, ATLAS_DIR)
+    if not args.dry_run:
+        os.makedirs(atlas_dir, exist_ok=True)
+        for filename in os.listdir(atlas_dir):
+            if filename.startswith('atlas') and filename.endswith('.png'):
+                os.remove(os.path.join(atlas_dir, filename))
+
+    for n, placements in enumerate(atlases):
+        name = ATLAS_DIR + '/' + ATLAS_NAME.format(n)
+        if args.dry_run:
+            width = max(placements[i][0] + sheets[i][0] for i in placements)
+            height = max(placements[i][1] + sheets[i][1] for i in placements)
+        else:
+            width, height = write_atlas(os.path.join(img_dir, name), placements, images, sheets)
+        atlas_area += width * height
+        print(f'{name}: {width}x{height}, {len(placements)} sheets')
+
+        for image_id, (x, y) in placements.items():
+            image = image_data[image_id]
+            image['source'] = get_source(image)
+            image['name'] = name
+            image['offsetX'] = x
+            image['offsetY'] = y
+            image['width'], image['height'] = sheets[image_id]
+
+    if not args.dry_run:
+        with open(json_path, 'w') as f:
+            json.dump(file, f, indent=2)
+        print(f'Rewrote {json_path}')
+
+    textures_after = len(atlases) + len(unpacked)
+    efficiency = (sheet_area / atlas_area * 100) if atlas_area else 0
+    print(f'\nPacking efficiency: {efficiency:.1f}% ({sheet_area} of {atlas_area} pixels used)')
+    print(f'Textures: {len(sources_before)} -> {textures_after}')
+
+if __name__ == '__main__':
+    main()
@@ -5,38 +5,431 @@
 #
 # Optionally accepts a port as an argument. If no additional
 # arguments are passed it will just default to 8000.
+#
+# Text assets are sent gzip compressed to browsers that accept it.
+# Run compress_assets.py beforehand to serve prebuilt .gz copies,
+# otherwise files are compressed on the fly and kept in memory.
+#
+# Other files honour Range requests so audio can be streamed and
+# seeked. Large files are handed to the kernel with os.sendfile.
+#
+# Every request is timed. Open /__metrics.html for a waterfall of
+# each page load and latency histograms, or /__metrics for the same
+# data as json. Requesting / (or index.html) starts a new page load.
 # ==============================================================
-import subprocess, os, sys, socket
+import os, sys, io, threading, functools, re, time, json, html
+from collections import deque
+import http.server
+from email.utils import formatdate, parsedate_to_datetime
 
-def main():
-    repo_dir = os.path.abspath(os.path.join(os.path.dirname( __file__ ), '..', 'src'))
-    errors = []
+from compress_assets import is_compressible, gzip_path, compress_bytes
+from build_bundle import bundle_path, bundle_is_stale
+import game_assets
+
+repo_dir = os.path.abspath(os.path.join(os.path.dirname( __file__ ), '..', 'src'))
+
+# Files at least this large are sent with os.sendfile where available.
+SENDFILE_THRESHOLD = 64 * 1024
+COPY_CHUNK_SIZE = 64 * 1024
+
+METRICS_URL = '/__metrics'
+METRICS_HTML_URL = '/__metrics.html'
+PAGE_URLS = ('/', '/index.html')
+# Upper bounds (in ms) of the latency histogram buckets. The last bucket is unbounded.
+HISTOGRAM_BOUNDS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+MAX_PAGE_LOADS = 20
+
+# Generated data files: url: (staleness check, script that rebuilds it).
+COMPILED_FILES = {
+    game_assets.compiled_animations_url(): (game_assets.compiled_animations_stale, 'compile_animations.py'),
+    game_assets.compiled_menus_url(): (game_assets.compiled_menus_stale, 'compile_menus.py')
+}
+
+def accepts_gzip(header: str) -> bool:
+    """Return True if an Accept-Encoding header value allows gzip. An
+    explicit gzip entry wins over "*", which only counts without one.
+    """
+    if not header:
+        return False
+    qualities = {} # coding: q value
+    for coding in header.split(','):
+        name, _, params = coding.strip().partition(';')
+        name = name.strip().lower()
+        if name not in ('gzip', '*') or name in qualities:
+            continue
+        params = params.replace(' ', '')
+        try:
+            qualities[name] = float(params[2:]) if params.startswith('q=') else 1.0
+        except ValueError:
+            qualities[name] = 0.0
+    return qualities.get('gzip', qualities.get('*', 0.0)) > 0
+
+def parse_range(header: str, size: int):
+    """Parse a Range header for a file of the given size.
+
+    Return (start, length) for a single satisfiable byte range, False if
+    the range can not be satisfied and None if the header should be
+    ignored (missing, malformed or asking for several ranges).
+    """
+    if not header:
+        return None
+    match = re.fullmatch(r'\s*bytes\s*=\s*(\d*)\s*-\s*(\d*)\s*', header)
+    if match is None:
+        return None
+    first, last = match.groups()
+    if first == '' and last == '':
+        return None
+    if first == '': # Suffix range i.e. the last n bytes.
+        length = min(int(last), size)
+        return (size - length, length) if length > 0 else False
+    start = int(first)
+    end = min(int(last), size - 1) if last != '' else size - 1
+    if start >= size or end < start:
+        return False
+    return (start, end - start + 1)
+
+
+class GzipCache:
+    """Compressed file contents kept in memory. Entries are dropped
+    once the source file changes.
+    """
+    def __init__(self):
+        self.entries = {} # path: (mtime, size, compressed bytes)
+        self.lock = threading.Lock()
+
+    def get(self, path: str, stat: os.stat_result) -> tuple:
+        """Return (compressed bytes, True if they were already cached).
+        """
+        with self.lock:
+            entry = self.entries.get(path)
+        if entry and entry[0] == stat.st_mtime and entry[1] == stat.st_size:
+            return entry[2], True
+
+        with open(path, 'rb') as f:
+            data = compress_bytes(f.read())
+        with self.lock:
+            self.entries[path] = (stat.st_mtime, stat.st_size, data)
+        return data, False
+
+
+class MetricsRecorder:
+    """Timing, size, status and cache result of every request, grouped
+    into page loads per client.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pageLoads = deque(maxlen=MAX_PAGE_LOADS)
+        self.current = {} # client: the page load its requests belong to.
+        self.histograms = {} # extension: bucket counts.
+
+    def _newHistogram(self) -> list:
+        return [0] * (len(HISTOGRAM_BOUNDS) + 1)
+
+    def _bucket(self, duration: float) -> int:
+        for i, bound in enumerate(HISTOGRAM_BOUNDS):
+            if duration <= bound:
+                return i
+        return len(HISTOGRAM_BOUNDS)
+
+    def record(self, client: str, path: str, start: float, duration: float,
+        status: int, size: int, cache: str):
+        """Add a request. start is a time.time() timestamp and duration is in ms.
+        """
+        url = path.split('?', 1)[0]
+        extension = os.path.splitext(url)[1] or url
+        with self.lock:
+            page = self.current.get(client)
+            if page is None or url in PAGE_URLS:
+                page = {'client': client, 'start': start, 'requests': []}
+                self.current[client] = page
+                self.pageLoads.append(page)
+
+            page['requests'].append({
+                'path': path,
+                'start': round((start - page['start']) * 1000, 2),
+                'duration': round(duration, 2),
+                'status': status,
+                'bytes': size,
+                'cache': cache
+            })
+            bucket = self._bucket(duration)
+            for key in ('all', extension):
+                self.histograms.setdefault(key, self._newHistogram())[bucket] += 1
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            pageLoads = []
+            for page in self.pageLoads:
+                requests = list(page['requests'])
+                pageLoads.append({
+                    'client': page['client'],
+                    'start': formatdate(page['start'], usegmt=True),
+                    'duration': max((r['start'] + r['duration'] for r in requests), default=0),
+                    'bytes': sum(r['bytes'] for r in requests),
+                    'requests': requests
+                })
+            histograms = {key: list(counts) for key, counts in self.histograms.items()}
+        return {
+            'histogramBounds': list(HISTOGRAM_BOUNDS),
+            'histograms': histograms,
+            'pageLoads': pageLoads
+        }
+
+    def toHTML(self) -> str:
+        data = self.snapshot()
+        labels = [f'<={b}ms' for b in HISTOGRAM_BOUNDS] + [f'>{HISTOGRAM_BOUNDS[-1]}ms']
+        out = ['<!DOCTYPE html><html><head><meta charset="utf-8"><title>Dev server metrics</title>',
+            '<style>body{font-family:monospace}td,th{padding:1px 6px;text-align:right}'
+            '.bar{position:relative;width:400px;height:10px;background:#eee}'
+            '.bar div{position:absolute;height:10px;background:#4a7}</style></head><body>',
+            '<h2>Latency histograms</h2><table><tr><th>type</th>']
+        out += [f'<th>{html.escape(l)}</th>' for l in labels]
+        out.append('</tr>')
+        for key, counts in sorted(data['histograms'].items()):
+            out.append(f'<tr><td>{html.escape(key)}</td>' + ''.join(f'<td>{c}</td>' for c in counts) + '</tr>')
+        out.append('</table>')
+
+        for page in reversed(data['pageLoads']):
+            total = page['duration'] or 1
+            out.append(f'<h2>Page load from {html.escape(page["client"])} at {page["start"]}: '
+                f'{len(page["requests"])} requests, {page["bytes"]} bytes, {page["duration"]:.1f}ms</h2>')
+            out.append('<table><tr><th>path</th><th>status</th><th>bytes</th><th>cache</th>'
+                '<th>start</th><th>ms</th><th></th></tr>')
+            for r in page['requests']:
+                left = r['start'] / total * 100
+                width = max(r['duration'] / total * 100, 0.5)
+                out.append(f'<tr><td style="text-align:left">{html.escape(r["path"])}</td>'
+                    f'<td>{r["status"]}</td><td>{r["bytes"]}</td><td>{r["cache"] or ""}</td>'
+                    f'<td>{r["start"]:.1f}</td><td>{r["duration"]:.1f}</td>'
+                    f'<td><div class="bar"><div style="left:{left:.2f}%;width:{width:.2f}%"></div></div></td></tr>')
+            out.append('</table>')
+        out.append('</body></html>')
+        return ''.join(out)
+
+
+class DevRequestHandler(http.server.SimpleHTTPRequestHandler):
+    gzipCache = GzipCache()
+    metrics = MetricsRecorder()
+
+    byteRange = None # (start, length) of the file object returned by send_head.
+    # Per request values for the metrics recorder.
+    responseStatus = None
+    bytesSent = 0
+    # "hit" for precompressed or in-memory gzip copies, "miss" when compressed
+    # on the fly and "not-modified" for 304 responses.
+    cacheResult = None
+
+    def do_GET(self):
+        if self.path.split('?', 1)[0] in (METRICS_URL, METRICS_HTML_URL):
+            return self.sendMetrics()
+        self._timeRequest(super().do_GET)
 
+    def do_HEAD(self):
+        if self.path.split('?', 1)[0] in (METRICS_URL, METRICS_HTML_URL):
+            return self.sendMetrics()
+        self._timeRequest(super().do_HEAD)
+
+    def send_response(self, code, message=None):
+        self.responseStatus = code
+        super().send_response(code, message)
+
+    def _timeRequest(self, method):
+        self.responseStatus = None
+        self.bytesSent = 0
+        self.cacheResult = None
+        start = time.time()
+        startCounter = time.perf_counter()
+        try:
+            method()
+        finally:
+            duration = (time.perf_counter() - startCounter) * 1000
+            self.metrics.record(self.client_address[0], self.path, start, duration,
+                self.responseStatus, self.bytesSent, self.cacheResult)
+
+    def sendMetrics(self):
+        if self.path.split('?', 1)[0] == METRICS_HTML_URL:
+            body = self.metrics.toHTML().encode('utf-8')
+            contentType = 'text/html; charset=utf-8'
+        else:
+            body = json.dumps(self.metrics.snapshot(), indent=2).encode('utf-8')
+            contentType = 'application/json'
+        self.send_response(200)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def send_head(self):
+        self.byteRange = None
+        path = self.translate_path(self.path)
+        if os.path.isdir(path) and self.path.split('?', 1)[0].endswith('/'):
+            path = os.path.join(path, 'index.html')
+        if not os.path.isfile(path):
+            return super().send_head()
+
+        if path == bundle_path(self.directory) and bundle_is_stale(path, self.directory):
+            # The engine falls back to fetching the data files one by one.
+            self.log_message('%s is out of date. Run build_bundle.py to rebuild it.', self.path)
+            self.send_error(404, 'Asset bundle is out of date')
+            return None
+
+        for url, (is_stale, script) in COMPILED_FILES.items():
+            if path == os.path.join(self.directory, url) and is_stale(self.directory):
+                # The engine falls back to the files it was compiled from.
+                self.log_message('%s is out of date. Run %s to rebuild it.', self.path, script)
+                self.send_error(404, 'Compiled file is out of date')
+                return None
+
+        if is_compressible(path):
+            self.varyOnEncoding = True
+            if accepts_gzip(self.headers.get('Accept-Encoding')):
+                return self.send_gzip_head(path)
+        return self.send_file_head(path)
+
+    def copyfile(self, source, outputfile):
+        """Copy the part of source selected by send_head to outputfile.
+        """
+        start, length = self.byteRange if self.byteRange else (0, None)
+        self.byteRange = None
+        try:
+            fd = source.fileno()
+        except (AttributeError, io.UnsupportedOperation):
+            fd = None
+
+        if length is None:
+            source.seek(0, os.SEEK_END)
+            length = source.tell() - start
+
+        try:
+            if fd is not None and length >= SENDFILE_THRESHOLD and hasattr(os, 'sendfile'):
+                self.bytesSent = self._sendfile(fd, outputfile, start, length)
+            else:
+                self.bytesSent = self._copyRange(source, outputfile, start, length)
+        except (ConnectionResetError, BrokenPipeError):
+            pass # The browser stopped reading. Common when media is seeked.
+
+    def end_headers(self):
+        if getattr(self, 'varyOnEncoding', False):
+            self.send_header('Vary', 'Accept-Encoding')
+            self.varyOnEncoding = False
+        super().end_headers()
+
+    def _sendfile(self, fd: int, outputfile, offset: int, count: int) -> int:
+        outputfile.flush()
+        out_fd = self.connection.fileno()
+        total = 0
+        while count > 0:
+            sent = os.sendfile(out_fd, fd, offset, count)
+            if sent == 0:
+                break
+            offset += sent
+            count -= sent
+            total += sent
+        return total
+
+    def _copyRange(self, source, outputfile, start: int, length: int) -> int:
+        source.seek(start)
+        total = 0
+        while length > 0:
+            chunk = source.read(min(COPY_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            outputfile.write(chunk)
+            length -= len(chunk)
+            total += len(chunk)
+        return total
+
+    def _notModified(self, stat: os.stat_result) -> bool:
+        header = self.headers.get('If-Modified-Since')
+        if not header or 'If-None-Match' in self.headers:
+            return False
+        try:
+            since = parsedate_to_datetime(header).timestamp()
+        except (TypeError, ValueError, IndexError, OverflowError):
+            return False
+        return int(stat.st_mtime) <= since
+
+    def send_file_head(self, path: str):
+        """Send the headers for path, honouring a single byte Range, and
+        return the opened file. Returns None when no body should follow.
+        """
+        f = open(path, 'rb')
+        stat = os.fstat(f.fileno())
+        size = stat.st_size
+        byteRange = parse_range(self.headers.get('Range'), size)
+
+        if byteRange is None and self._notModified(stat):
+            f.close()
+            self.cacheResult = 'not-modified'
+            self.send_response(304)
+            self.end_headers()
+            return None
+
+        if byteRange is False:
+            f.close()
+            self.send_response(416)
+            self.send_header('Content-Range', f'bytes */{size}')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return None
+
+        if byteRange:
+            start, length = byteRange
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{start + length - 1}/{size}')
+        else:
+            start, length = 0, size
+            self.send_response(200)
+
+        self.byteRange = (start, length)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Length', str(length))
+        self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('Last-Modified', formatdate(stat.st_mtime, usegmt=True))
+        self.end_headers()
+        return f
+
+    def send_gzip_head(self, path: str):
+        """Send the headers for the gzip variant of path and return a file
+        object with the compressed contents.
+        """
+        stat = os.stat(path)
+        precompressed = gzip_path(path)
+        if os.path.isfile(precompressed) and os.path.getmtime(precompressed) >= stat.st_mtime:
+            f = open(precompressed, 'rb')
+            length = os.fstat(f.fileno()).st_size
+            self.cacheResult = 'hit'
+        else:
+            data, cached = self.gzipCache.get(path, stat)
+            f = io.BytesIO(data)
+            length = len(data)
+            self.cacheResult = 'hit' if cached else 'miss'
+
+        self.send_response(200)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Encoding', 'gzip')
+        self.send_header('Content-Length', str(length))
+        self.send_header('Last-Modified', formatdate(stat.st_mtime, usegmt=True))
+        self.varyOnEncoding = True
+        self.end_headers()
+        return f
+
+
+def main():
     if len(sys.argv) > 1 and sys.argv[1].isdigit():
-        port = sys.argv[1]
+        port = int(sys.argv[1])
     else:
-        port = '8000'
-
-    args = ['python', '-m', 'http.server', '-d', repo_dir, port]
+        port = 8000
 
+    handler = functools.partial(DevRequestHandler, directory=repo_dir)
     print(f'Starting local server at port {port}...')
-    try:
-        subprocess.run(args)
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        sock.connect_ex(('127.0.0.1',port))
-    except Exception as e:
-        errors.append(e)
-        print('Failed to start server with python. Trying python3...')
-        args[0] = 'python3'
+    with http.server.ThreadingHTTPServer(('', port), handler) as server:
         try:
-            subprocess.run(args)
-            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            sock.connect_ex(('127.0.0.1',port))
-        except Exception as e:
-            errors.append(e)
-            print('Failed to start with python3. Printing error messages...')
-            for e in errors:
-                print(e, '\n')
+            server.serve_forever()
+        except KeyboardInterrupt:
+            print('\nStopping local server.')
 
 if __name__ == '__main__':
     main()